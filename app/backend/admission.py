@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import random
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+
+logger = logging.getLogger("coffee-chat")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after_ms: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_ms = retry_after_ms
+
+
+@dataclass(frozen=True)
+class AdmissionTicket:
+    store: str
+    client_ip: str
+
+
+@dataclass
+class _Waiter:
+    ticket: AdmissionTicket
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class AdmissionController:
+    """Concurrency limits for new realtime sessions per worker, per store and per client IP.
+
+    Sessions over the worker or store limit wait in a short queue. Freed slots go round-robin across
+    the stores that have waiters, so one busy location cannot take every slot that opens up. Clients
+    over their IP limit, or that find the queue full or wait too long, are rejected with a jittered
+    retry hint. A limit of 0 disables that limit.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 100,
+        max_sessions_per_store: int = 20,
+        max_sessions_per_ip: int = 10,
+        max_queue: int = 20,
+        queue_timeout: float = 3.0,
+        retry_after_ms: int = 2000,
+    ):
+        self.max_sessions = max_sessions
+        self.max_sessions_per_store = max_sessions_per_store
+        self.max_sessions_per_ip = max_sessions_per_ip
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after_ms = retry_after_ms
+        self.active = 0
+        self._per_store: Counter[str] = Counter()
+        self._per_ip: Counter[str] = Counter()
+        self._waiting: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        self.rejections: Counter[str] = Counter()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def _retry_hint(self) -> int:
+        # Jitter so rejected clients do not come back in lockstep.
+        return int(self.retry_after_ms * random.uniform(0.5, 1.5))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejections[reason] += 1
+        logger.info("Rejecting realtime session (%s): %d active, %d queued", reason, self.active, self.queued)
+        return AdmissionRejected(reason, self._retry_hint())
+
+    def _has_capacity(self, store: str) -> bool:
+        return (not self.max_sessions or self.active < self.max_sessions) and \
+            (not self.max_sessions_per_store or self._per_store[store] < self.max_sessions_per_store)
+
+    def _admit(self, ticket: AdmissionTicket) -> None:
+        self.active += 1
+        self._per_store[ticket.store] += 1
+        self._per_ip[ticket.client_ip] += 1
+
+    async def acquire(self, store: str, client_ip: str) -> AdmissionTicket:
+        ticket = AdmissionTicket(store, client_ip)
+        if self.max_sessions_per_ip and self._per_ip[client_ip] >= self.max_sessions_per_ip:
+            raise self._reject("client_limit")
+        # Newcomers only skip the queue when nobody from their store is already waiting.
+        if self._has_capacity(store) and store not in self._waiting:
+            self._admit(ticket)
+            return ticket
+        if self.queued >= self.max_queue:
+            raise self._reject("queue_full")
+
+        waiter = _Waiter(ticket)
+        self._waiting.setdefault(store, deque()).append(waiter)
+        self._per_ip[client_ip] += 1  # Queued sessions count against the IP so reconnect storms stay bounded
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # A slot was handed over just as the wait timed out; it is counted as admitted, so take it.
+                return ticket
+            self._remove_waiter(waiter)
+            self._discount(self._per_ip, client_ip)
+            raise self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                self.release(ticket)
+            else:
+                self._remove_waiter(waiter)
+                self._discount(self._per_ip, client_ip)
+            raise
+        return ticket
+
+    @staticmethod
+    def _discount(counter: Counter[str], key: str) -> None:
+        # Drop keys that reach zero, or every store and IP ever seen stays in memory for the worker's life.
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        waiters = self._waiting.get(waiter.ticket.store)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiting[waiter.ticket.store]
+
+    def _dispatch(self) -> None:
+        progressed = True
+        while progressed and self._waiting:
+            progressed = False
+            for store in list(self._waiting):
+                if not self._has_capacity(store):
+                    continue
+                waiters = self._waiting[store]
+                waiter = waiters.popleft()
+                if waiters:
+                    self._waiting.move_to_end(store)
+                else:
+                    del self._waiting[store]
+                self._discount(self._per_ip, waiter.ticket.client_ip)
+                self._admit(waiter.ticket)
+                waiter.future.set_result(None)
+                progressed = True
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        self.active -= 1
+        self._discount(self._per_store, ticket.store)
+        self._discount(self._per_ip, ticket.client_ip)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "stores": len(self._per_store),
+            "rejections": dict(self.rejections),
+        }
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from pathlib import Path
@@ -7,11 +8,20 @@ from azure.core.credentials import AzureKeyCredential
 from azure.identity import AzureDeveloperCliCredential, DefaultAzureCredential
 from dotenv import load_dotenv
 
-from tools import attach_tools_rtmt
+from admission import AdmissionController
+from event_sink import create_event_sink
+from order_analytics import create_order_analytics
+from output_coalescer import DEFAULT_DENY
+from readiness import StartupWarmup
+from session_store import create_session_store
+from structured_logging import configure_logging
+from upstream_pool import UpstreamPool
+from warm_pool import WarmSocketPool
+from tools import attach_tools_rtmt, is_extra_item
+from order_state import order_state_singleton
 from rtmt import RTMiddleTier
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -26,16 +36,29 @@ def _get_bool_env(variable_name: str, default: bool = False) -> bool:
 async def create_app():
     """Configure and return the aiohttp application for realtime ordering."""
 
-    if not _get_bool_env("RUNNING_IN_PRODUCTION", False):
-        logger.info("Running in development mode; loading values from .env")
+    development = not _get_bool_env("RUNNING_IN_PRODUCTION", False)
+    if development:
         load_dotenv()
+    # Records are queued and written as JSON by a background thread, off the event loop.
+    log_listener = configure_logging()
+    if development:
+        logger.info("Running in development mode; loaded values from .env")
 
     llm_endpoint = os.environ.get("AZURE_OPENAI_EASTUS2_ENDPOINT")
     llm_deployment = os.environ.get("AZURE_OPENAI_REALTIME_DEPLOYMENT")
+    llm_key = os.environ.get("AZURE_OPENAI_EASTUS2_API_KEY")
+
+    # Optional pool of realtime deployments; sessions go to the least-loaded healthy one.
+    upstream_pool = None
+    if endpoints_json := os.environ.get("AZURE_OPENAI_REALTIME_ENDPOINTS"):
+        upstream_pool = UpstreamPool.from_json(endpoints_json, default_key=llm_key)
+        logger.info("Routing realtime sessions across %d endpoints", len(upstream_pool.endpoints))
+        llm_endpoint = llm_endpoint or upstream_pool.endpoints[0].endpoint
+        llm_deployment = llm_deployment or upstream_pool.endpoints[0].deployment
+
     if not llm_endpoint or not llm_deployment:
         raise RuntimeError("Azure OpenAI realtime endpoint and deployment must be configured.")
 
-    llm_key = os.environ.get("AZURE_OPENAI_EASTUS2_API_KEY")
     search_key = os.environ.get("AZURE_SEARCH_API_KEY")
 
     credential = None
@@ -51,20 +74,54 @@ async def create_app():
     search_credential = AzureKeyCredential(search_key) if search_key else credential
 
     app = web.Application()
+    # Credential, search and menu warm-ups run concurrently after the worker starts serving; /ready
+    # reports 503 until they have all completed.
+    warmup = StartupWarmup()
 
     rtmt = RTMiddleTier(
         credentials=llm_credential,
         endpoint=llm_endpoint,
         deployment=llm_deployment,
-        voice_choice=os.environ.get("AZURE_OPENAI_REALTIME_VOICE_CHOICE") or "alloy"
+        voice_choice=os.environ.get("AZURE_OPENAI_REALTIME_VOICE_CHOICE") or "alloy",
+        upstream_pool=upstream_pool
     )
     if api_version := os.environ.get("AZURE_OPENAI_REALTIME_API_VERSION"):
         rtmt.api_version = api_version
+    # On worker shutdown open sessions finish their turn and hand their order to the store for reconnects
+    rtmt.session_store = create_session_store()
+    rtmt.drain_timeout = float(os.environ.get("REALTIME_DRAIN_TIMEOUT_SECONDS", rtmt.drain_timeout))
+    rtmt.drain_jitter_ms = int(os.environ.get("REALTIME_DRAIN_JITTER_MS", rtmt.drain_jitter_ms))
+    # A dropped connection's order waits this long for the client to reconnect with its session token
+    rtmt.resume_grace_seconds = float(os.environ.get("REALTIME_RESUME_GRACE_SECONDS", rtmt.resume_grace_seconds))
+    # Merge bursts of small audio/transcript deltas and skip events the frontend ignores
+    rtmt.output_coalesce_ms = float(os.environ.get("REALTIME_OUTPUT_COALESCE_MS", 40))
+    rtmt.output_coalesce_bytes = int(os.environ.get("REALTIME_OUTPUT_COALESCE_BYTES", rtmt.output_coalesce_bytes))
+    if deny := os.environ.get("REALTIME_OUTPUT_DENY"):
+        rtmt.output_deny = frozenset(event_type.strip() for event_type in deny.split(",") if event_type.strip() not in {"", "none"})
+    else:
+        rtmt.output_deny = DEFAULT_DENY
+    rtmt.admission = AdmissionController(
+        max_sessions=int(os.environ.get("REALTIME_MAX_SESSIONS", 100)),
+        max_sessions_per_store=int(os.environ.get("REALTIME_MAX_SESSIONS_PER_STORE", 20)),
+        max_sessions_per_ip=int(os.environ.get("REALTIME_MAX_SESSIONS_PER_IP", 10)),
+        max_queue=int(os.environ.get("REALTIME_ADMISSION_QUEUE", 20)),
+        queue_timeout=float(os.environ.get("REALTIME_ADMISSION_QUEUE_TIMEOUT_SECONDS", 3)),
+        retry_after_ms=int(os.environ.get("REALTIME_BUSY_RETRY_MS", 2000)),
+    )
+    if (warm_pool_max := int(os.environ.get("REALTIME_WARM_POOL_MAX", 4))) > 0:
+        rtmt.warm_pool = WarmSocketPool(
+            rtmt.open_warm_socket,
+            min_size=int(os.environ.get("REALTIME_WARM_POOL_MIN", 1)),
+            max_size=warm_pool_max,
+            max_age_seconds=float(os.environ.get("REALTIME_WARM_SOCKET_MAX_AGE_SECONDS", 300)),
+        )
     rtmt.temperature = 0.6
     rtmt.system_message = (
         "You are Dunkin's always-on virtual crew member, proudly representing Inspire Brands. "
         "Guide guests through Dunkin menu decisions, keep the tone energetic yet concise, and double-check every detail with the 'search' tool before responding. "
         "Confirm each requested beverage, bakery item, or breakfast sandwich using the 'update_order' tool only after the guest has agreed. "
+        "When the guest asks for several items at once, add them together with a single 'update_order_batch' call instead of one 'update_order' call per item. "
+        "Items are priced from the menu automatically, so there is no need to search for a price before adding an item. "
         "When they ask for a recap or when the order is wrapping up, call the 'get_order' tool and read back the totals, including tax. "
         "Match the customer's language throughout the session, keep responses to one or two sentences, and invite them to personalize drinks with whipped cream ($0.50), flavor swirls ($0.75), or an extra espresso shot ($1.00) only when a signature latte or cold beverage is already in the order. "
         "Do not suggest extras for donuts or breakfast sandwiches, and never ask to pair an extra espresso shot with a donut or breakfast sandwich. "
@@ -85,15 +142,47 @@ async def create_app():
         content_field=os.environ.get("AZURE_SEARCH_CONTENT_FIELD") or "description",
         embedding_field=os.environ.get("AZURE_SEARCH_EMBEDDING_FIELD") or "embedding",
         title_field=os.environ.get("AZURE_SEARCH_TITLE_FIELD") or "name",
-        use_vector_query=_get_bool_env("AZURE_SEARCH_USE_VECTOR_QUERY", True)
+        use_vector_query=_get_bool_env("AZURE_SEARCH_USE_VECTOR_QUERY", True),
+        warmup=warmup
     )
+    # TOOL_DEADLINE_MS_<TOOL> overrides a tool's latency budget (search defaults to 1500); 0 waits however long it takes.
+    for tool_name, tool in rtmt.tools.items():
+        if (deadline_ms := os.environ.get(f"TOOL_DEADLINE_MS_{tool_name.upper()}")) is not None:
+            tool.deadline = float(deadline_ms) / 1000 or None
+    warmup.add("realtime_credentials", rtmt.warm_up)
+    warmup.attach_to_app(app)
 
     rtmt.attach_to_app(app, "/realtime")
 
+    # Live cross-session order numbers for store managers at /analytics.
+    order_analytics = create_order_analytics(is_extra_item)
+    order_state_singleton.add_listener(order_analytics.record)
+    order_analytics.attach_to_app(app)
+
+    if (event_sink := create_event_sink()) is not None:
+        rtmt.event_sink = event_sink
+        order_state_singleton.add_listener(event_sink.record_order_event)
+        event_sink.attach_to_app(app)
+
+    if os.environ.get("AZURE_SPEECH_KEY"):
+        # The cascaded STT -> LLM -> TTS pathway is optional; import lazily so the realtime-only setup
+        # does not need Speech configuration.
+        from azurespeech import AzureSpeech
+
+        azure_speech = AzureSpeech(rtmt.system_message)
+        azure_speech.attach_to_app(app, "/azurespeech")
+        app.on_cleanup.append(azure_speech.close)
+
     current_directory = Path(__file__).parent
     app.add_routes([web.get('/', lambda _: web.FileResponse(current_directory / 'static/index.html'))])
     app.router.add_static('/', path=current_directory / 'static', name='static')
 
+    async def stop_logging(_app: web.Application) -> None:
+        # Registered last so the other cleanup handlers' records are still written.
+        await asyncio.to_thread(log_listener.stop)
+
+    app.on_cleanup.append(stop_logging)
+
     return app
 
 if __name__ == "__main__":
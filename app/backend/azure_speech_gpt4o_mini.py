@@ -1,9 +1,13 @@
+import asyncio
 import os
 from dotenv import load_dotenv
 import azure.cognitiveservices.speech as speechsdk
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 import logging
-import threading
+
+from conversation_memory import ConversationMemory
+from menu_catalog import format_menu_prompt, load_menu_data
+from speech_pipeline import SentenceSegmenter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,113 +15,208 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Load environment variables from .env file
 load_dotenv()
 
-# AOAI Variables
-aoai_eastus_endpoint = os.getenv("AZURE_OPENAI_EASTUS_ENDPOINT")
-aoai_eastus_api_key = os.getenv("AZURE_OPENAI_EASTUS_API_KEY")
-aoai_gpt4o_mini_deployment = os.getenv("AZURE_OPENAI_GPT4O_MINI_DEPLOYMENT")
-aoai_openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION")
-
-# Initialize the Azure OpenAI client
-aoai_client = AzureOpenAI(
-    azure_endpoint=aoai_eastus_endpoint,
-    api_version=aoai_openai_api_version,
-    api_key=aoai_eastus_api_key,
-)
-
-# Set up Azure Speech-to-Text and Text-to-Speech credentials
-speech_key = os.getenv("AZURE_SPEECH_KEY")
-speech_region = os.getenv("AZURE_SPEECH_REGION")
-speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
-# speech_config.speech_synthesis_language = "en-NZ"
-speech_config.speech_synthesis_voice_name = "en-US-AvaMultilingualNeural"
-# "en-US-AlloyMultilingualNeural"
-# "en-US-Andrew:DragonHDLatestNeural" 
-# "en-NZ-MollyNeural"
-
-speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config)
-
-# Global flags
-exit_program = False
-
-# Define the speech-to-text function with continuous listening
-def continuous_speech_to_text():
+QUIT_COMMANDS = {"q", "quit"}
+
+# Barge-in needs the speaker output kept out of the microphone (headset or OS echo cancellation), otherwise
+# the assistant's own voice cancels its reply, so it stays off unless VOICE_LOOP_BARGE_IN=true.
+BARGE_IN_ENABLED = os.getenv("VOICE_LOOP_BARGE_IN", "false").strip().lower() in {"1", "true", "yes", "on"}
+# Partial hypotheses shorter than this are treated as noise rather than the guest speaking.
+BARGE_IN_MIN_CHARS = int(os.getenv("VOICE_LOOP_BARGE_IN_MIN_CHARS", "12"))
+
+FALLBACK_REPLY = "Sorry, I couldn't generate a response."
+
+
+class VoiceLoop:
+    """Continuous speech recognition feeding streamed completions that are spoken sentence by sentence.
+
+    Recognizer callbacks run on Speech SDK threads and only hand events to the event loop. A new utterance
+    (or, with barge-in, a long enough partial one) cancels the reply in progress. The interrupted turn is
+    recorded in memory first, with whatever was already spoken, so the next reply keeps its context.
+    """
+
+    def __init__(self, recognizer, complete, speak, stop_speaking, memory: ConversationMemory,
+                 barge_in: bool = BARGE_IN_ENABLED, barge_in_min_chars: int = BARGE_IN_MIN_CHARS):
+        self.recognizer = recognizer
+        self.memory = memory
+        self.barge_in_enabled = barge_in
+        self.barge_in_min_chars = barge_in_min_chars
+        self._complete = complete
+        self._speak = speak
+        self._stop_speaking = stop_speaking
+        self._utterances: asyncio.Queue[str | None] = asyncio.Queue()
+        self._current: asyncio.Task | None = None
+        # User input and sentences spoken so far for the reply in progress, until it is recorded in memory
+        self._turn: tuple[str, list[str]] | None = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        def recognizing_handler(evt):
+            if self.barge_in_enabled and len(evt.result.text.strip()) >= self.barge_in_min_chars:
+                loop.call_soon_threadsafe(self.interrupt)
+
+        def recognized_handler(evt):
+            recognized_text = evt.result.text.strip().lower()
+            if not recognized_text:
+                return
+            logging.info(f"Recognized: {recognized_text}")
+            if recognized_text.strip(".!?") in QUIT_COMMANDS:
+                logging.info("User chose to quit. Exiting...")
+                loop.call_soon_threadsafe(self._utterances.put_nowait, None)
+            else:
+                loop.call_soon_threadsafe(self._utterances.put_nowait, recognized_text)
+
+        def canceled_handler(evt):
+            logging.error(f"Recognition canceled: {evt.result.reason}")
+            if evt.result.reason == speechsdk.CancellationReason.Error:
+                logging.error(f"Error details: {evt.result.error_details}")
+                loop.call_soon_threadsafe(self._utterances.put_nowait, None)
+
+        self.recognizer.recognizing.connect(recognizing_handler)
+        self.recognizer.recognized.connect(recognized_handler)
+        self.recognizer.canceled.connect(canceled_handler)
+
+        logging.info("Listening continuously... (say 'quit' or 'q' to exit)")
+        await asyncio.to_thread(lambda: self.recognizer.start_continuous_recognition_async().get())
+        try:
+            while (user_input := await self._utterances.get()) is not None:
+                # A new utterance supersedes whatever is still being answered.
+                await self._cancel_current()
+                self._current = asyncio.create_task(self.respond(user_input))
+        finally:
+            await self._cancel_current()
+            await asyncio.to_thread(lambda: self.recognizer.stop_continuous_recognition_async().get())
+
+    def interrupt(self) -> None:
+        """Cancel the reply in progress, recording the interrupted turn first."""
+        if self._current is None or self._current.done():
+            return
+        logging.info("Guest started speaking; cancelling the current response.")
+        self._record_turn()
+        self._current.cancel()
+
+    async def _cancel_current(self) -> None:
+        self.interrupt()
+        if self._current is not None:
+            await asyncio.gather(self._current, return_exceptions=True)
+
+    def _record_turn(self) -> None:
+        if self._turn is None:
+            return
+        user_input, spoken = self._turn
+        self._turn = None
+        self.memory.add_turn(user_input, " ".join(spoken) or "...")
+
+    async def respond(self, user_input: str) -> None:
+        """Stream the completion and speak each sentence as soon as it is complete."""
+        logging.info(f"User Input: {user_input}")
+        spoken: list[str] = []
+        self._turn = (user_input, spoken)
+        sentences: asyncio.Queue[str | None] = asyncio.Queue()
+        messages = self.memory.build_messages(user_input)
+
+        async def produce_sentences():
+            segmenter = SentenceSegmenter()
+            try:
+                async for delta in self._complete(messages):
+                    for sentence in segmenter.feed(delta):
+                        sentences.put_nowait(sentence)
+                if (tail := segmenter.flush()) is not None:
+                    sentences.put_nowait(tail)
+            except Exception as e:
+                logging.error(f"Error generating text: {e}")
+                sentences.put_nowait(FALLBACK_REPLY)
+            finally:
+                sentences.put_nowait(None)
+
+        producer = asyncio.create_task(produce_sentences())
+        try:
+            while (sentence := await sentences.get()) is not None:
+                await self._speak(sentence)
+                spoken.append(sentence)
+            await producer
+            logging.info(f"AI Response: {' '.join(spoken)}")
+            self._record_turn()
+        except asyncio.CancelledError:
+            # Barge-in: stop the speaker immediately; the recognizer keeps running throughout.
+            self._stop_speaking()
+            raise
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+
+async def main() -> None:
+    # Initialize the Azure OpenAI client
+    aoai_client = AsyncAzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_EASTUS_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        api_key=os.getenv("AZURE_OPENAI_EASTUS_API_KEY"),
+    )
+    aoai_gpt4o_mini_deployment = os.getenv("AZURE_OPENAI_GPT4O_MINI_DEPLOYMENT")
+
+    # Set up Azure Speech-to-Text and Text-to-Speech credentials
+    speech_config = speechsdk.SpeechConfig(subscription=os.getenv("AZURE_SPEECH_KEY"), region=os.getenv("AZURE_SPEECH_REGION"))
+    # speech_config.speech_synthesis_language = "en-NZ"
+    speech_config.speech_synthesis_voice_name = "en-US-AvaMultilingualNeural"
+    # "en-US-AlloyMultilingualNeural"
+    # "en-US-Andrew:DragonHDLatestNeural"
+    # "en-NZ-MollyNeural"
+    speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config)
     audio_config = speechsdk.audio.AudioConfig(use_default_microphone=True)
     speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
 
-    def recognized_handler(evt):
-        recognized_text = evt.result.text.strip().lower()
-        logging.info(f"Recognized: {recognized_text}")
-        if recognized_text in ["q", "quit"]:
-            logging.info("User chose to quit. Exiting...")
-            global exit_program
-            exit_program = True
-        else:
-            threading.Thread(target=process_speech_to_text_result, args=(recognized_text, speech_recognizer)).start()
-
-    def canceled_handler(evt):
-        logging.error(f"Recognition canceled: {evt.result.reason}")
-        if evt.result.reason == speechsdk.CancellationReason.Error:
-            logging.error(f"Error details: {evt.result.error_details}")
-
-    # Assign event handlers
-    speech_recognizer.recognized.connect(recognized_handler)
-    speech_recognizer.canceled.connect(canceled_handler)
-
-    logging.info("Listening continuously... (say 'quit' or 'q' to exit)")
-    speech_recognizer.start_continuous_recognition()
-
-    try:
-        while not exit_program:
-            pass  # Keep the program running while listening
-    except KeyboardInterrupt:
-        logging.info("Program interrupted by user.")
-    finally:
-        speech_recognizer.stop_continuous_recognition()
-
-# Process recognized speech and generate AI response
-def process_speech_to_text_result(user_input, speech_recognizer):
-    # Stop the recognizer while responding
-    logging.info("Pausing recognizer for AI response...")
-    speech_recognizer.stop_continuous_recognition()
-
-    logging.info(f"User Input: {user_input}")
-    response_text = generate_text(user_input)
-    logging.info(f"AI Response: {response_text}")
-    text_to_speech(response_text)
-
-    # Resume the recognizer after responding
-    logging.info("Resuming recognizer...")
-    speech_recognizer.start_continuous_recognition()
-
-# Define the Azure OpenAI language generation function
-def generate_text(prompt):
-    try:
-        response = aoai_client.chat.completions.create(
+    # Stable system + menu prefix with a rolling window of recent turns behind it
+    prompt_prefix = [{"role": "system", "content": "You are a friendly barista helping customers place coffee orders."}]
+    if menu_prompt := format_menu_prompt(load_menu_data()):
+        prompt_prefix.append({"role": "system", "content": "Menu (prices per size):\n" + menu_prompt})
+    conversation_memory = ConversationMemory(
+        prompt_prefix, max_history_tokens=int(os.getenv("CONVERSATION_MAX_HISTORY_TOKENS", "1500"))
+    )
+
+    # Define the Azure OpenAI language generation function, yielding text as it streams in
+    async def generate_text(messages):
+        stream = await aoai_client.chat.completions.create(
             model=aoai_gpt4o_mini_deployment,
-            messages=[
-                {"role": "system", "content": "You are a friendly barista helping customers place coffee orders."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=messages,
             temperature=0.6,
+            stream=True,
+            stream_options={"include_usage": True},
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        logging.error(f"Error generating text: {e}")
-        return "Sorry, I couldn't generate a response."
-
-# Define the text-to-speech function
-def text_to_speech(text):
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None:
+                cached = getattr(chunk.usage.prompt_tokens_details, "cached_tokens", 0) if chunk.usage.prompt_tokens_details else 0
+                logging.info(f"Input tokens: {chunk.usage.prompt_tokens} (cached: {cached or 0})")
+
+    # Define the text-to-speech function
+    async def text_to_speech(text):
+        try:
+            logging.info("Speaking response...")
+            result = await asyncio.to_thread(speech_synthesizer.speak_text_async(text).get)
+            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+                logging.info("Text-to-speech conversion successful.")
+            elif result.reason != speechsdk.ResultReason.Canceled:
+                logging.error(f"Error synthesizing audio: {result}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error synthesizing audio: {e}")
+
+    voice_loop = VoiceLoop(
+        speech_recognizer, generate_text, text_to_speech, speech_synthesizer.stop_speaking_async, conversation_memory
+    )
     try:
-        logging.info("Speaking response...")
-        result = speech_synthesizer.speak_text_async(text).get()
-        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-            logging.info("Text-to-speech conversion successful.")
-        else:
-            logging.error(f"Error synthesizing audio: {result}")
-    except Exception as e:
-        logging.error(f"Error synthesizing audio: {e}")
+        await voice_loop.run()
+    finally:
+        await aoai_client.close()
+
 
 # Main function to run continuous listening
 if __name__ == "__main__":
-    continuous_speech_to_text()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.info("Program interrupted by user.")
     logging.info("Program terminated. Goodbye!")
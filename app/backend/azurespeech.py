@@ -1,21 +1,239 @@
+import asyncio
 import os
 import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional
+
 from aiohttp import web
-from azure.cognitiveservices.speech import SpeechConfig, SpeechRecognizer, SpeechSynthesizer, AudioConfig, SpeechConfig, ResultReason
-from azure.cognitiveservices.speech.audio import AudioConfig
-from openai import AzureOpenAI
+from azure.cognitiveservices.speech import (
+    ResultReason,
+    SpeechConfig,
+    SpeechRecognizer,
+    SpeechSynthesisOutputFormat,
+    SpeechSynthesizer,
+)
+from azure.cognitiveservices.speech.audio import AudioConfig, AudioStreamFormat, PushAudioInputStream
+from openai import APITimeoutError, AsyncAzureOpenAI
 from dotenv import load_dotenv
 
+from conversation_memory import ConversationMemory
+from menu_catalog import format_menu_prompt, load_menu_data
+from speech_pipeline import PIPELINE_SAMPLE_RATE, PipelineSession, Utterance
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Load environment variables
 load_dotenv()
 
+# Raw PCM sample rate used for streamed synthesis; matches the frontend playback worklet.
+STREAM_AUDIO_SAMPLE_RATE = 24000
+
+# Upper bound on how much of an upload is buffered while looking for the WAV ``data`` chunk.
+WAV_HEADER_SCAN_LIMIT = 64 * 1024
+
+
+@dataclass
+class WavHeader:
+    sample_rate: int
+    bits_per_sample: int
+    channels: int
+    data_offset: int
+
+
+def parse_wav_header(buffer: bytes) -> Optional[WavHeader]:
+    """Parse a RIFF/WAVE header, returning None until the ``data`` chunk has been reached."""
+    if len(buffer) < 12:
+        return None
+    if buffer[:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+        raise ValueError("Audio upload is not a RIFF/WAVE stream.")
+
+    offset = 12
+    audio_format = None
+    while offset + 8 <= len(buffer):
+        chunk_id = buffer[offset:offset + 4]
+        chunk_size = int.from_bytes(buffer[offset + 4:offset + 8], "little")
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if body + 16 > len(buffer):
+                return None
+            channels = int.from_bytes(buffer[body + 2:body + 4], "little")
+            sample_rate = int.from_bytes(buffer[body + 4:body + 8], "little")
+            bits_per_sample = int.from_bytes(buffer[body + 14:body + 16], "little")
+            audio_format = (sample_rate, bits_per_sample, channels)
+        elif chunk_id == b"data":
+            if audio_format is None:
+                raise ValueError("WAV data chunk precedes its fmt chunk.")
+            sample_rate, bits_per_sample, channels = audio_format
+            return WavHeader(sample_rate, bits_per_sample, channels, data_offset=body)
+        # RIFF chunks are word aligned, odd sizes carry a pad byte.
+        offset = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+class SpeechExecutorBusy(Exception):
+    """Raised when the speech executor has no free worker or queue slot."""
+
+
+class SpeechExecutor:
+    """Bounded thread pool that keeps blocking Speech SDK calls off the aiohttp event loop."""
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, timeout: float = 15.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="azurespeech")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._timeouts = 0
+        self._rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of submitted calls still waiting for a worker thread."""
+        with self._lock:
+            return self._pending - self._running
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "timeouts": self._timeouts,
+                "rejected": self._rejected,
+            }
+
+    def _invoke(self, func: Callable[..., Any], args: tuple) -> Any:
+        with self._lock:
+            self._running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _on_done(self, _: Future) -> None:
+        # Runs for cancelled futures too, so calls dropped from the queue release their slot.
+        with self._lock:
+            self._pending -= 1
+
+    async def run(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        timeout: Optional[float] = None,
+        on_cancel: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """Run ``func`` on the pool, cancelling it via ``on_cancel`` on timeout or task cancellation."""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise SpeechExecutorBusy("Speech executor queue is full.")
+            self._pending += 1
+
+        future = self._executor.submit(self._invoke, func, args)
+        future.add_done_callback(self._on_done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if isinstance(exc, asyncio.TimeoutError):
+                with self._lock:
+                    self._timeouts += 1
+            # A call that already started keeps its worker until the SDK honours the cancellation.
+            future.cancel()
+            if on_cancel is not None:
+                try:
+                    on_cancel()
+                except Exception as cancel_error:  # pragma: no cover - best effort cleanup
+                    logging.warning(f"Cancelling speech call failed: {cancel_error}")
+            raise
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SpeechSdkStreamingRecognizer:
+    """Continuous recognition over a push stream, reporting each final utterance with its speech end time."""
+
+    # Speech SDK offsets and durations are expressed in 100 ns ticks.
+    TICKS_PER_SECOND = 10_000_000
+
+    def __init__(self, speech_config: SpeechConfig, executor: SpeechExecutor, sample_rate: int, on_recognized: Callable[[Utterance], None]):
+        self._executor = executor
+        self._on_recognized = on_recognized
+        self._stream = PushAudioInputStream(
+            stream_format=AudioStreamFormat(samples_per_second=sample_rate, bits_per_sample=16, channels=1)
+        )
+        self._recognizer = SpeechRecognizer(speech_config=speech_config, audio_config=AudioConfig(stream=self._stream))
+        self._recognizer.recognized.connect(self._handle_recognized)
+        self._stream_started_at: Optional[float] = None
+
+    def write(self, audio: bytes) -> None:
+        if self._stream_started_at is None:
+            self._stream_started_at = time.perf_counter()
+        self._stream.write(audio)
+
+    async def start(self) -> None:
+        await self._executor.run(lambda: self._recognizer.start_continuous_recognition_async().get())
+
+    async def stop(self) -> None:
+        self._stream.close()
+        await self._executor.run(lambda: self._recognizer.stop_continuous_recognition_async().get())
+
+    def _handle_recognized(self, evt) -> None:
+        result = evt.result
+        if result.reason != ResultReason.RecognizedSpeech or not result.text:
+            return
+        recognized_at = time.perf_counter()
+        speech_ended_at = recognized_at
+        if self._stream_started_at is not None:
+            # Audio is streamed in real time, so the audio offset maps onto wall-clock time.
+            audio_end = (result.offset + result.duration) / self.TICKS_PER_SECOND
+            speech_ended_at = min(recognized_at, self._stream_started_at + audio_end)
+        self._on_recognized(Utterance(result.text, speech_ended_at=speech_ended_at, recognized_at=recognized_at))
+
+
+def usage_report(usage) -> dict[str, int]:
+    """Per-turn token usage, including how much of the prompt was served from the provider's cache."""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "input_tokens": usage.prompt_tokens,
+        "cached_input_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+        "output_tokens": usage.completion_tokens,
+    }
+
+
+def _get_float_env(variable_name: str, default: float) -> float:
+    value = os.getenv(variable_name)
+    return float(value) if value else default
+
+
+def _get_int_env(variable_name: str, default: int) -> int:
+    value = os.getenv(variable_name)
+    return int(value) if value else default
+
 class AzureSpeech:
     def __init__(self, system_message):
         self.system_message = system_message
-        
+
+        # Built once and shared by every session so the prompt prefix stays byte-identical for caching.
+        self.prompt_prefix = [{"role": "system", "content": system_message}]
+        if menu_prompt := format_menu_prompt(load_menu_data()):
+            self.prompt_prefix.append({"role": "system", "content": "Menu (prices per size):\n" + menu_prompt})
+        self.max_history_tokens = _get_int_env("CONVERSATION_MAX_HISTORY_TOKENS", 1500)
+        self.max_sessions = _get_int_env("CONVERSATION_MAX_SESSIONS", 512)
+        self._memories: OrderedDict[str, ConversationMemory] = OrderedDict()
+
         # Azure OpenAI Variables
         self.aoai_eastus_endpoint = os.getenv("AZURE_OPENAI_EASTUS_ENDPOINT")
         self.aoai_eastus_api_key = os.getenv("AZURE_OPENAI_EASTUS_API_KEY")
@@ -28,52 +246,88 @@ class AzureSpeech:
         self.speech_config = SpeechConfig(subscription=self.speech_key, region=self.speech_region)
         self.speech_config.speech_synthesis_voice_name = "en-US-AvaMultilingualNeural"
 
+        # Streaming synthesis emits raw PCM matching the frontend's playback worklet.
+        self.stream_speech_config = SpeechConfig(subscription=self.speech_key, region=self.speech_region)
+        self.stream_speech_config.speech_synthesis_voice_name = self.speech_config.speech_synthesis_voice_name
+        self.stream_speech_config.set_speech_synthesis_output_format(SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm)
+
         # Azure OpenAI Client
-        self.aoai_client = AzureOpenAI(
+        self.aoai_timeout = _get_float_env("AZURE_OPENAI_TIMEOUT_SECONDS", 20.0)
+        self.aoai_client = AsyncAzureOpenAI(
             azure_endpoint=self.aoai_eastus_endpoint,
             api_version=self.aoai_openai_api_version,
             api_key=self.aoai_eastus_api_key,
+            timeout=self.aoai_timeout,
+        )
+
+        # Blocking Speech SDK calls run here so a slow synthesis never stalls the event loop.
+        self.executor = SpeechExecutor(
+            max_workers=_get_int_env("AZURE_SPEECH_EXECUTOR_WORKERS", 4),
+            max_queue=_get_int_env("AZURE_SPEECH_EXECUTOR_QUEUE", 16),
+            timeout=_get_float_env("AZURE_SPEECH_TIMEOUT_SECONDS", 15.0),
         )
 
     async def speech_to_text(self, request):
-        """Convert audio to text using Azure Speech-to-Text."""
+        """Convert audio to text using Azure Speech-to-Text.
+
+        The multipart body is streamed straight into a per-request push stream so recognition
+        overlaps the upload and concurrent guests never share audio buffers or files.
+        """
+        push_stream = None
         try:
             logging.info("Received speech-to-text request.")
             reader = await request.multipart()
             audio_part = await reader.next()
-            audio_file_path = "./uploaded_audio.wav"
-
-            # Save uploaded audio
-            with open(audio_file_path, "wb") as audio_file:
-                while True:
-                    chunk = await audio_part.read_chunk()
-                    if not chunk:
-                        break
-                    audio_file.write(chunk)
-
-            # Log file details
-            if not os.path.exists(audio_file_path):
-                logging.error("Uploaded audio file is missing.")
-            else:
-                file_size = os.path.getsize(audio_file_path)
-                logging.info(f"Uploaded audio file size: {file_size} bytes")
+            if audio_part is None:
+                raise web.HTTPBadRequest(reason="Missing audio file.")
 
-            # Validate file size
-            if file_size == 0:
-                logging.error("Uploaded audio file is empty.")
-                raise web.HTTPBadRequest(reason="Empty audio file.")
+            # Buffer only until the RIFF header is complete so the stream format matches the upload.
+            header_bytes = b""
+            header = None
+            while header is None:
+                chunk = await audio_part.read_chunk()
+                if not chunk:
+                    break
+                header_bytes += chunk
+                header = parse_wav_header(header_bytes)
+                if header is None and len(header_bytes) > WAV_HEADER_SCAN_LIMIT:
+                    raise web.HTTPBadRequest(reason="Invalid audio file.")
 
+            if header is None:
+                logging.error("Uploaded audio file is empty or missing a WAV header.")
+                raise web.HTTPBadRequest(reason="Empty audio file.")
 
-            # Verify file existence and size
-            if not os.path.exists(audio_file_path) or os.path.getsize(audio_file_path) == 0:
-                logging.error("Uploaded audio file is empty or missing.")
-                raise web.HTTPBadRequest(reason="Invalid audio file.")
+            stream_format = AudioStreamFormat(
+                samples_per_second=header.sample_rate,
+                bits_per_sample=header.bits_per_sample,
+                channels=header.channels,
+            )
+            push_stream = PushAudioInputStream(stream_format=stream_format)
+            speech_recognizer = SpeechRecognizer(
+                speech_config=self.speech_config, audio_config=AudioConfig(stream=push_stream)
+            )
 
-            # Speech-to-text conversion
+            # Start recognition before the upload finishes so it runs alongside the remaining chunks.
             logging.info("Starting speech recognition.")
-            audio_config = AudioConfig(filename=audio_file_path)
-            speech_recognizer = SpeechRecognizer(speech_config=self.speech_config, audio_config=audio_config)
-            result = speech_recognizer.recognize_once()
+            result_future = speech_recognizer.recognize_once_async()
+
+            audio_bytes = len(header_bytes) - header.data_offset
+            push_stream.write(header_bytes[header.data_offset:])
+            while True:
+                chunk = await audio_part.read_chunk()
+                if not chunk:
+                    break
+                audio_bytes += len(chunk)
+                push_stream.write(chunk)
+            push_stream.close()
+            push_stream = None
+            logging.info("Uploaded audio stream size: %d bytes", audio_bytes)
+
+            if audio_bytes == 0:
+                logging.error("Uploaded audio file is empty.")
+                raise web.HTTPBadRequest(reason="Empty audio file.")
+
+            result = await self.executor.run(result_future.get)
 
             if result.reason == ResultReason.RecognizedSpeech:
                 logging.info(f"Speech recognized: {result.text}")
@@ -84,9 +338,24 @@ class AzureSpeech:
             else:
                 logging.error(f"Speech recognition canceled: {result.cancellation_details.error_details}")
                 raise web.HTTPInternalServerError(reason="Speech recognition canceled.")
+        except web.HTTPException:
+            raise
+        except SpeechExecutorBusy:
+            logging.warning("Speech executor saturated; rejecting speech-to-text request.")
+            raise web.HTTPServiceUnavailable(reason="Speech service busy.", headers={"Retry-After": "1"})
+        except asyncio.TimeoutError:
+            logging.error("Speech recognition timed out.")
+            raise web.HTTPGatewayTimeout(reason="Speech recognition timed out.")
+        except ValueError as e:
+            logging.error(f"Uploaded audio could not be parsed: {e}")
+            raise web.HTTPBadRequest(reason="Invalid audio file.")
         except Exception as e:
             logging.error(f"Speech-to-text processing failed: {e}")
             raise web.HTTPInternalServerError(reason="Internal server error.")
+        finally:
+            # Closing the stream signals end-of-audio so an abandoned recognition can finish.
+            if push_stream is not None:
+                push_stream.close()
 
 
     async def generate_response(self, request):
@@ -94,39 +363,164 @@ class AzureSpeech:
         try:
             data = await request.json()
             prompt = data.get("content", "")
+            session_id, memory = self.get_memory(data.get("sessionId"))
 
-            response = self.aoai_client.chat.completions.create(
+            response = await self.aoai_client.chat.completions.create(
                 model=self.aoai_gpt4o_mini_deployment,
-                messages=[
-                    {"role": "system", "content": self.system_message},
-                    {"role": "user", "content": prompt},
-                ],
+                messages=memory.build_messages(prompt),
                 temperature=0.6,
             )
-            return web.json_response({"response": response.choices[0].message.content})
+            reply = response.choices[0].message.content
+            memory.add_turn(prompt, reply)
+            usage = usage_report(response.usage)
+            logging.info(f"Session {session_id} turn {memory.turn_count} token usage: {usage}")
+            return web.json_response({"response": reply, "sessionId": session_id, "usage": usage})
+        except APITimeoutError:
+            # The client's own timeout (AZURE_OPENAI_TIMEOUT_SECONDS) raises this, not asyncio.TimeoutError.
+            logging.error("AI response generation timed out.")
+            return web.json_response({"error": "Response generation timed out."}, status=504)
         except Exception as e:
             logging.error(f"Error generating AI response: {e}")
             return web.json_response({"error": "Internal server error."}, status=500)
 
     async def text_to_speech(self, request):
-        """Convert text to speech using Azure TTS."""
+        """Stream synthesized speech back as raw 24 kHz PCM while the synthesizer produces it."""
+        response = None
+        chunks = None
         try:
             data = await request.json()
             text = data.get("content", "")
+            if not text.strip():
+                return web.json_response({"error": "No text to synthesize."}, status=400)
 
-            synthesizer = SpeechSynthesizer(speech_config=self.speech_config, audio_config=None)
-            result = synthesizer.speak_text_async(text).get()
+            chunks = self.synthesize_stream(text)
+            # Wait for the first chunk before committing to a 200 so early failures still map to a status code.
+            first_chunk = await anext(chunks, b"")
 
-            audio_file_path = "./response_audio.wav"
-            with open(audio_file_path, "wb") as audio_file:
-                audio_file.write(result.audio_data)
-            return web.json_response({"audio_url": "/static/response_audio.wav"})
+            response = web.StreamResponse(headers={
+                "Content-Type": "audio/pcm",
+                "Cache-Control": "no-store",
+                "X-Audio-Sample-Rate": str(STREAM_AUDIO_SAMPLE_RATE),
+                "X-Audio-Encoding": "pcm_s16le",
+            })
+            response.enable_chunked_encoding()
+            await response.prepare(request)
+            if first_chunk:
+                await response.write(first_chunk)
+            async for chunk in chunks:
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+        except SpeechExecutorBusy:
+            logging.warning("Speech executor saturated; rejecting text-to-speech request.")
+            return web.json_response({"error": "Speech service busy."}, status=503, headers={"Retry-After": "1"})
+        except asyncio.TimeoutError:
+            logging.error("Text-to-speech timed out.")
+            if response is not None:
+                return response
+            return web.json_response({"error": "Text-to-speech timed out."}, status=504)
         except Exception as e:
             logging.error(f"Text-to-speech failed: {e}")
+            # Once audio has started flowing the status is already sent; the client sees a truncated stream.
+            if response is not None:
+                return response
             return web.json_response({"error": "Internal server error."}, status=500)
+        finally:
+            if chunks is not None:
+                # Stops synthesis if the client disconnected mid-stream.
+                await chunks.aclose()
+
+    def get_memory(self, session_id: Optional[str]) -> tuple[str, ConversationMemory]:
+        """Return the session's conversation memory, starting a new session for unknown ids."""
+        if session_id is not None and session_id in self._memories:
+            self._memories.move_to_end(session_id)
+            return session_id, self._memories[session_id]
+
+        # The cascaded path has no order tools, so its sessions only hold conversation memory and stay out
+        # of the order state (and the analytics and events fed from it).
+        session_id = uuid.uuid4().hex
+        memory = ConversationMemory(self.prompt_prefix, max_history_tokens=self.max_history_tokens)
+        self._memories[session_id] = memory
+        while len(self._memories) > self.max_sessions:
+            self._memories.popitem(last=False)
+        return session_id, memory
+
+    async def stream_completion(self, messages: list[dict]) -> AsyncIterator[str]:
+        """Yield GPT-4o-mini completion text as it streams in."""
+        stream = await self.aoai_client.chat.completions.create(
+            model=self.aoai_gpt4o_mini_deployment,
+            messages=messages,
+            temperature=0.6,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None:
+                logging.info(f"Streamed completion token usage: {usage_report(chunk.usage)}")
+
+    async def synthesize_stream(self, text: str) -> AsyncIterator[bytes]:
+        """Yield raw PCM chunks at ``STREAM_AUDIO_SAMPLE_RATE`` as the synthesizer produces them."""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue[Optional[bytes]] = asyncio.Queue()
+        synthesizer = SpeechSynthesizer(speech_config=self.stream_speech_config, audio_config=None)
+        synthesizer.synthesizing.connect(
+            lambda evt: loop.call_soon_threadsafe(chunks.put_nowait, evt.result.audio_data)
+        )
+        result_task = asyncio.ensure_future(
+            self.executor.run(synthesizer.speak_text_async(text).get, on_cancel=synthesizer.stop_speaking_async)
+        )
+        # Completion is signalled through the loop after every pending chunk callback has been queued.
+        result_task.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            while (chunk := await chunks.get()) is not None:
+                if chunk:
+                    yield chunk
+            result = await result_task
+            if result.reason == ResultReason.Canceled:
+                raise RuntimeError(f"Speech synthesis canceled: {result.cancellation_details.error_details}")
+        finally:
+            if not result_task.done():
+                result_task.cancel()
+
+    async def pipeline(self, request):
+        """Sentence-streaming STT -> LLM -> TTS over a single WebSocket."""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        sample_rate = int(request.query.get("sampleRate", PIPELINE_SAMPLE_RATE))
+        session_id, memory = self.get_memory(request.query.get("sessionId"))
+        await ws.send_json({"type": "extension.pipeline_session", "sessionId": session_id})
+        session = PipelineSession(
+            ws,
+            recognizer_factory=lambda rate, on_recognized: SpeechSdkStreamingRecognizer(
+                self.speech_config, self.executor, rate, on_recognized
+            ),
+            complete=self.stream_completion,
+            synthesize=self.synthesize_stream,
+            system_message=self.system_message,
+            sample_rate=sample_rate,
+            memory=memory,
+        )
+        try:
+            await session.run()
+        except Exception as e:
+            logging.error(f"Speech pipeline failed: {e}")
+        return ws
+
+    async def close(self, app=None) -> None:
+        """Release the executor and HTTP client; usable as an aiohttp ``on_cleanup`` handler."""
+        self.executor.shutdown()
+        await self.aoai_client.close()
+
+    async def executor_stats(self, request):
+        """Report speech executor load so saturation is visible before requests start failing."""
+        return web.json_response(self.executor.stats())
 
     def attach_to_app(self, app, path_prefix="/azurespeech"):
         """Attach routes to aiohttp app."""
+        app.router.add_get(f"{path_prefix}/stats", self.executor_stats)
+        app.router.add_get(f"{path_prefix}/pipeline", self.pipeline)
         app.router.add_post(f"{path_prefix}/speech-to-text", self.speech_to_text)
         app.router.add_post(f"{path_prefix}/text-to-speech", self.text_to_speech)
         app.router.add_post(f"{path_prefix}/generate-response", self.generate_response)
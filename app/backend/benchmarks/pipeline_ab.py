@@ -0,0 +1,511 @@
+"""Offline A/B latency harness for the realtime relay and the cascaded speech pipeline.
+
+Runs the scripted order conversations in ``fixtures/scripted_orders.json`` through ``RTMiddleTier`` and
+through the ``PipelineSession`` that backs ``/azurespeech/pipeline``. Both talk to local stand-ins whose
+service latencies come from the script's profiles, so results only move when our code does.
+
+    python benchmarks/pipeline_ab.py --runs 5 --output-dir benchmark_results
+
+A turn's ``audio`` key points to a recording (16-bit mono WAV at the script's sample rate, relative to the
+script). Turns without one, or whose file is missing, get a deterministic synthesized tone sized to the
+utterance; the report counts how many turns used each, so numbers from tones are not mistaken for ones
+from recorded speech. The bundled script ships no recordings.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import math
+import statistics
+import sys
+import time
+import wave
+from array import array
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import aiohttp
+from aiohttp import WSMsgType, web
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from azure.core.credentials import AzureKeyCredential
+
+from rtmt import RTMiddleTier, Tool, ToolResult, ToolResultDirection
+from speech_pipeline import PipelineSession, Utterance
+from tools import get_order, get_order_tool_schema, search_tool_schema, update_order, update_order_tool_schema
+
+logger = logging.getLogger("pipeline-benchmark")
+
+DEFAULT_SCRIPT = Path(__file__).resolve().parent / "fixtures" / "scripted_orders.json"
+PERCENTILES = (50, 90, 95, 99)
+METRICS = ("ttfa_ms", "turn_ms", "tool_ms", "bytes_received", "bytes_sent")
+GREETING = "Welcome to Dunkin! How may I help you today?"
+
+
+@dataclass
+class TurnMeasurement:
+    pathway: str
+    conversation: str
+    run: int
+    turn: int
+    ttfa_ms: Optional[float]
+    turn_ms: float
+    tool_ms: float
+    bytes_received: int
+    bytes_sent: int
+
+
+class ScriptCursor:
+    """Tells the stand-in services which scripted turn the harness is currently driving."""
+
+    def __init__(self):
+        self.turn: dict[str, Any] = {}
+        self.audio_bytes = 0
+
+
+class ToolTimer:
+    def __init__(self):
+        self.total_ms = 0.0
+
+    def wrap(self, target):
+        async def timed(*args):
+            started = time.perf_counter()
+            try:
+                return await target(*args)
+            finally:
+                self.total_ms += (time.perf_counter() - started) * 1000
+
+        return timed
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _speech_bytes(text: str, sample_rate: int, words_per_second: float) -> int:
+    duration = max(1, len(text.split())) / words_per_second
+    return int(duration * sample_rate) * 2
+
+
+def _chunks(data: bytes, size: int):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+def load_turn_audio(script_dir: Path, turn: dict, audio_config: dict) -> tuple[bytes, bool]:
+    """The turn's recorded audio, or a tone of the utterance's spoken length, and whether it was recorded."""
+    sample_rate = audio_config["sample_rate"]
+    if turn.get("audio"):
+        path = script_dir / turn["audio"]
+        if path.exists():
+            with wave.open(str(path), "rb") as recording:
+                if recording.getsampwidth() != 2 or recording.getnchannels() != 1 or recording.getframerate() != sample_rate:
+                    raise ValueError(f"{path} must be 16-bit mono PCM at {sample_rate} Hz")
+                return recording.readframes(recording.getnframes()), True
+        logger.warning("Recording %s is missing; using a synthesized tone for %r", path, turn["utterance"])
+
+    samples = _speech_bytes(turn["utterance"], sample_rate, audio_config["words_per_second"]) // 2
+    tone = array("h", (int(3000 * math.sin(2 * math.pi * 220 * n / sample_rate)) for n in range(samples)))
+    return tone.tobytes(), False
+
+
+class RealtimeStandIn:
+    """Minimal Azure OpenAI realtime endpoint that answers the scripted turn after the profile's delays."""
+
+    def __init__(self, profile: dict, audio_config: dict, cursor: ScriptCursor):
+        self.profile = profile
+        self.audio_config = audio_config
+        self.cursor = cursor
+        self._ids = 0
+
+    def _next_id(self, prefix: str) -> str:
+        self._ids += 1
+        return f"{prefix}_{self._ids:06d}"
+
+    async def handler(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"type": "session.created", "session": {"id": self._next_id("sess"), "instructions": "", "tools": []}})
+
+        tasks: set[asyncio.Task] = set()
+
+        def spawn(coro):
+            task = asyncio.create_task(coro)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        greeted = False
+        awaiting_reply = False
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            event = json.loads(msg.data)
+            match event["type"]:
+                case "session.update":
+                    await ws.send_json({"type": "session.updated", "session": event["session"]})
+                case "conversation.item.create":
+                    if event["item"]["type"] == "function_call_output":
+                        awaiting_reply = True
+                case "input_audio_buffer.commit":
+                    spawn(self._answer_turn(ws, self.cursor.turn))
+                case "response.create":
+                    if not greeted:
+                        greeted = True
+                        spawn(self._speak(ws, GREETING, self.profile["first_audio_ms"]))
+                    elif awaiting_reply:
+                        awaiting_reply = False
+                        spawn(self._speak(ws, self.cursor.turn["reply"], self.profile["first_audio_ms"]))
+
+        for task in tasks:
+            task.cancel()
+        return ws
+
+    async def _answer_turn(self, ws: web.WebSocketResponse, turn: dict) -> None:
+        await ws.send_json({"type": "input_audio_buffer.committed", "item_id": self._next_id("item")})
+        await asyncio.sleep(self.profile["transcription_ms"] / 1000)
+        await ws.send_json({
+            "type": "conversation.item.input_audio_transcription.completed",
+            "item_id": self._next_id("item"),
+            "content_index": 0,
+            "transcript": turn["utterance"],
+        })
+        if not turn["tool_calls"]:
+            await self._speak(ws, turn["reply"], self.profile["first_audio_ms"] - self.profile["transcription_ms"])
+            return
+
+        await asyncio.sleep((self.profile["tool_call_ms"] - self.profile["transcription_ms"]) / 1000)
+        response_id = self._next_id("resp")
+        await ws.send_json({"type": "response.created", "response": {"id": response_id, "output": []}})
+        previous_id = self._next_id("item")
+        output = []
+        for call in turn["tool_calls"]:
+            item = {
+                "id": self._next_id("item"),
+                "type": "function_call",
+                "call_id": self._next_id("call"),
+                "name": call["name"],
+                "arguments": json.dumps(call["arguments"]),
+            }
+            output.append(item)
+            await ws.send_json({"type": "response.output_item.added", "response_id": response_id, "item": item})
+            await ws.send_json({"type": "conversation.item.created", "previous_item_id": previous_id, "item": item})
+            await ws.send_json({"type": "response.function_call_arguments.done", "call_id": item["call_id"], "arguments": item["arguments"]})
+            await ws.send_json({"type": "response.output_item.done", "response_id": response_id, "item": item})
+            previous_id = item["id"]
+        await ws.send_json({"type": "response.done", "response": {"id": response_id, "output": output}})
+
+    async def _speak(self, ws: web.WebSocketResponse, text: str, delay_ms: float) -> None:
+        response_id = self._next_id("resp")
+        item_id = self._next_id("item")
+        await ws.send_json({"type": "response.created", "response": {"id": response_id, "output": []}})
+        await asyncio.sleep(max(0.0, delay_ms) / 1000)
+
+        sample_rate = self.audio_config["sample_rate"]
+        audio = bytes(_speech_bytes(text, sample_rate, self.audio_config["words_per_second"]))
+        chunk_size = int(sample_rate * self.profile["audio_chunk_ms"] / 1000) * 2
+        words = text.split()
+        chunks = list(_chunks(audio, chunk_size))
+        words_per_chunk = max(1, math.ceil(len(words) / len(chunks)))
+        for index, chunk in enumerate(chunks):
+            await ws.send_json({
+                "type": "response.audio.delta",
+                "response_id": response_id,
+                "item_id": item_id,
+                "delta": base64.b64encode(chunk).decode("ascii"),
+            })
+            if transcript := " ".join(words[index * words_per_chunk:(index + 1) * words_per_chunk]):
+                await ws.send_json({"type": "response.audio_transcript.delta", "response_id": response_id, "item_id": item_id, "delta": transcript + " "})
+            await asyncio.sleep(self.profile["audio_chunk_interval_ms"] / 1000)
+
+        await ws.send_json({"type": "response.audio_transcript.done", "response_id": response_id, "item_id": item_id, "transcript": text})
+        await ws.send_json({
+            "type": "response.done",
+            "response": {
+                "id": response_id,
+                "output": [{"id": item_id, "type": "message", "content": [{"type": "audio", "transcript": text}]}],
+            },
+        })
+
+
+class StandInRecognizer:
+    """Recognizes the scripted utterance once the turn's audio has been received."""
+
+    def __init__(self, profile: dict, cursor: ScriptCursor, on_recognized):
+        self.profile = profile
+        self.cursor = cursor
+        self._on_recognized = on_recognized
+        self._received = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    def write(self, audio: bytes) -> None:
+        self._received += len(audio)
+        if self._received >= self.cursor.audio_bytes:
+            self._received = 0
+            task = asyncio.create_task(self._recognize(self.cursor.turn["utterance"], time.perf_counter()))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _recognize(self, text: str, speech_ended_at: float) -> None:
+        await asyncio.sleep(self.profile["stt_ms"] / 1000)
+        self._on_recognized(Utterance(text, speech_ended_at=speech_ended_at, recognized_at=time.perf_counter()))
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+
+class CascadedStandIn:
+    """Stand-in completion and synthesis stages for the cascaded pipeline."""
+
+    def __init__(self, profile: dict, audio_config: dict, cursor: ScriptCursor):
+        self.profile = profile
+        self.audio_config = audio_config
+        self.cursor = cursor
+
+    async def complete(self, messages: list[dict]):
+        await asyncio.sleep(self.profile["llm_first_token_ms"] / 1000)
+        for word in self.cursor.turn["reply"].split(" "):
+            yield word + " "
+            await asyncio.sleep(self.profile["llm_token_interval_ms"] / 1000)
+
+    async def synthesize(self, text: str):
+        sample_rate = self.audio_config["sample_rate"]
+        await asyncio.sleep(self.profile["tts_first_chunk_ms"] / 1000)
+        audio = bytes(_speech_bytes(text, sample_rate, self.audio_config["words_per_second"]))
+        for chunk in _chunks(audio, int(sample_rate * self.profile["audio_chunk_ms"] / 1000) * 2):
+            yield chunk
+            await asyncio.sleep(self.profile["audio_chunk_interval_ms"] / 1000)
+
+    async def handler(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session = PipelineSession(
+            ws,
+            recognizer_factory=lambda rate, on_recognized: StandInRecognizer(self.profile, self.cursor, on_recognized),
+            complete=self.complete,
+            synthesize=self.synthesize,
+            system_message="benchmark",
+            sample_rate=self.audio_config["sample_rate"],
+        )
+        await session.run()
+        return ws
+
+
+async def _start_app(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def _receive_turn(ws, responses_expected: int, done_type: str) -> tuple[Optional[float], float, int]:
+    """Read events until the turn completes, returning (first audio time, done time, bytes received)."""
+    first_audio_at = None
+    received = 0
+    responses = 0
+    while True:
+        msg = await asyncio.wait_for(ws.receive(), timeout=30)
+        if msg.type != WSMsgType.TEXT:
+            raise RuntimeError(f"Unexpected message while waiting for turn to finish: {msg.type}")
+        received += len(msg.data)
+        event = json.loads(msg.data)
+        if event["type"] == "response.audio.delta" and first_audio_at is None:
+            first_audio_at = time.perf_counter()
+        elif event["type"] == done_type:
+            responses += 1
+            if responses == responses_expected:
+                return first_audio_at, time.perf_counter(), received
+
+
+async def run_realtime_conversation(http: aiohttp.ClientSession, url: str, conversation: dict, audio: list[bytes],
+                                    run: int, cursor: ScriptCursor, tool_timer: ToolTimer, chunk_size: int) -> list[TurnMeasurement]:
+    measurements = []
+    async with http.ws_connect(url) as ws:
+        await ws.send_json({"type": "session.update", "session": {"turn_detection": {"type": "none"}}})
+        await _receive_turn(ws, 1, "response.done")
+
+        for index, turn in enumerate(conversation["turns"]):
+            cursor.turn = turn
+            tool_timer.total_ms = 0.0
+            sent = 0
+            for chunk in _chunks(audio[index], chunk_size):
+                message = json.dumps({"type": "input_audio_buffer.append", "audio": base64.b64encode(chunk).decode("ascii")})
+                sent += len(message)
+                await ws.send_str(message)
+            await ws.send_str(json.dumps({"type": "input_audio_buffer.commit"}))
+            speech_ended_at = time.perf_counter()
+
+            # Tool turns produce a function-call response followed by the spoken reply.
+            first_audio_at, done_at, received = await _receive_turn(ws, 2 if turn["tool_calls"] else 1, "response.done")
+            measurements.append(TurnMeasurement(
+                pathway="realtime",
+                conversation=conversation["name"],
+                run=run,
+                turn=index + 1,
+                ttfa_ms=_ms(first_audio_at - speech_ended_at) if first_audio_at else None,
+                turn_ms=_ms(done_at - speech_ended_at),
+                tool_ms=round(tool_timer.total_ms, 2),
+                bytes_received=received,
+                bytes_sent=sent,
+            ))
+    return measurements
+
+
+async def run_cascaded_conversation(http: aiohttp.ClientSession, url: str, conversation: dict, audio: list[bytes],
+                                    run: int, cursor: ScriptCursor, chunk_size: int) -> list[TurnMeasurement]:
+    measurements = []
+    async with http.ws_connect(url) as ws:
+        for index, turn in enumerate(conversation["turns"]):
+            cursor.turn = turn
+            cursor.audio_bytes = len(audio[index])
+            for chunk in _chunks(audio[index], chunk_size):
+                await ws.send_bytes(chunk)
+            speech_ended_at = time.perf_counter()
+
+            first_audio_at, done_at, received = await _receive_turn(ws, 1, "response.done")
+            # Drain the timings event so its bytes count towards this turn.
+            received += len((await asyncio.wait_for(ws.receive(), timeout=30)).data)
+            measurements.append(TurnMeasurement(
+                pathway="cascaded",
+                conversation=conversation["name"],
+                run=run,
+                turn=index + 1,
+                ttfa_ms=_ms(first_audio_at - speech_ended_at) if first_audio_at else None,
+                turn_ms=_ms(done_at - speech_ended_at),
+                tool_ms=0.0,
+                bytes_received=received,
+                bytes_sent=len(audio[index]),
+            ))
+    return measurements
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(measurements: list[TurnMeasurement]) -> dict[str, dict[str, float]]:
+    summary = {}
+    for metric in METRICS:
+        values = [value for m in measurements if (value := getattr(m, metric)) is not None]
+        if not values:
+            continue
+        summary[metric] = {"count": len(values), "mean": round(statistics.fmean(values), 2), "max": max(values)}
+        for pct in PERCENTILES:
+            summary[metric][f"p{pct}"] = percentile(values, pct)
+    return summary
+
+
+def render_markdown(report: dict) -> str:
+    lines = ["# Realtime vs cascaded pipeline latency", ""]
+    lines.append(f"Script: `{report['script']}`, runs: {report['runs']}")
+    audio_input = report["audio_input"]
+    lines.append(f"Input audio: {audio_input['recorded']} recorded turns, {audio_input['synthesized']} synthesized tones")
+    for pathway, data in report["pathways"].items():
+        lines += ["", f"## {pathway} ({len(data['turns'])} turns)", ""]
+        header = ["metric", "mean"] + [f"p{pct}" for pct in PERCENTILES] + ["max"]
+        lines.append("| " + " | ".join(header) + " |")
+        lines.append("|" + "---|" * len(header))
+        for metric, stats in data["summary"].items():
+            row = [metric, stats["mean"]] + [stats[f"p{pct}"] for pct in PERCENTILES] + [stats["max"]]
+            lines.append("| " + " | ".join(str(value) for value in row) + " |")
+    lines.append("")
+    return "\n".join(lines)
+
+
+async def run_benchmark(script_path: Path, runs: int, pathways: list[str]) -> dict:
+    script = json.loads(script_path.read_text(encoding="utf-8"))
+    audio_config = script["audio"]
+    chunk_size = int(audio_config["sample_rate"] * audio_config["chunk_ms"] / 1000) * 2
+    audio: dict[str, list[bytes]] = {}
+    audio_input = {"recorded": 0, "synthesized": 0}
+    for conversation in script["conversations"]:
+        audio[conversation["name"]] = []
+        for turn in conversation["turns"]:
+            turn_audio, recorded = load_turn_audio(script_path.parent, turn, audio_config)
+            audio[conversation["name"]].append(turn_audio)
+            audio_input["recorded" if recorded else "synthesized"] += 1
+    cursor = ScriptCursor()
+    tool_timer = ToolTimer()
+    measurements: dict[str, list[TurnMeasurement]] = {pathway: [] for pathway in pathways}
+
+    realtime_standin = RealtimeStandIn(script["profiles"]["realtime"], audio_config, cursor)
+    upstream_app = web.Application()
+    upstream_app.router.add_get("/openai/realtime", realtime_standin.handler)
+    upstream_runner, upstream_url = await _start_app(upstream_app)
+
+    rtmt = RTMiddleTier(endpoint=upstream_url, deployment="benchmark", credentials=AzureKeyCredential("benchmark"))
+    rtmt.system_message = "benchmark"
+
+    async def search_standin(args):
+        await asyncio.sleep(script["profiles"]["realtime"]["search_ms"] / 1000)
+        return ToolResult(f"[menu]: results for {args['query']}", ToolResultDirection.TO_SERVER)
+
+    rtmt.tools["search"] = Tool(schema=search_tool_schema, target=tool_timer.wrap(search_standin))
+    rtmt.tools["update_order"] = Tool(schema=update_order_tool_schema, target=tool_timer.wrap(update_order))
+    rtmt.tools["get_order"] = Tool(schema=get_order_tool_schema, target=tool_timer.wrap(lambda _, session_id: get_order(session_id)))
+
+    cascaded_standin = CascadedStandIn(script["profiles"]["cascaded"], audio_config, cursor)
+    app = web.Application()
+    rtmt.attach_to_app(app, "/realtime")
+    app.router.add_get("/azurespeech/pipeline", cascaded_standin.handler)
+    app_runner, app_url = await _start_app(app)
+
+    try:
+        async with aiohttp.ClientSession() as http:
+            for run in range(1, runs + 1):
+                for conversation in script["conversations"]:
+                    turn_audio = audio[conversation["name"]]
+                    if "realtime" in measurements:
+                        measurements["realtime"] += await run_realtime_conversation(
+                            http, f"{app_url}/realtime", conversation, turn_audio, run, cursor, tool_timer, chunk_size)
+                    if "cascaded" in measurements:
+                        measurements["cascaded"] += await run_cascaded_conversation(
+                            http, f"{app_url}/azurespeech/pipeline", conversation, turn_audio, run, cursor, chunk_size)
+    finally:
+        await app_runner.cleanup()
+        await upstream_runner.cleanup()
+
+    return {
+        "script": script_path.name,
+        "runs": runs,
+        "audio_input": audio_input,
+        "profiles": script["profiles"],
+        "pathways": {
+            pathway: {"summary": summarize(turns), "turns": [asdict(turn) for turn in turns]}
+            for pathway, turns in measurements.items()
+        },
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--script", type=Path, default=DEFAULT_SCRIPT, help="Scripted conversation file")
+    parser.add_argument("--runs", type=int, default=3, help="Times to replay every conversation")
+    parser.add_argument("--pathways", default="realtime,cascaded", help="Comma separated pathways to benchmark")
+    parser.add_argument("--output-dir", type=Path, default=Path("benchmark_results"), help="Where reports are written")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args.script, args.runs, [p.strip() for p in args.pathways.split(",") if p.strip()]))
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    (args.output_dir / "pipeline_ab.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    markdown = render_markdown(report)
+    (args.output_dir / "pipeline_ab.md").write_text(markdown, encoding="utf-8")
+    print(markdown)
+    return report
+
+
+if __name__ == "__main__":
+    main()
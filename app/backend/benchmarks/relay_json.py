@@ -0,0 +1,158 @@
+"""Micro-benchmark of the relay's JSON handling on recorded realtime event payloads.
+
+Replays the events in ``fixtures/realtime_events.json`` through every installed JSON backend and reports,
+per event type, the time to decode and re-encode a frame, plus the relay cost of one ordering turn:
+
+* ``decode all``: every frame is decoded, as the relay did before event types were peeked,
+* ``peek``: only the events the relay inspects are decoded; audio and transcript deltas pass through.
+
+    python benchmarks/relay_json.py --iterations 500 --output-dir benchmark_results
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import json_codec
+from rtmt import CLIENT_EVENTS_HANDLED, UPSTREAM_EVENTS_HANDLED
+
+DEFAULT_EVENTS = Path(__file__).resolve().parent / "fixtures" / "realtime_events.json"
+
+
+def _audio(size: int) -> str:
+    # Deterministic bytes that do not compress, standing in for PCM16 audio.
+    blocks = (hashlib.sha256(i.to_bytes(4, "little")).digest() for i in range(size // 32 + 1))
+    return base64.b64encode(b"".join(blocks)[:size]).decode("ascii")
+
+
+def _expand(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"$audio"}:
+            return _audio(value["$audio"])
+        return {key: _expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+def load_frames(events_path: Path) -> list[dict[str, Any]]:
+    """Fixture events as the compact text frames the relay receives."""
+    spec = json.loads(events_path.read_text(encoding="utf-8"))
+    frames = []
+    for entry in spec["events"]:
+        event = _expand(entry["event"])
+        frames.append({
+            "type": event["type"],
+            "direction": entry["direction"],
+            "count": entry["count"],
+            "frame": json.dumps(event, separators=(",", ":")),
+        })
+    return frames
+
+
+def time_per_call(function: Callable[[], Any], iterations: int) -> float:
+    """Mean microseconds per call."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def _handled(frame: dict[str, Any]) -> bool:
+    handled = UPSTREAM_EVENTS_HANDLED if frame["direction"] == "upstream" else CLIENT_EVENTS_HANDLED
+    return frame["type"] in handled
+
+
+def run_benchmark(events_path: Path, iterations: int, backends: Optional[list[str]] = None) -> dict:
+    frames = load_frames(events_path)
+    results = []
+    for name in backends or json_codec.BACKENDS:
+        try:
+            _, dumps_bytes, loads = json_codec.load_backend(name)
+        except ImportError:
+            continue
+        per_event = []
+        decode_all_us = 0.0
+        peek_us = 0.0
+        for frame in frames:
+            data = frame["frame"]
+            decoded = loads(data)
+            decode = time_per_call(lambda: loads(data), iterations)
+            encode = time_per_call(lambda: dumps_bytes(decoded), iterations)
+            peek = time_per_call(lambda: json_codec.peek_type(data), iterations)
+            handled = _handled(frame)
+            decode_all_us += frame["count"] * (decode + (encode if handled else 0.0))
+            peek_us += frame["count"] * (peek + (decode + encode if handled else 0.0))
+            per_event.append({
+                "type": frame["type"],
+                "bytes": len(data),
+                "count": frame["count"],
+                "decode_us": round(decode, 2),
+                "encode_us": round(encode, 2),
+                "peek_us": round(peek, 3),
+            })
+        results.append({
+            "backend": name,
+            "turn_decode_all_us": round(decode_all_us, 1),
+            "turn_peek_us": round(peek_us, 1),
+            "events": per_event,
+        })
+    return {
+        "events": events_path.name,
+        "frames_per_turn": sum(frame["count"] for frame in frames),
+        "bytes_per_turn": sum(frame["count"] * len(frame["frame"]) for frame in frames),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def render_markdown(report: dict) -> str:
+    lines = ["# Relay JSON codec", ""]
+    lines.append(f"Events: `{report['events']}`, {report['frames_per_turn']} frames and "
+                 f"{report['bytes_per_turn']} bytes per turn, {report['iterations']} iterations")
+    lines.append("")
+    lines.append("| backend | turn, decode all (µs) | turn, peek (µs) |")
+    lines.append("|---|---|---|")
+    for result in report["results"]:
+        lines.append(f"| {result['backend']} | {result['turn_decode_all_us']} | {result['turn_peek_us']} |")
+    for result in report["results"]:
+        lines.extend(["", f"## {result['backend']}", ""])
+        lines.append("| event | bytes | per turn | decode µs | encode µs | peek µs |")
+        lines.append("|---|---|---|---|---|---|")
+        for event in result["events"]:
+            lines.append(f"| {event['type']} | {event['bytes']} | {event['count']} | {event['decode_us']} | "
+                         f"{event['encode_us']} | {event['peek_us']} |")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=Path, default=DEFAULT_EVENTS, help="Recorded realtime events")
+    parser.add_argument("--iterations", type=int, default=500, help="Calls timed per event and operation")
+    parser.add_argument("--backends", default=",".join(json_codec.BACKENDS), help="Comma separated: orjson, msgspec, stdlib")
+    parser.add_argument("--output-dir", type=Path, default=Path("benchmark_results"), help="Where reports are written")
+    args = parser.parse_args(argv)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if unknown := set(backends) - set(json_codec.BACKENDS):
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+    report = run_benchmark(args.events, args.iterations, backends)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    (args.output_dir / "relay_json.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    markdown = render_markdown(report)
+    (args.output_dir / "relay_json.md").write_text(markdown, encoding="utf-8")
+    print(markdown)
+    return report
+
+
+if __name__ == "__main__":
+    main()
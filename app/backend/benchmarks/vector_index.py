@@ -0,0 +1,242 @@
+"""Offline recall and latency comparison of vector index configurations for the menu index.
+
+Embeds the menu chunks that ``push_ingest.py`` would index and the queries in ``fixtures/menu_queries.json``
+with a deterministic hashed embedder, then scores every configuration against exact full-precision search:
+
+* reduced dimensions (truncate and re-normalize, as ``text-embedding-3`` does for ``dimensions``),
+* scalar (int8) and binary quantization, each with and without oversampled rescoring on the originals.
+
+    python benchmarks/vector_index.py --dimensions 3072,1024,256 --output-dir benchmark_results
+
+Recall@k is measured against the exact top-k, and hit@k checks the expected menu item. The hashed embedder
+is lexical, so absolute scores are not a prediction of production quality; the comparison between
+configurations on the same vectors is what picks the cheapest index that keeps the same answers.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from menu_catalog import load_menu_data
+from push_ingest import build_chunks, menu_documents
+
+DEFAULT_QUERIES = Path(__file__).resolve().parent / "fixtures" / "menu_queries.json"
+FULL_DIMENSIONS = 3072
+COMPRESSIONS = ("none", "scalar", "binary")
+
+
+@dataclass
+class ConfigResult:
+    name: str
+    dimensions: int
+    compression: str
+    oversampling: Optional[float]
+    recall_at_k: float
+    hit_at_k: float
+    query_p50_ms: float
+    query_p95_ms: float
+    bytes_per_vector: int
+    index_vector_bytes: int
+
+
+def hashed_embedding(text: str, dimensions: int = FULL_DIMENSIONS) -> list[float]:
+    """Deterministic signed feature hashing of words and character trigrams, L2-normalized."""
+    vector = [0.0] * dimensions
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    features = words + [f"#{word[i:i + 3]}" for word in words for i in range(max(1, len(word) - 2))]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    return normalize(vector)
+
+
+def normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def dot(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def top_k(scores: list[float], k: int) -> list[int]:
+    return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
+
+
+class ScalarQuantizedIndex:
+    """int8 codes over the corpus-wide value range, like Azure AI Search scalar quantization."""
+
+    def __init__(self, vectors: list[list[float]]):
+        self.low = min(min(vector) for vector in vectors)
+        high = max(max(vector) for vector in vectors)
+        self.scale = (high - self.low) / 255 or 1.0
+        self.codes = [[round((value - self.low) / self.scale) for value in vector] for vector in vectors]
+
+    def scores(self, query: list[float]) -> list[float]:
+        # Score against dequantized vectors: low + code * scale.
+        query_sum = sum(query)
+        return [self.low * query_sum + self.scale * dot(query, codes) for codes in self.codes]
+
+
+class BinaryQuantizedIndex:
+    """One sign bit per dimension, compared by Hamming distance."""
+
+    def __init__(self, vectors: list[list[float]]):
+        self.codes = [self.pack(vector) for vector in vectors]
+
+    @staticmethod
+    def pack(vector: list[float]) -> int:
+        bits = 0
+        for position, value in enumerate(vector):
+            if value > 0:
+                bits |= 1 << position
+        return bits
+
+    def scores(self, query: list[float]) -> list[float]:
+        query_bits = self.pack(query)
+        return [-float((query_bits ^ codes).bit_count()) for codes in self.codes]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def evaluate(
+    documents: list[list[float]],
+    queries: list[list[float]],
+    expected: list[Optional[set[int]]],
+    exact: list[list[int]],
+    dimensions: int,
+    compression: str,
+    oversampling: Optional[float],
+    k: int,
+) -> ConfigResult:
+    vectors = [normalize(vector[:dimensions]) for vector in documents]
+    index = None
+    bytes_per_vector = 4 * dimensions
+    if compression == "scalar":
+        index = ScalarQuantizedIndex(vectors)
+        bytes_per_vector = dimensions
+    elif compression == "binary":
+        index = BinaryQuantizedIndex(vectors)
+        bytes_per_vector = math.ceil(dimensions / 8)
+
+    recalls, hits, timings = [], [], []
+    for query_vector, relevant, exact_top in zip(queries, expected, exact):
+        query = normalize(query_vector[:dimensions])
+        started = time.perf_counter()
+        if index is None:
+            ranked = top_k([dot(query, vector) for vector in vectors], k)
+        else:
+            candidates = top_k(index.scores(query), math.ceil(k * (oversampling or 1)))
+            if oversampling:
+                # Rescore the oversampled candidates with the preserved full-precision vectors.
+                ranked = sorted(candidates, key=lambda i: dot(query, vectors[i]), reverse=True)[:k]
+            else:
+                ranked = candidates[:k]
+        timings.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(set(ranked) & set(exact_top)) / len(exact_top))
+        if relevant is not None:
+            hits.append(1.0 if relevant & set(ranked) else 0.0)
+
+    name = f"{dimensions}d {compression}" + (f" x{oversampling:g} rescore" if oversampling else "")
+    return ConfigResult(
+        name=name,
+        dimensions=dimensions,
+        compression=compression,
+        oversampling=oversampling,
+        recall_at_k=round(sum(recalls) / len(recalls), 4),
+        hit_at_k=round(sum(hits) / len(hits), 4) if hits else 0.0,
+        query_p50_ms=round(percentile(timings, 50), 4),
+        query_p95_ms=round(percentile(timings, 95), 4),
+        bytes_per_vector=bytes_per_vector,
+        index_vector_bytes=bytes_per_vector * len(documents),
+    )
+
+
+def run_benchmark(queries_path: Path, dimensions: list[int], compressions: list[str], oversampling: float, menu_data: Optional[dict] = None) -> dict:
+    spec = json.loads(queries_path.read_text(encoding="utf-8"))
+    k = spec.get("k", 3)
+    chunks = build_chunks(menu_documents(menu_data if menu_data is not None else load_menu_data()))
+    if not chunks:
+        raise RuntimeError("No menu chunks to index; check that menuItems.json can be found")
+
+    full_dimensions = max(dimensions)
+    documents = [hashed_embedding(f"{chunk['title']}\n{chunk['chunk']}", full_dimensions) for chunk in chunks]
+    queries = [hashed_embedding(entry["query"], full_dimensions) for entry in spec["queries"]]
+    expected = []
+    for entry in spec["queries"]:
+        matches = {i for i, chunk in enumerate(chunks) if chunk["title"] == entry.get("expected")}
+        expected.append(matches or None)
+    exact = [top_k([dot(query, vector) for vector in documents], k) for query in queries]
+
+    results = []
+    for dims in dimensions:
+        for compression in compressions:
+            results.append(evaluate(documents, queries, expected, exact, dims, compression, None, k))
+            if compression != "none":
+                results.append(evaluate(documents, queries, expected, exact, dims, compression, oversampling, k))
+
+    return {
+        "queries": queries_path.name,
+        "k": k,
+        "documents": len(chunks),
+        "baseline": f"{full_dimensions}d none",
+        "results": [asdict(result) for result in results],
+    }
+
+
+def render_markdown(report: dict) -> str:
+    lines = ["# Vector index configurations", ""]
+    lines.append(f"Queries: `{report['queries']}`, documents: {report['documents']}, k: {report['k']}, "
+                 f"recall against exact `{report['baseline']}`")
+    lines.append("")
+    header = ["config", "recall@k", "hit@k", "p50 ms", "p95 ms", "bytes/vector", "vector bytes"]
+    lines.append("| " + " | ".join(header) + " |")
+    lines.append("|" + "---|" * len(header))
+    for result in report["results"]:
+        row = [result["name"], result["recall_at_k"], result["hit_at_k"], result["query_p50_ms"],
+               result["query_p95_ms"], result["bytes_per_vector"], result["index_vector_bytes"]]
+        lines.append("| " + " | ".join(str(value) for value in row) + " |")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=Path, default=DEFAULT_QUERIES, help="Menu query set")
+    parser.add_argument("--dimensions", default="3072,1536,1024,512,256", help="Comma separated embedding sizes")
+    parser.add_argument("--compressions", default=",".join(COMPRESSIONS), help="Comma separated: none, scalar, binary")
+    parser.add_argument("--oversampling", type=float, default=4.0, help="Oversampling factor used when rescoring")
+    parser.add_argument("--output-dir", type=Path, default=Path("benchmark_results"), help="Where reports are written")
+    args = parser.parse_args(argv)
+
+    compressions = [c.strip() for c in args.compressions.split(",") if c.strip()]
+    if unknown := set(compressions) - set(COMPRESSIONS):
+        parser.error(f"unknown compressions: {', '.join(sorted(unknown))}")
+    dimensions = sorted({int(d) for d in args.dimensions.split(",") if d.strip()}, reverse=True)
+    report = run_benchmark(args.queries, dimensions, compressions, args.oversampling)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    (args.output_dir / "vector_index.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    markdown = render_markdown(report)
+    (args.output_dir / "vector_index.md").write_text(markdown, encoding="utf-8")
+    print(markdown)
+    return report
+
+
+if __name__ == "__main__":
+    main()
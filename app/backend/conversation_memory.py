@@ -0,0 +1,77 @@
+import json
+import math
+from collections import deque
+
+from models import OrderSummary
+
+# Rough chat-format overhead per message (role and separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting, not billing."""
+    return math.ceil(len(text) / 4)
+
+
+def estimate_message_tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def format_order_state(order_summary: OrderSummary) -> str:
+    """Compact JSON view of the order for the model; no display strings or derived tax fields."""
+    state = {
+        "items": [
+            {"item": item.item, "size": item.size, "qty": item.quantity, "price": item.price}
+            for item in order_summary.items
+        ],
+        "total": round(order_summary.finalTotal, 2),
+    }
+    return "Current order state: " + json.dumps(state, separators=(",", ":"))
+
+
+class ConversationMemory:
+    """Per-session chat history for the cascaded pathway.
+
+    Messages are laid out as ``prefix + history + latest utterance``. The prefix (system
+    message and menu) is built once and never changes, so provider-side prompt caching keeps hitting it.
+    History is a rolling window of recent turns under ``max_history_tokens``; when it overflows, the
+    oldest turns are evicted down to ``low_water`` of the budget in one go so the cached history prefix
+    stays stable for several turns instead of shifting on every one.
+    """
+
+    def __init__(self, prefix_messages: list[dict], max_history_tokens: int = 1500, low_water: float = 0.6):
+        self.prefix_messages = prefix_messages
+        self.max_history_tokens = max_history_tokens
+        self.low_water = low_water
+        self._turns: deque[tuple[dict, dict, int]] = deque()
+        self._history_tokens = 0
+
+    @property
+    def history_tokens(self) -> int:
+        return self._history_tokens
+
+    @property
+    def turn_count(self) -> int:
+        return len(self._turns)
+
+    def build_messages(self, user_text: str) -> list[dict]:
+        messages = list(self.prefix_messages)
+        for user_message, assistant_message, _ in self._turns:
+            messages.append(user_message)
+            messages.append(assistant_message)
+        messages.append({"role": "user", "content": user_text})
+        return messages
+
+    def add_turn(self, user_text: str, assistant_text: str) -> None:
+        user_message = {"role": "user", "content": user_text}
+        assistant_message = {"role": "assistant", "content": assistant_text}
+        tokens = estimate_message_tokens([user_message, assistant_message])
+        self._turns.append((user_message, assistant_message, tokens))
+        self._history_tokens += tokens
+
+        if self._history_tokens > self.max_history_tokens:
+            target = self.max_history_tokens * self.low_water
+            # Always keep the latest turn, even if it alone exceeds the budget.
+            while len(self._turns) > 1 and self._history_tokens > target:
+                _, _, evicted = self._turns.popleft()
+                self._history_tokens -= evicted
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
+
+from aiohttp import web
+
+import json_codec
+from order_state import OrderEvent
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ("drop_newest", "drop_oldest")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    session_token TEXT,
+    round_trip_token TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_session ON events (session_token, id);
+"""
+
+
+class SqliteEventSink:
+    """Transcripts, tool calls and order changes for quality review, written to SQLite off the event loop.
+
+    ``emit`` only appends to a bounded in-memory buffer. A background task drains it in batches of up to
+    ``batch_size`` (or whatever arrived within ``flush_interval``) and commits each batch as one transaction
+    on a dedicated writer thread, with the database in WAL mode. When the writer falls behind and the buffer
+    is full, ``drop_newest`` rejects new events and ``drop_oldest`` evicts the oldest queued ones; either
+    way the relay never waits for the disk.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_queue: int = 10_000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        drop_policy: str = "drop_newest",
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {drop_policy!r}; expected one of {', '.join(DROP_POLICIES)}")
+        self.path = Path(path)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self._buffer: deque[tuple[float, str, Optional[str], Optional[str], str]] = deque()
+        self._wake = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-sink")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self.emitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+
+    def emit(self, kind: str, session_token: Optional[str], round_trip_token: Optional[str], payload: dict[str, Any]) -> bool:
+        """Queue an event without blocking; returns False if it was dropped."""
+        if len(self._buffer) >= self.max_queue:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Event sink is behind (%d queued); %d events dropped so far", len(self._buffer), self.dropped)
+            if self.drop_policy == "drop_newest":
+                return False
+            self._buffer.popleft()
+        self._buffer.append((time.time(), kind, session_token, round_trip_token, json_codec.dumps(payload)))
+        self.emitted += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def record_order_event(self, event: OrderEvent) -> None:
+        """``OrderState`` listener."""
+        self.emit(event.type, event.session_token, event.round_trip_token, event.payload)
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL only fsyncs at checkpoints; a power cut can lose the last commits.
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        self._connection = connection
+
+    def _write(self, batch: list[tuple]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO events (recorded_at, kind, session_token, round_trip_token, payload) VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+
+    async def _flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self._write, batch)
+            except sqlite3.Error:
+                self.write_errors += 1
+                self.dropped += len(batch)
+                logger.exception("Failed to write %d events", len(batch))
+                return
+            self.last_commit_ms = (time.perf_counter() - started) * 1000
+            self.max_commit_ms = max(self.max_commit_ms, self.last_commit_ms)
+            self.written += len(batch)
+            self.batches += 1
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush()
+
+    async def start(self, app: Optional[web.Application] = None) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self, app: Optional[web.Application] = None) -> None:
+        """Write what is still queued and close the database."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._connection is not None:
+            await self._flush()
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "queued": len(self._buffer),
+            "emitted": self.emitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "writeErrors": self.write_errors,
+            "lastCommitMs": round(self.last_commit_ms, 2),
+            "maxCommitMs": round(self.max_commit_ms, 2),
+        }
+
+    async def _metrics_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.metrics())
+
+    def attach_to_app(self, app: web.Application, path: str = "/event-sink") -> None:
+        app.router.add_get(path, self._metrics_handler)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.close)
+
+
+def create_event_sink() -> Optional[SqliteEventSink]:
+    """A sink writing to ``EVENT_SINK_PATH``, or None when it is not set."""
+    if not (path := os.environ.get("EVENT_SINK_PATH")):
+        return None
+    logger.info("Recording conversation and order events to %s", path)
+    return SqliteEventSink(
+        path,
+        max_queue=int(os.environ.get("EVENT_SINK_QUEUE_SIZE", 10_000)),
+        batch_size=int(os.environ.get("EVENT_SINK_BATCH_SIZE", 200)),
+        flush_interval=float(os.environ.get("EVENT_SINK_FLUSH_MS", 500)) / 1000,
+        drop_policy=os.environ.get("EVENT_SINK_DROP_POLICY", "drop_newest"),
+    )
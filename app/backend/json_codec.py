@@ -0,0 +1,106 @@
+"""JSON encoding and decoding for the relay, using the fastest library available.
+
+orjson is used when installed, then msgspec, then the standard library. ``JSON_CODEC`` (``orjson``, ``msgspec``
+or ``stdlib``) pins a backend. All backends produce compact JSON; ``loads`` accepts ``str`` or ``bytes``.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("orjson", "msgspec", "stdlib")
+
+# Realtime events are serialized with "type" as their first key, so the event type can be read without
+# decoding a frame that is mostly base64 audio.
+_TYPE_PREFIX = '{"type":"'
+_TYPE_START = len(_TYPE_PREFIX)
+_TYPE_PEEK_LIMIT = 128
+
+
+def _stdlib() -> tuple[Callable[[Any], bytes], Callable[[str | bytes], Any]]:
+    encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+    return (lambda obj: encoder.encode(obj).encode("utf-8")), json.loads
+
+
+def _orjson() -> tuple[Callable[[Any], bytes], Callable[[str | bytes], Any]]:
+    import orjson
+
+    return orjson.dumps, orjson.loads
+
+
+def _msgspec() -> tuple[Callable[[Any], bytes], Callable[[str | bytes], Any]]:
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return encoder.encode, decoder.decode
+
+
+_LOADERS = {"orjson": _orjson, "msgspec": _msgspec, "stdlib": _stdlib}
+
+
+def load_backend(name: Optional[str] = None) -> tuple[str, Callable[[Any], bytes], Callable[[str | bytes], Any]]:
+    """Return ``(name, dumps_bytes, loads)`` for ``name``, or for the first installed backend."""
+    if name is not None:
+        if name not in _LOADERS:
+            raise ValueError(f"Unknown JSON codec {name!r}; expected one of {', '.join(BACKENDS)}")
+        return (name, *_LOADERS[name]())
+    for candidate in BACKENDS:
+        try:
+            return (candidate, *_LOADERS[candidate]())
+        except ImportError:
+            continue
+    raise RuntimeError("unreachable: the stdlib codec is always available")
+
+
+backend, dumps_bytes, loads = load_backend(os.environ.get("JSON_CODEC") or None)
+logger.debug("Using %s for JSON", backend)
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text, for aiohttp's ``send_str``/``send_json(dumps=...)`` which need ``str``."""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def peek_type(data: str | bytes) -> Optional[str]:
+    """The event ``type`` if it is the frame's first key, otherwise None (the caller must decode)."""
+    if isinstance(data, bytes):
+        data = data[:_TYPE_PEEK_LIMIT].decode("utf-8", errors="ignore")
+    if not data.startswith(_TYPE_PREFIX):
+        return None
+    end = data.find('"', _TYPE_START, _TYPE_PEEK_LIMIT)
+    if end == -1 or data.find("\\", _TYPE_START, end) != -1:
+        return None
+    return data[_TYPE_START:end]
+
+
+def peek_value_span(data: str, key: str) -> Optional[tuple[int, int]]:
+    """Where the raw value of ``key`` sits in a compact frame, without decoding it: the contents between the
+    quotes of a string (still JSON-escaped) or the text of a number. None if the key is absent.
+
+    Meant for the flat realtime delta events; a quoted key followed by a colon cannot occur inside a string
+    value, but a key of the same name in a nested object would be found too.
+    """
+    marker = f'"{key}":'
+    index = data.find(marker)
+    if index == -1:
+        return None
+    start = index + len(marker)
+    if not data.startswith('"', start):
+        end = start
+        while end < len(data) and data[end] not in ",}":
+            end += 1
+        return start, end
+    start += 1
+    end = start
+    while (end := data.find('"', end)) != -1:
+        backslashes = 0
+        while data[end - 1 - backslashes] == "\\":
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return start, end
+        end += 1
+    return None
@@ -0,0 +1,214 @@
+import difflib
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _candidate_menu_paths() -> list[Path]:
+    env_override = (
+        os.environ.get("DUNKIN_MENU_ITEMS_PATH")
+        or os.environ.get("MENU_ITEMS_PATH")
+    )
+
+    candidate_paths = []
+    if env_override:
+        candidate_paths.append(Path(env_override))
+
+    # Preferred: keep backend self-contained (Docker image can copy this in).
+    candidate_paths.append(Path(__file__).resolve().parent / "data" / "menuItems.json")
+
+    # Fallback: repo layout (local dev).
+    candidate_paths.append(Path(__file__).resolve().parent.parent / "frontend" / "src" / "data" / "menuItems.json")
+    return candidate_paths
+
+
+def load_menu_data() -> dict[str, Any]:
+    """Load ``menuItems.json``, returning an empty menu when it is missing or unreadable."""
+    menu_path = next((path for path in _candidate_menu_paths() if path.exists()), None)
+    if menu_path is None:
+        return {}
+    try:
+        with menu_path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as exc:  # pragma: no cover - defensive fallback
+        logger.warning("Failed to load menu items from %s: %s", menu_path, exc)
+        return {}
+
+
+def format_menu_prompt(menu_data: dict[str, Any]) -> str:
+    """Render the menu as compact, deterministic prompt text (same input, same bytes)."""
+    lines = []
+    for category_entry in menu_data.get("menuItems", []):
+        items = []
+        for item in category_entry.get("items", []):
+            sizes = ", ".join(
+                f"{size['size']} ${size['price']:.2f}" for size in item.get("sizes", []) if "price" in size
+            )
+            items.append(f"{item['name']} ({sizes})" if sizes else item["name"])
+        if items:
+            lines.append(f"{category_entry.get('category', 'Menu')}: {'; '.join(items)}")
+    return "\n".join(lines)
+
+
+# What guests say for items whose menu names they rarely say in full. Items can add their own through an
+# "aliases" list in menuItems.json.
+DEFAULT_ALIASES = {
+    "munchkins": "MUNCHKINS® Donut Hole Treats (10 ct)",
+    "donut holes": "MUNCHKINS® Donut Hole Treats (10 ct)",
+    "boston cream donut": "Boston Kreme Donut",
+    "boston cream": "Boston Kreme Donut",
+    "glazed": "Glazed Donut",
+    "cold brew": "Original Cold Brew",
+    "dragonfruit refresher": "Strawberry Dragonfruit Refresher",
+    "strawberry refresher": "Strawberry Dragonfruit Refresher",
+    "bacon egg and cheese": "Bacon Egg & Cheese on Croissant",
+    "wake up wrap": "Turkey Sausage Wake-Up Wrap",
+    "everything bagel": "Everything Bagel & Cream Cheese",
+    "flavor swirl": "Flavor Swirl Add-On",
+    "espresso shot": "Extra Espresso Shot",
+    "extra shot": "Extra Espresso Shot",
+    "whip": "Whipped Cream",
+}
+
+SIZE_ALIASES = {
+    "s": "small", "sm": "small", "kids": "small",
+    "m": "medium", "med": "medium", "regular": "medium",
+    "l": "large", "lg": "large",
+    "": "standard", "n/a": "standard", "na": "standard", "none": "standard", "one size": "standard",
+}
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("&", " and ")
+    text = re.sub(r"\(.*?\)|[®™]", " ", text)
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def _stems(text: str) -> set[str]:
+    """Content words of ``text`` with plural "s" dropped, for loose overlap between questions and names."""
+    return {word[:-1] if word.endswith("s") and len(word) > 4 else word for word in _normalize(text).split() if len(word) > 3}
+
+
+@dataclass(frozen=True)
+class MenuEntry:
+    name: str
+    category: str
+    prices: dict[str, float] = field(default_factory=dict)
+    description: str = ""
+
+
+@dataclass(frozen=True)
+class MenuMatch:
+    """A menu item resolved from what the model asked for. ``size`` and ``price`` are None when the
+    requested size isn't one the item comes in."""
+    name: str
+    category: str
+    size: Optional[str]
+    price: Optional[float]
+    score: float
+
+
+class MenuCatalog:
+    """In-memory index of ``menuItems.json`` for turning spoken item names and sizes into menu entries.
+
+    Names are matched exactly after normalization, then by alias, and finally by a near-exact spelling: the
+    same number of words, at most one of them misspelled (each at least ``min_score`` similar). Anything
+    looser, or a spelling close to more than one item, stays unresolved so the model asks the guest.
+    """
+
+    def __init__(self, menu_data: dict[str, Any], aliases: Optional[dict[str, str]] = None, min_score: float = 0.8):
+        self.min_score = min_score
+        self.entries: dict[str, MenuEntry] = {}
+        self._keys: dict[str, str] = {}
+        for category_entry in menu_data.get("menuItems", []):
+            category = category_entry.get("category", "").strip().lower()
+            for item in category_entry.get("items", []):
+                if not (name := item.get("name")):
+                    continue
+                prices = {size["size"].lower(): float(size["price"]) for size in item.get("sizes", []) if "price" in size}
+                self.entries[name] = MenuEntry(name, category, prices, item.get("description", ""))
+                self._keys[_normalize(name)] = name
+                for alias in item.get("aliases", []):
+                    self._keys.setdefault(_normalize(alias), name)
+        for alias, name in (DEFAULT_ALIASES if aliases is None else aliases).items():
+            if name in self.entries:
+                self._keys.setdefault(_normalize(alias), name)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _find(self, item_name: str) -> tuple[Optional[str], float]:
+        key = _normalize(item_name)
+        if not key:
+            return None, 0.0
+        if key in self._keys:
+            return self._keys[key], 1.0
+        close = {}
+        for candidate, name in self._keys.items():
+            if (score := self._near_exact(key, candidate)) is not None:
+                close[name] = max(score, close.get(name, 0.0))
+        if len(close) == 1:
+            return close.popitem()
+        return None, 0.0
+
+    def _near_exact(self, key: str, candidate: str) -> Optional[float]:
+        """Similarity of two names that differ only by a misspelling of one word, else None."""
+        words, candidate_words = key.split(), candidate.split()
+        if len(words) != len(candidate_words):
+            return None
+        misspelled = [(word, other) for word, other in zip(words, candidate_words) if word != other]
+        if len(misspelled) != 1:
+            return None
+        word, other = misspelled[0]
+        if min(len(word), len(other)) < 4 or word.isdigit() or other.isdigit():
+            return None
+        if difflib.SequenceMatcher(None, word, other).ratio() < self.min_score:
+            return None
+        return difflib.SequenceMatcher(None, key, candidate).ratio()
+
+    def resolve(self, item_name: str, size: str = "") -> Optional[MenuMatch]:
+        """Resolve a requested item and size, or None if the item isn't on the menu."""
+        name, score = self._find(item_name)
+        if name is None:
+            return None
+        entry = self.entries[name]
+        requested = (size or "").strip().lower()
+        requested = SIZE_ALIASES.get(requested, requested)
+        if requested not in entry.prices and len(entry.prices) == 1:
+            # Single-size items ignore whatever size was asked for.
+            requested = next(iter(entry.prices))
+        price = entry.prices.get(requested)
+        return MenuMatch(name, entry.category, requested if price is not None else None, price, round(score, 3))
+
+    def category(self, item_name: str) -> str:
+        match = self.resolve(item_name)
+        return match.category if match else ""
+
+    def lookup(self, query: str, limit: int = 5) -> list[MenuEntry]:
+        """Entries for a free-text question: the item it names, else those sharing the most words with it."""
+        name, _ = self._find(query)
+        if name is not None:
+            return [self.entries[name]]
+        words = _stems(query)
+        scored = []
+        for entry in self.entries.values():
+            overlap = len(words & _stems(f"{entry.name} {entry.category}"))
+            if overlap:
+                scored.append((overlap, entry))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [entry for _, entry in scored[:limit]]
+
+
+@lru_cache(maxsize=1)
+def default_catalog() -> MenuCatalog:
+    """The catalog for ``menuItems.json``, built on first use."""
+    catalog = MenuCatalog(load_menu_data())
+    logger.info("Indexed %d menu items", len(catalog))
+    return catalog
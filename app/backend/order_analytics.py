@@ -0,0 +1,190 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from aiohttp import web
+
+from order_state import OrderEvent
+
+WINDOW_FIELDS = (
+    "sessions_started",
+    "orders_completed",
+    "orders_abandoned",
+    "orders_with_extras",
+    "items_sold",
+    "revenue",
+)
+
+
+class RollingCounters:
+    """Sums over a sliding window kept as a ring of fixed-width time buckets.
+
+    Totals for the whole window are maintained incrementally: a bucket's values are subtracted when it falls
+    out of the window, so reading the totals costs the same however much traffic the window saw.
+    """
+
+    def __init__(self, fields: tuple[str, ...], bucket_seconds: float, buckets: int, clock: Callable[[], float]):
+        self.fields = fields
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self._clock = clock
+        self._index = {name: position for position, name in enumerate(fields)}
+        self._slots = [[0.0] * len(fields) for _ in range(buckets)]
+        self._totals = [0.0] * len(fields)
+        self._head = int(clock() // bucket_seconds)
+        self.started_at = clock()
+
+    def _advance(self) -> None:
+        epoch = int(self._clock() // self.bucket_seconds)
+        if epoch - self._head >= self.buckets:
+            self._slots = [[0.0] * len(self.fields) for _ in range(self.buckets)]
+            self._totals = [0.0] * len(self.fields)
+            self._head = epoch
+            return
+        while self._head < epoch:
+            self._head += 1
+            slot = self._slots[self._head % self.buckets]
+            for position, value in enumerate(slot):
+                self._totals[position] -= value
+                slot[position] = 0.0
+
+    def add(self, field: str, value: float = 1.0) -> None:
+        self._advance()
+        position = self._index[field]
+        self._slots[self._head % self.buckets][position] += value
+        self._totals[position] += value
+
+    def totals(self) -> dict[str, float]:
+        self._advance()
+        return dict(zip(self.fields, self._totals))
+
+    def covered_seconds(self) -> float:
+        """Length of the window that has actually been observed, for rates shortly after startup."""
+        return max(self.bucket_seconds, min(self.bucket_seconds * self.buckets, self._clock() - self.started_at))
+
+
+class SpaceSavingTopK:
+    """Approximate heavy hitters in ``capacity`` counters (Metwally et al., Space-Saving).
+
+    Any item with a true count above total/capacity is guaranteed to be tracked; each reported count
+    overestimates by at most the ``error`` returned with it.
+    """
+
+    def __init__(self, capacity: int = 50):
+        self.capacity = capacity
+        self._counts: dict[str, float] = {}
+        self._errors: dict[str, float] = {}
+
+    def add(self, item: str, weight: float = 1.0) -> None:
+        if item in self._counts:
+            self._counts[item] += weight
+        elif len(self._counts) < self.capacity:
+            self._counts[item] = weight
+            self._errors[item] = 0.0
+        else:
+            evicted = min(self._counts, key=self._counts.__getitem__)
+            floor = self._counts.pop(evicted)
+            del self._errors[evicted]
+            self._counts[item] = floor + weight
+            self._errors[item] = floor
+
+    def top(self, k: int) -> list[dict[str, Any]]:
+        ranked = sorted(self._counts.items(), key=lambda entry: entry[1], reverse=True)[:k]
+        return [{"item": item, "count": count, "error": self._errors[item]} for item, count in ranked]
+
+
+@dataclass
+class _LiveOrder:
+    extras: int = 0
+    reviewed: bool = False
+
+
+class OrderAnalytics:
+    """Live order aggregates across sessions, fed by ``OrderState`` events.
+
+    An order that ends with items after it was read back to the guest (``get_order``) counts as completed;
+    one that ends with unreviewed changes counts as abandoned. Sessions handed to another worker are not
+    counted here, since they carry on there. Top items are counted from the final items of completed orders
+    since the worker started, so items removed or replaced along the way do not count.
+    """
+
+    def __init__(
+        self,
+        is_extra: Callable[[str], bool] = lambda item: False,
+        bucket_seconds: float = 60.0,
+        window_buckets: int = 60,
+        top_k: int = 10,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.is_extra = is_extra
+        self.top_k = top_k
+        self.window = RollingCounters(WINDOW_FIELDS, bucket_seconds, window_buckets, clock)
+        self.top_items = SpaceSavingTopK(capacity=max(50, top_k * 5))
+        self._live: dict[str, _LiveOrder] = {}
+
+    def record(self, event: OrderEvent) -> None:
+        """``OrderState`` listener."""
+        match event.type:
+            case "session_created":
+                self._live[event.session_id] = _LiveOrder()
+                self.window.add("sessions_started")
+            case "session_restored":
+                self._live[event.session_id] = _LiveOrder()
+            case "order_updated":
+                live = self._live.setdefault(event.session_id, _LiveOrder())
+                live.reviewed = False
+                if self.is_extra(event.payload["item"]):
+                    change = event.payload["quantity"] if event.payload["action"] == "add" else -event.payload["quantity"]
+                    live.extras = max(0, live.extras + change)
+            case "order_reviewed":
+                self._live.setdefault(event.session_id, _LiveOrder()).reviewed = True
+            case "session_ended":
+                live = self._live.pop(event.session_id, _LiveOrder())
+                if event.payload.get("handed_off") or not event.payload.get("item_count"):
+                    return
+                if not live.reviewed:
+                    self.window.add("orders_abandoned")
+                    return
+                self.window.add("orders_completed")
+                self.window.add("items_sold", event.payload["item_count"])
+                self.window.add("revenue", event.payload["final_total"])
+                if live.extras:
+                    self.window.add("orders_with_extras")
+                for item, quantity in event.payload.get("items", {}).items():
+                    self.top_items.add(item, quantity)
+
+    def snapshot(self) -> dict[str, Any]:
+        totals = self.window.totals()
+        completed = totals["orders_completed"]
+        ended_with_items = completed + totals["orders_abandoned"]
+        hours = self.window.covered_seconds() / 3600
+        return {
+            "windowMinutes": self.window.bucket_seconds * self.window.buckets / 60,
+            "activeSessions": len(self._live),
+            "sessionsStarted": int(totals["sessions_started"]),
+            "ordersCompleted": int(completed),
+            "ordersAbandoned": int(totals["orders_abandoned"]),
+            "abandonRate": round(totals["orders_abandoned"] / ended_with_items, 4) if ended_with_items else None,
+            "itemsPerHour": round(totals["items_sold"] / hours, 2),
+            "averageTicket": round(totals["revenue"] / completed, 2) if completed else None,
+            "extrasAttachRate": round(totals["orders_with_extras"] / completed, 4) if completed else None,
+            "topItems": self.top_items.top(self.top_k),
+        }
+
+    async def _analytics_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot())
+
+    def attach_to_app(self, app: web.Application, path: str = "/analytics") -> None:
+        app.router.add_get(path, self._analytics_handler)
+
+
+def create_order_analytics(is_extra: Optional[Callable[[str], bool]] = None) -> OrderAnalytics:
+    bucket_seconds = float(os.environ.get("ANALYTICS_BUCKET_SECONDS", 60))
+    window_minutes = float(os.environ.get("ANALYTICS_WINDOW_MINUTES", 60))
+    return OrderAnalytics(
+        is_extra=is_extra or (lambda item: False),
+        bucket_seconds=bucket_seconds,
+        window_buckets=max(1, round(window_minutes * 60 / bucket_seconds)),
+        top_k=int(os.environ.get("ANALYTICS_TOP_ITEMS", 10)),
+    )
@@ -1,7 +1,7 @@
 import logging
 import uuid
-from dataclasses import dataclass
-from typing import List, Dict
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Dict
 
 from models import OrderItem, OrderSummary
 
@@ -15,6 +15,15 @@ class SessionIdentifiers:
     round_trip_token: str
 
 
+@dataclass
+class OrderEvent:
+    type: str  # session_created, session_restored, order_updated, order_reviewed or session_ended
+    session_id: str
+    session_token: str
+    round_trip_token: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
 class OrderState:
     _instance = None
 
@@ -22,15 +31,35 @@ class OrderState:
         if cls._instance is None:
             cls._instance = super(OrderState, cls).__new__(cls)
             cls._instance.sessions = {}
+            cls._instance.listeners = []
         return cls._instance
 
+    def add_listener(self, listener: Callable[[OrderEvent], None]) -> None:
+        """Call ``listener`` on the event loop for every session and order change; it must not block."""
+        self.listeners.append(listener)
+
+    def _notify(self, event_type: str, session_id: str, payload: Dict[str, Any]) -> None:
+        if not self.listeners:
+            return
+        session = self.sessions[session_id]
+        event = OrderEvent(event_type, session_id, session["session_token"], session["round_trip_token"], payload)
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Order event listener failed for %s", event_type)
+
+    def _totals(self, session_id: str) -> Dict[str, Any]:
+        summary = self.sessions[session_id]["order_summary"]
+        return {"item_count": sum(item.quantity for item in summary.items), "total": summary.total, "final_total": summary.finalTotal}
+
     def _update_summary(self, session_id: str):
         session = self.sessions[session_id]
         total = sum(item.price * item.quantity for item in session["order_state"])
         tax = total * 0.08  # 8% tax
         finalTotal = total + tax
         session["order_summary"] = OrderSummary(items=session["order_state"], total=total, tax=tax, finalTotal=finalTotal)
-        logger.info(f"Order Summary Updated for session {session_id}: {session['order_summary']}")
+        logger.debug("Order summary updated for session %s: %s", session_id, session["order_summary"])
 
     def create_session(self) -> str:
         session_id = str(uuid.uuid4())
@@ -43,20 +72,50 @@ class OrderState:
             "round_trip_token": self._format_round_trip_token(session_token, 0)
         }
         self._update_summary(session_id)
-        logger.info(f"Session created with ID {session_id}")
+        logger.info("Session created with ID %s", session_id)
+        self._notify("session_created", session_id, {})
         return session_id
 
-    def delete_session(self, session_id: str) -> None:
+    def snapshot_session(self, session_id: str) -> Dict:
+        """Serializable copy of the session's order, for handing it to another worker."""
+        session = self.sessions[session_id]
+        return {
+            "session_token": session["session_token"],
+            "round_trip_index": session["round_trip_index"],
+            "items": [item.model_dump() for item in session["order_state"]],
+        }
+
+    def restore_session(self, snapshot: Dict) -> str:
+        """Create a session from ``snapshot_session`` output, keeping its session token and round trips."""
+        session_id = str(uuid.uuid4())
+        session_token = snapshot["session_token"]
+        round_trip_index = snapshot.get("round_trip_index", 0)
+        self.sessions[session_id] = {
+            "order_state": [OrderItem(**item) for item in snapshot.get("items", [])],
+            "session_token": session_token,
+            "round_trip_index": round_trip_index,
+            "round_trip_token": self._format_round_trip_token(session_token, round_trip_index)
+        }
+        self._update_summary(session_id)
+        logger.info("Session restored with ID %s", session_id)
+        self._notify("session_restored", session_id, self._totals(session_id))
+        return session_id
+
+    def delete_session(self, session_id: str, handed_off: bool = False) -> None:
         if session_id in self.sessions:
+            items: Dict[str, int] = {}
+            for order_item in self.sessions[session_id]["order_state"]:
+                items[order_item.item] = items.get(order_item.item, 0) + order_item.quantity
+            self._notify("session_ended", session_id, {**self._totals(session_id), "items": items, "handed_off": handed_off})
             del self.sessions[session_id]
             logger.info("Session deleted with ID %s", session_id)
 
     def _format_round_trip_token(self, session_token: str, round_trip_index: int) -> str:
         return f"{session_token}-{round_trip_index:04d}"
 
-    def handle_order_update(self, session_id: str, action: str, item_name: str, size: str, quantity: int, price: float):
-        session = self.sessions[session_id]
-        order_state = session["order_state"]
+    def _apply_update(self, session_id: str, order_state: List[OrderItem], action: str, item_name: str, size: str, quantity: int, price: float) -> None:
+        if action not in {"add", "remove"}:
+            raise ValueError(f"Unknown order action {action!r}")
 
         normalized_size = (size or "").strip().lower()
         if normalized_size in {"", "standard", "n/a", "na", "none", "n.a."}:
@@ -75,24 +134,66 @@ class OrderState:
         if action == "add":
             if existing_item_index != -1:
                 order_state[existing_item_index].quantity += quantity
-                logger.info(f"Updated quantity for {display} in session {session_id}")
+                logger.info("Updated quantity for %s in session %s", display, session_id)
             else:
                 order_state.append(OrderItem(item=item_name, size=size, quantity=quantity, price=price, display=display))
-                logger.info(f"Added {display} to session {session_id}")
+                logger.info("Added %s to session %s", display, session_id)
         elif action == "remove":
             if existing_item_index != -1:
                 if order_state[existing_item_index].quantity > quantity:
                     order_state[existing_item_index].quantity -= quantity
-                    logger.info(f"Decreased quantity for {display} in session {session_id}")
+                    logger.info("Decreased quantity for %s in session %s", display, session_id)
                 else:
                     order_state.pop(existing_item_index)
-                    logger.info(f"Removed {display} from session {session_id}")
+                    logger.info("Removed %s from session %s", display, session_id)
+
+    def _notify_update(self, session_id: str, action: str, item_name: str, size: str, quantity: int, price: float) -> None:
+        self._notify("order_updated", session_id, {
+            "action": action,
+            "item": item_name,
+            "size": size,
+            "quantity": quantity,
+            "price": price,
+            **self._totals(session_id),
+        })
+
+    def handle_order_update(self, session_id: str, action: str, item_name: str, size: str, quantity: int, price: float):
+        session = self.sessions[session_id]
+        self._apply_update(session_id, session["order_state"], action, item_name, size, quantity, price)
+        self._update_summary(session_id)
+        self._notify_update(session_id, action, item_name, size, quantity, price)
+
+    def handle_order_batch(self, session_id: str, operations: List[Dict]) -> None:
+        """Apply several add/remove operations as one change.
 
+        The operations run against a copy of the order, which replaces it only once all of them have been
+        applied, so a failing operation leaves the order untouched. Each operation is still published as its
+        own order_updated event.
+        """
+        session = self.sessions[session_id]
+        draft = [item.model_copy() for item in session["order_state"]]
+        for operation in operations:
+            self._apply_update(
+                session_id, draft, operation["action"], operation["item_name"], operation.get("size", ""),
+                operation.get("quantity", 0), operation.get("price", 0.0),
+            )
+        session["order_state"] = draft
         self._update_summary(session_id)
+        for operation in operations:
+            self._notify_update(
+                session_id, operation["action"], operation["item_name"], operation.get("size", ""),
+                operation.get("quantity", 0), operation.get("price", 0.0),
+            )
 
     def get_order_summary(self, session_id: str) -> OrderSummary:
         order_summary = self.sessions[session_id]["order_summary"]
-        logger.info(f"Order Summary Retrieved for session {session_id}: {order_summary}")
+        logger.debug("Order summary retrieved for session %s: %s", session_id, order_summary)
+        return order_summary
+
+    def review_order(self, session_id: str) -> OrderSummary:
+        """The order summary, fetched to read the order back to the guest."""
+        order_summary = self.get_order_summary(session_id)
+        self._notify("order_reviewed", session_id, self._totals(session_id))
         return order_summary
 
     def get_session_identifiers(self, session_id: str) -> SessionIdentifiers:
@@ -109,7 +210,7 @@ class OrderState:
         session["round_trip_token"] = self._format_round_trip_token(
             session["session_token"], session["round_trip_index"]
         )
-        logger.info(
+        logger.debug(
             "Round trip %s recorded for session %s", session["round_trip_index"], session_id
         )
         return self.get_session_identifiers(session_id)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Optional
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Delta events that can be merged, and whether their payload is base64 audio or text.
+MERGEABLE_EVENTS = {
+    "response.audio.delta": "audio",
+    "response.audio_transcript.delta": "text",
+}
+
+# Upstream events the web frontend never handles.
+DEFAULT_DENY = frozenset({
+    "rate_limits.updated",
+    "response.content_part.added",
+    "response.content_part.done",
+    "response.output_item.added",
+    "response.output_item.done",
+    "response.audio.done",
+    "conversation.item.created",
+    "input_audio_buffer.committed",
+    "input_audio_buffer.speech_stopped",
+})
+
+
+class OutputStats:
+    """Frames handed to the output stage and frames actually sent to clients, per event type."""
+
+    def __init__(self):
+        self.frames_in: Counter[str] = Counter()
+        self.frames_out: Counter[str] = Counter()
+        self.dropped: Counter[str] = Counter()
+
+    def report(self) -> dict[str, dict[str, Any]]:
+        return {
+            event_type: {
+                "in": count,
+                "out": self.frames_out[event_type],
+                "dropped": self.dropped[event_type],
+                "reduction": round(1 - self.frames_out[event_type] / count, 4),
+            }
+            for event_type, count in sorted(self.frames_in.items())
+        }
+
+
+class OutputCoalescer:
+    """Output stage for one client socket: merges delta bursts and drops unwanted events.
+
+    Consecutive audio or transcript deltas for the same response item are held for up to ``window_ms``
+    (or until ``max_bytes`` of payload) and sent as one frame. Any other event flushes what is held first,
+    so ordering relative to control events is preserved. Event types in ``deny`` are never sent. A window
+    of 0 disables merging.
+
+    Frames are never decoded: the ids are peeked from the compact JSON and the raw payloads (base64 audio
+    or escaped text) are spliced into the first held frame. Base64 ending in padding cannot be extended, so
+    such a delta is sent as it is; frames whose fields cannot be peeked are passed through unmerged.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        stats: Optional[OutputStats] = None,
+        deny: frozenset[str] = frozenset(),
+        window_ms: float = 40.0,
+        max_bytes: int = 16384,
+    ):
+        self._send = send
+        self.stats = stats or OutputStats()
+        self.deny = deny
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self._lock = asyncio.Lock()
+        self._pending_raw: Optional[str] = None
+        self._pending_span = (0, 0)
+        self._pending_key: Optional[tuple] = None
+        self._parts: list[str] = []
+        self._size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_task: Optional[asyncio.Task] = None
+
+    def holds(self, event_type: Optional[str]) -> bool:
+        """Whether events of this type may be held back rather than sent straight away."""
+        return self.window > 0 and event_type in MERGEABLE_EVENTS
+
+    async def send(self, data: str, event_type: Optional[str] = None) -> None:
+        if event_type is None:
+            event_type = json_codec.peek_type(data) or json_codec.loads(data).get("type", "")
+        self.stats.frames_in[event_type] += 1
+        if event_type in self.deny:
+            self.stats.dropped[event_type] += 1
+            return
+        span = self._delta_span(data) if self.holds(event_type) else None
+        if span is None:
+            async with self._lock:
+                await self._flush_locked()
+                await self._send_out(event_type, data)
+            return
+
+        key = (event_type, self._peek(data, "response_id"), self._peek(data, "item_id"), self._peek(data, "content_index"))
+        part = data[span[0]:span[1]]
+        async with self._lock:
+            if self._pending_raw is not None and (key != self._pending_key or not self._extendable()):
+                await self._flush_locked()
+            if self._pending_raw is None:
+                self._pending_raw, self._pending_span, self._pending_key = data, span, key
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+            self._parts.append(part)
+            self._size += len(part)
+            if self._size >= self.max_bytes:
+                await self._flush_locked()
+
+    @staticmethod
+    def _peek(data: str, key: str) -> Optional[str]:
+        span = json_codec.peek_value_span(data, key)
+        return data[span[0]:span[1]] if span is not None else None
+
+    @staticmethod
+    def _delta_span(data: str) -> Optional[tuple[int, int]]:
+        if not isinstance(data, str) or json_codec.peek_type(data) is None:
+            return None
+        span = json_codec.peek_value_span(data, "delta")
+        # Only a string delta can be spliced.
+        if span is None or data[span[0] - 1] != '"':
+            return None
+        return span
+
+    def _extendable(self) -> bool:
+        """Whether more payload can be appended to what is held; padded base64 has to end the frame."""
+        return MERGEABLE_EVENTS[self._pending_key[0]] != "audio" or not self._parts[-1].endswith("=")
+
+    async def flush(self) -> None:
+        async with self._lock:
+            await self._flush_locked()
+
+    async def close(self) -> None:
+        """Send whatever is still held; the socket may already be gone."""
+        try:
+            await self.flush()
+        except ConnectionResetError:
+            pass
+        if self._timer_task is not None:
+            await asyncio.gather(self._timer_task, return_exceptions=True)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._timer_task = asyncio.ensure_future(self._flush_on_timer())
+
+    async def _flush_on_timer(self) -> None:
+        try:
+            await self.flush()
+        except ConnectionResetError:
+            logger.debug("Client socket closed before held output could be sent")
+
+    async def _flush_locked(self) -> None:
+        if self._pending_raw is None:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        data, (start, end), event_type, parts = self._pending_raw, self._pending_span, self._pending_key[0], self._parts
+        if len(parts) > 1:
+            data = data[:start] + "".join(parts) + data[end:]
+        self._pending_raw, self._pending_key, self._parts, self._size = None, None, [], 0
+        await self._send_out(event_type, data)
+
+    async def _send_out(self, event_type: str, data: str) -> None:
+        self.stats.frames_out[event_type] += 1
+        await self._send(data)
@@ -0,0 +1,405 @@
+"""Push the menu catalog and recipe documents straight into the Azure AI Search index.
+
+The pull path in ``setup_intvect.py`` (blob upload, indexer, SplitSkill and embedding skill) takes minutes
+before new menu data is searchable. This command does the same work locally: it chunks menu items and
+documents the way the SplitSkill is configured, embeds the chunks in large batches, and pushes them with
+``merge_or_upload_documents`` into the index schema ``setup_intvect.setup_index`` creates
+(``chunk_id``, ``parent_id``, ``title``, ``chunk``, ``text_vector``).
+
+    python app/backend/push_ingest.py --data-directory data
+
+PDFs are read when the optional ``pypdf`` package is installed and skipped otherwise.
+
+An index must be fed by one path only. Pushed chunk keys (``<parent_id>_pages_<n>``) never match the keys the
+pull indexer's projections create, so chunks from both paths would sit in the index side by side. The command
+refuses to push into an index that holds chunks it did not produce; ``--replace-other-chunks`` deletes them
+first (stop or delete the pull indexer as well, or its next run adds them back).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from azure.core.credentials import AzureKeyCredential
+from azure.identity.aio import (
+    AzureDeveloperCliCredential,
+    DefaultAzureCredential,
+    get_bearer_token_provider,
+)
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.models import IndexingResult
+from dotenv import load_dotenv
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+
+from menu_catalog import load_menu_data
+
+logger = logging.getLogger("voicerag")
+
+# Mirrors the SplitSkill settings in setup_intvect.setup_index.
+CHUNK_MAX_CHARS = 2000
+CHUNK_OVERLAP_CHARS = 500
+EMBEDDINGS_DIMENSIONS = 3072
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_CONCURRENCY = 4
+EMBEDDING_MAX_RETRIES = 6
+# Azure AI Search accepts at most 1000 documents or 16 MB per indexing request; leave headroom on size.
+UPLOAD_MAX_DOCUMENTS = 1000
+UPLOAD_MAX_BYTES = 12 * 1024 * 1024
+
+TEXT_SUFFIXES = {".txt", ".md"}
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+try:  # pragma: no cover - optional dependency
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - optional dependency
+    PdfReader = None
+
+
+@dataclass
+class SourceDocument:
+    parent_id: str
+    title: str
+    text: str
+
+
+@dataclass
+class IngestStats:
+    sources: int = 0
+    chunks: int = 0
+    embedding_requests: int = 0
+    upload_batches: int = 0
+    uploaded: int = 0
+    failed_keys: list[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+
+class LocalSearchIndex:
+    """In-memory stand-in for the async ``SearchClient`` indexing call, used for offline runs and tests."""
+
+    def __init__(self, key_field: str = "chunk_id"):
+        self.key_field = key_field
+        self.documents: dict[str, dict[str, Any]] = {}
+        self.batch_sizes: list[int] = []
+
+    async def merge_or_upload_documents(self, documents: list[dict[str, Any]]) -> list[IndexingResult]:
+        self.batch_sizes.append(len(documents))
+        results = []
+        for document in documents:
+            key = document[self.key_field]
+            self.documents.setdefault(key, {}).update(document)
+            results.append(IndexingResult.deserialize({"key": key, "status": True, "statusCode": 200}))
+        return results
+
+
+def make_key(value: str) -> str:
+    """Index keys may only contain letters, digits, underscores, dashes and equal signs."""
+    return re.sub(r"[^A-Za-z0-9_\-=]", "_", value.strip().lower())
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> list[str]:
+    """Split text into overlapping chunks, preferring sentence and then word boundaries."""
+    text = " ".join(text.split())
+    if not text:
+        return []
+
+    chunks = []
+    start = 0
+    while True:
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            boundary = max(text.rfind(mark, start, end) for mark in (". ", "? ", "! "))
+            if boundary > start + max_chars // 2:
+                end = boundary + 1
+            elif (space := text.rfind(" ", start, end)) > start:
+                end = space
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            return chunks
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+
+
+def menu_documents(menu_data: dict[str, Any]) -> list[SourceDocument]:
+    """One source document per menu item, carrying every field the search tool answers questions about."""
+    documents = []
+    for category_entry in menu_data.get("menuItems", []):
+        category = category_entry.get("category", "Menu")
+        for item in category_entry.get("items", []):
+            sizes = ", ".join(
+                f"{size['size']} ${size['price']:.2f}" for size in item.get("sizes", []) if "price" in size
+            )
+            lines = [f"{item['name']} ({category})"]
+            for label, key in (
+                ("Description", "description"),
+                ("Details", "longDescription"),
+                ("Origin", "origin"),
+                ("Caffeine", "caffeineContent"),
+                ("Brewing method", "brewingMethod"),
+                ("Popularity", "popularity"),
+            ):
+                if item.get(key):
+                    lines.append(f"{label}: {item[key]}")
+            if sizes:
+                lines.append(f"Sizes: {sizes}")
+            documents.append(SourceDocument(
+                parent_id=make_key(f"menu_{category}_{item['name']}"),
+                title=item["name"],
+                text="\n".join(lines),
+            ))
+    return documents
+
+
+def _read_pdf(path: Path) -> Optional[str]:
+    if PdfReader is None:
+        logger.warning("Skipping %s: install pypdf to ingest PDF documents", path.name)
+        return None
+    return "\n".join(page.extract_text() or "" for page in PdfReader(str(path)).pages)
+
+
+def file_documents(data_directory: Path) -> list[SourceDocument]:
+    """Recipe and reference documents from ``data_directory`` (text, markdown and, with pypdf, PDF)."""
+    if not data_directory.is_dir():
+        return []
+    documents = []
+    for path in sorted(data_directory.iterdir()):
+        suffix = path.suffix.lower()
+        if suffix in TEXT_SUFFIXES:
+            text = path.read_text(encoding="utf-8", errors="replace")
+        elif suffix == ".pdf":
+            text = _read_pdf(path)
+        else:
+            continue
+        if text and text.strip():
+            documents.append(SourceDocument(parent_id=make_key(f"doc_{path.name}"), title=path.name, text=text))
+    return documents
+
+
+def build_chunks(sources: Iterable[SourceDocument], max_chars: int = CHUNK_MAX_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> list[dict[str, Any]]:
+    chunks = []
+    for source in sources:
+        for index, chunk in enumerate(chunk_text(source.text, max_chars, overlap)):
+            chunks.append({
+                "chunk_id": f"{source.parent_id}_pages_{index}",
+                "parent_id": source.parent_id,
+                "title": source.title,
+                "chunk": chunk,
+            })
+    return chunks
+
+
+def _retry_delay(exc: Exception, attempt: int, base_delay: float) -> float:
+    """Honour the service's retry-after hint when there is one, otherwise back off exponentially with jitter."""
+    if isinstance(exc, APIStatusError):
+        headers = exc.response.headers
+        try:
+            if retry_after_ms := headers.get("retry-after-ms"):
+                return float(retry_after_ms) / 1000
+            if retry_after := headers.get("retry-after"):
+                return float(retry_after)
+        except ValueError:
+            pass
+    return min(60.0, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+async def embed_texts(
+    client,
+    deployment: str,
+    texts: list[str],
+    *,
+    dimensions: Optional[int] = None,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_concurrency: int = EMBEDDING_CONCURRENCY,
+    max_retries: int = EMBEDDING_MAX_RETRIES,
+    retry_base_delay: float = 1.0,
+    stats: Optional[IngestStats] = None,
+) -> list[list[float]]:
+    """Embed ``texts`` in batches of ``batch_size``, a few requests in flight, retrying throttled calls."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    extra = {"dimensions": dimensions} if dimensions else {}
+
+    async def embed_batch(batch: list[str]) -> list[list[float]]:
+        async with semaphore:
+            attempt = 0
+            while True:
+                try:
+                    response = await client.embeddings.create(input=batch, model=deployment, **extra)
+                    if stats is not None:
+                        stats.embedding_requests += 1
+                    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+                except RETRYABLE_ERRORS as exc:
+                    if attempt >= max_retries:
+                        raise
+                    delay = _retry_delay(exc, attempt, retry_base_delay)
+                    attempt += 1
+                    logger.warning("Embedding batch failed (%s); retry %d in %.1fs", type(exc).__name__, attempt, delay)
+                    await asyncio.sleep(delay)
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+def batch_documents(documents: Iterable[dict[str, Any]], max_count: int = UPLOAD_MAX_DOCUMENTS, max_bytes: int = UPLOAD_MAX_BYTES) -> Iterator[list[dict[str, Any]]]:
+    """Group documents into indexing requests bounded by both document count and serialized size."""
+    batch: list[dict[str, Any]] = []
+    batch_bytes = 0
+    for document in documents:
+        size = len(json.dumps(document, separators=(",", ":")).encode("utf-8"))
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(document)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+async def upload_chunks(search_client, documents: list[dict[str, Any]], stats: IngestStats, max_count: int = UPLOAD_MAX_DOCUMENTS, max_bytes: int = UPLOAD_MAX_BYTES) -> None:
+    for batch in batch_documents(documents, max_count, max_bytes):
+        results = await search_client.merge_or_upload_documents(documents=batch)
+        stats.upload_batches += 1
+        for result in results:
+            if result.succeeded:
+                stats.uploaded += 1
+            else:
+                stats.failed_keys.append(result.key)
+                logger.warning("Indexing failed for %s: %s", result.key, result.error_message)
+
+
+async def find_other_chunks(search_client, parent_ids: Iterable[str]) -> list[str]:
+    """Keys of indexed chunks whose parent is none of ``parent_ids``: the pull indexer's projections and
+    chunks of sources that are no longer pushed."""
+    keys = ",".join(sorted(parent_ids))
+    results = await search_client.search(
+        search_text="*", filter=f"not search.in(parent_id, '{keys}', ',')", select=["chunk_id"],
+    )
+    return [document["chunk_id"] async for document in results]
+
+
+async def delete_chunks(search_client, keys: list[str], max_count: int = UPLOAD_MAX_DOCUMENTS) -> None:
+    for start in range(0, len(keys), max_count):
+        await search_client.delete_documents(documents=[{"chunk_id": key} for key in keys[start:start + max_count]])
+
+
+async def ingest(
+    search_client,
+    embeddings_client,
+    embedding_deployment: str,
+    sources: list[SourceDocument],
+    *,
+    dimensions: Optional[int] = EMBEDDINGS_DIMENSIONS,
+    embedding_batch_size: int = EMBEDDING_BATCH_SIZE,
+    retry_base_delay: float = 1.0,
+) -> IngestStats:
+    """Chunk, embed and push ``sources``; returns counts for logging and tests."""
+    started = time.perf_counter()
+    stats = IngestStats(sources=len(sources))
+    chunks = build_chunks(sources)
+    stats.chunks = len(chunks)
+
+    vectors = await embed_texts(
+        embeddings_client, embedding_deployment, [chunk["chunk"] for chunk in chunks],
+        dimensions=dimensions, batch_size=embedding_batch_size, retry_base_delay=retry_base_delay, stats=stats,
+    )
+    for chunk, vector in zip(chunks, vectors):
+        chunk["text_vector"] = vector
+
+    await upload_chunks(search_client, chunks, stats)
+    stats.elapsed_seconds = time.perf_counter() - started
+    return stats
+
+
+async def _run(args: argparse.Namespace) -> IngestStats:
+    menu_data = json.loads(Path(args.menu_path).read_text(encoding="utf-8")) if args.menu_path else load_menu_data()
+    sources = menu_documents(menu_data) + file_documents(Path(args.data_directory))
+    if args.dry_run:
+        stats = IngestStats(sources=len(sources), chunks=len(build_chunks(sources)))
+        logger.info("Dry run: %d sources would produce %d chunks", stats.sources, stats.chunks)
+        return stats
+
+    search_key = os.environ.get("AZURE_SEARCH_API_KEY")
+    # The embedding deployment lives on the realtime resource, as in setup_intvect.
+    openai_key = os.environ.get("AZURE_OPENAI_EASTUS2_API_KEY")
+    credential = None
+    if not search_key or not openai_key:
+        if tenant_id := os.environ.get("AZURE_TENANT_ID"):
+            credential = AzureDeveloperCliCredential(tenant_id=tenant_id, process_timeout=60)
+        else:
+            credential = DefaultAzureCredential()
+
+    search_client = SearchClient(
+        os.environ["AZURE_SEARCH_ENDPOINT"], os.environ["AZURE_SEARCH_INDEX"],
+        AzureKeyCredential(search_key) if search_key else credential,
+    )
+    openai_auth = (
+        {"api_key": openai_key} if openai_key
+        else {"azure_ad_token_provider": get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default")}
+    )
+    embeddings_client = AsyncAzureOpenAI(
+        azure_endpoint=re.sub(r"^wss://", "https://", os.environ["AZURE_OPENAI_EASTUS2_ENDPOINT"]),
+        api_version=os.environ.get("AZURE_OPENAI_API_VERSION", "2024-12-01-preview"),
+        **openai_auth,
+    )
+    try:
+        if other_chunks := await find_other_chunks(search_client, {source.parent_id for source in sources}):
+            if not args.replace_other_chunks:
+                raise SystemExit(
+                    f"The index holds {len(other_chunks)} chunks this push did not produce (from the pull indexer or "
+                    "removed sources). Feed the index from one path only, or rerun with --replace-other-chunks."
+                )
+            logger.info("Deleting %d chunks this push does not produce", len(other_chunks))
+            await delete_chunks(search_client, other_chunks)
+        return await ingest(
+            search_client, embeddings_client, os.environ["AZURE_OPENAI_EMBEDDING_DEPLOYMENT"], sources,
+            dimensions=args.dimensions or int(os.environ.get("AZURE_SEARCH_EMBEDDING_DIMENSIONS", EMBEDDINGS_DIMENSIONS)),
+            embedding_batch_size=args.embedding_batch_size,
+        )
+    finally:
+        await search_client.close()
+        await embeddings_client.close()
+        if credential is not None:
+            await credential.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-directory", default="data", help="Folder with recipe and reference documents")
+    parser.add_argument("--menu-path", help="menuItems.json to ingest (defaults to the backend's menu lookup)")
+    parser.add_argument("--dimensions", type=int, help="Embedding dimensions (defaults to AZURE_SEARCH_EMBEDDING_DIMENSIONS or 3072)")
+    parser.add_argument("--embedding-batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Only chunk the sources and report counts")
+    parser.add_argument("--replace-other-chunks", action="store_true",
+                        help="Delete indexed chunks this push does not produce, such as the pull indexer's")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    load_dotenv()
+    stats = asyncio.run(_run(args))
+    if not args.dry_run:
+        logger.info(
+            "Indexed %d/%d chunks from %d sources in %.1fs (%d embedding requests, %d upload batches)",
+            stats.uploaded, stats.chunks, stats.sources, stats.elapsed_seconds,
+            stats.embedding_requests, stats.upload_batches,
+        )
+    return 1 if stats.failed_keys else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
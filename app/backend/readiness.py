@@ -0,0 +1,80 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class StartupWarmup:
+    """Runs warm-up steps concurrently in the background and reports readiness.
+
+    Steps are registered while the app is built and start on ``app.on_startup`` without blocking it, so the
+    worker binds its socket immediately. Blocking callables run in the default thread pool and coroutine
+    functions on the loop. A failing step is retried with capped backoff; ``/ready`` answers 503 until
+    every step has succeeded once.
+    """
+
+    def __init__(self, retry_initial_delay: float = 1.0, retry_max_delay: float = 30.0):
+        self.retry_initial_delay = retry_initial_delay
+        self.retry_max_delay = retry_max_delay
+        self._steps: dict[str, Callable[[], Any]] = {}
+        self._status: dict[str, dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, step: Callable[[], Any]) -> None:
+        self._steps[name] = step
+        self._status[name] = {"ready": False}
+
+    @property
+    def ready(self) -> bool:
+        return all(status["ready"] for status in self._status.values())
+
+    def status(self) -> dict[str, Any]:
+        return {"ready": self.ready, "steps": {name: dict(status) for name, status in self._status.items()}}
+
+    async def _run_step(self, name: str, step: Callable[[], Any]) -> None:
+        delay = self.retry_initial_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(step):
+                    await step()
+                else:
+                    await asyncio.to_thread(step)
+            except Exception as exc:
+                self._status[name] = {"ready": False, "attempts": attempt, "error": type(exc).__name__}
+                logger.warning("Warm-up step %s failed (attempt %d): %s; retrying in %.0fs", name, attempt, exc, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+                continue
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._status[name] = {"ready": True, "attempts": attempt, "ms": elapsed_ms}
+            logger.info("Warm-up step %s ready in %.1f ms", name, elapsed_ms)
+            return
+
+    async def run(self) -> None:
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_step(name, step) for name, step in self._steps.items()))
+        logger.info("Worker ready after %.1f ms", (time.perf_counter() - started) * 1000)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _ready_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.status(), status=200 if self.ready else 503)
+
+    def attach_to_app(self, app: web.Application, path: str = "/ready") -> None:
+        app.router.add_get(path, self._ready_handler)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
@@ -1,18 +1,54 @@
 import asyncio
-import json
 import logging
+import math
+import random
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any, Callable, Optional
 
 import aiohttp
-from aiohttp import web
+from aiohttp import WSCloseCode, web
 from azure.core.credentials import AzureKeyCredential
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 
+import json_codec
+from admission import AdmissionController, AdmissionRejected
+from conversation_memory import format_order_state
+from event_sink import SqliteEventSink
 from order_state import order_state_singleton, SessionIdentifiers  # Import the order state singleton
+from output_coalescer import OutputCoalescer, OutputStats
+from session_store import FileSessionStore, InMemorySessionStore
+from structured_logging import bind_session_context, set_round_trip_token
+from upstream_pool import UpstreamEndpoint, UpstreamPool, UpstreamUnavailable
+from warm_pool import WarmSocket, WarmSocketPool
 
 logger = logging.getLogger("coffee-chat")
 
+# Events the relay inspects or rewrites; any other event is passed through as received.
+UPSTREAM_EVENTS_HANDLED = frozenset({
+    "session.created",
+    "response.created",
+    "response.output_item.added",
+    "conversation.item.created",
+    "response.function_call_arguments.delta",
+    "response.function_call_arguments.done",
+    "response.output_item.done",
+    "response.done",
+    "conversation.item.input_audio_transcription.completed",
+    "response.audio_transcript.done",
+    "input_audio_buffer.speech_started",
+    "error",
+})
+CLIENT_EVENTS_HANDLED = frozenset({"session.update", "extension.audio_played"})
+
+# Playback time per base64 character of a pcm16 24 kHz mono audio delta (3 bytes per 4 characters,
+# 48 bytes per ms). Applied to whole frames, so it slightly overstates what was sent.
+AUDIO_MS_PER_BASE64_CHAR = 3 / 4 / 48
+
 class ToolResultDirection(Enum):
     TO_SERVER = 1
     TO_CLIENT = 2
@@ -28,15 +64,30 @@ class ToolResult:
     def to_text(self) -> str:
         if self.text is None:
             return ""
-        return self.text if type(self.text) == str else json.dumps(self.text)
+        return self.text if type(self.text) == str else json_codec.dumps(self.text)
+
+# What the model hears when a tool runs out of time and has no fallback of its own
+TOOL_DEADLINE_TEXT = (
+    "That lookup is taking longer than usual. Tell the guest you're checking on it and carry on; "
+    "don't guess at the answer."
+)
+# Tools whose target also receives the session id
+SESSION_TOOLS = frozenset({"update_order", "update_order_batch", "get_order"})
+
 
 class Tool:
     target: Callable[..., ToolResult]
     schema: Any
+    # Latency budget in seconds; None waits for the tool however long it takes
+    deadline: Optional[float]
+    # Answer given instead when the budget runs out, from the tool's arguments
+    fallback: Optional[Callable[[Any], ToolResult]]
 
-    def __init__(self, target: Any, schema: Any):
+    def __init__(self, target: Any, schema: Any, deadline: Optional[float] = None, fallback: Optional[Callable[[Any], ToolResult]] = None):
         self.target = target
         self.schema = schema
+        self.deadline = deadline
+        self.fallback = fallback
 
 class RTToolCall:
     tool_call_id: str
@@ -46,6 +97,24 @@ class RTToolCall:
         self.tool_call_id = tool_call_id
         self.previous_id = previous_id
 
+@dataclass
+class ClientConnection:
+    session_id: str
+    # Set while no response is being generated, so draining can wait for the current turn.
+    turn_idle: asyncio.Event = field(default_factory=asyncio.Event)
+    closed: asyncio.Event = field(default_factory=asyncio.Event)
+    # Reattached to an order from an earlier connection rather than started fresh
+    resumed: bool = False
+    # Barge-in: whether a response is being generated and its remaining audio is being dropped, and the
+    # assistant audio item last relayed with about how much of it was forwarded
+    response_active: bool = False
+    audio_muted: bool = False
+    audio_item_id: Optional[str] = None
+    audio_forwarded_ms: float = 0.0
+
+    def __post_init__(self):
+        self.turn_idle.set()
+
 class RTMiddleTier:
     endpoint: str
     deployment: str
@@ -65,7 +134,24 @@ class RTMiddleTier:
     voice_choice: Optional[str] = None
     api_version: str = "2024-10-01-preview"
 
-    def __init__(self, endpoint: str, deployment: str, credentials: AzureKeyCredential | DefaultAzureCredential, voice_choice: Optional[str] = None):
+    # Draining: how long open sessions get to finish their turn, and the spread of client reconnects
+    drain_timeout: float = 20.0
+    drain_jitter_ms: int = 5000
+    session_store: InMemorySessionStore | FileSessionStore
+    # How long a dropped connection's order is kept for the client to reconnect to; 0 ends it at once
+    resume_grace_seconds: float = 30.0
+    # Session concurrency limits; None admits every connection
+    admission: Optional[AdmissionController] = None
+    # Upstream sockets opened and primed ahead of demand; None connects per session
+    warm_pool: Optional[WarmSocketPool] = None
+    # Transcripts and tool calls for quality review; None records nothing
+    event_sink: Optional[SqliteEventSink] = None
+    # Output stage towards clients: event types never sent, and the window for merging delta frames (0 disables)
+    output_deny: frozenset[str] = frozenset()
+    output_coalesce_ms: float = 0.0
+    output_coalesce_bytes: int = 16384
+
+    def __init__(self, endpoint: str, deployment: str, credentials: AzureKeyCredential | DefaultAzureCredential, voice_choice: Optional[str] = None, upstream_pool: Optional[UpstreamPool] = None):
         self.endpoint = endpoint
         self.deployment = deployment
         self.voice_choice = voice_choice
@@ -74,19 +160,38 @@ class RTMiddleTier:
         self._token_provider = None
         self._session_map: dict[web.WebSocketResponse, str] = {}
         self._sent_greeting: set[str] = set()
+        self._connections: dict[web.WebSocketResponse, ClientConnection] = {}
+        # Session token -> (session id, expiry) for orders waiting for their client to reconnect
+        self._parked: dict[str, tuple[str, asyncio.TimerHandle]] = {}
+        self.barge_ins = 0
+        self.output_stats = OutputStats()
+        self.tool_deadline_hits: Counter[str] = Counter()
+        self._tool_latencies: dict[str, deque[float]] = {}
+        # Calls that outlived their deadline, kept referenced until they finish
+        self._background_tool_calls: set[asyncio.Task] = set()
+        self.audio_deltas_dropped = 0
+        self._draining = False
+        self.session_store = InMemorySessionStore()
         if voice_choice is not None:
             logger.info("Realtime voice choice set to %s", voice_choice)
         if isinstance(credentials, AzureKeyCredential):
             self.key = credentials.key
         else:
             self._token_provider = get_bearer_token_provider(credentials, "https://cognitiveservices.azure.com/.default")
-            self._token_provider() # Warm up during startup so we have a token cached when the first request arrives
+        # Sessions are spread over the pool's endpoints; by default it only holds endpoint/deployment.
+        self.upstream_pool = upstream_pool or UpstreamPool([UpstreamEndpoint(endpoint, deployment, self.key)])
+
+    def warm_up(self) -> None:
+        """Fetch a token so the first connection does not pay for it (blocking; run off the event loop)."""
+        if self._token_provider is not None:
+            self._token_provider()
 
     async def _emit_session_identifiers(
         self,
         client_ws: web.WebSocketResponse,
         event_type: str,
         identifiers: SessionIdentifiers | None,
+        extra: Optional[dict[str, Any]] = None,
     ) -> None:
         if identifiers is None:
             return
@@ -96,11 +201,36 @@ class RTMiddleTier:
                 "sessionToken": identifiers.session_token,
                 "roundTripIndex": identifiers.round_trip_index,
                 "roundTripToken": identifiers.round_trip_token,
-            }
+                **(extra or {}),
+            },
+            dumps=json_codec.dumps,
         )
 
+    def _record(self, session_id: Optional[str], kind: str, payload: dict[str, Any]) -> None:
+        if self.event_sink is None or session_id not in order_state_singleton.sessions:
+            return
+        identifiers = order_state_singleton.get_session_identifiers(session_id)
+        self.event_sink.emit(kind, identifiers.session_token, identifiers.round_trip_token, payload)
+
     async def _process_message_to_client(self, msg: str, client_ws: web.WebSocketResponse, server_ws: web.WebSocketResponse) -> Optional[str]:
-        message = json.loads(msg.data)
+        # Audio and transcript deltas, the bulk of the traffic, are relayed without being decoded when the
+        # frame is compact JSON with "type" first; anything else is decoded to find its type.
+        event_type = json_codec.peek_type(msg.data)
+        message = None
+        if event_type is None:
+            message = json_codec.loads(msg.data)
+            event_type = message.get("type") if isinstance(message, dict) else None
+        if event_type == "response.audio.delta" and (connection := self._connections.get(client_ws)) is not None:
+            if connection.audio_muted:
+                # The guest barged in; audio still arriving for the cancelled response would only be discarded.
+                self.audio_deltas_dropped += 1
+                return None
+            connection.audio_forwarded_ms += len(msg.data) * AUDIO_MS_PER_BASE64_CHAR
+            return msg.data
+        if event_type not in UPSTREAM_EVENTS_HANDLED:
+            return msg.data
+        if message is None:
+            message = json_codec.loads(msg.data)
         updated_message = msg.data
         session_id = self._session_map.get(client_ws)
         if message is not None:
@@ -114,14 +244,49 @@ class RTMiddleTier:
                     session["voice"] = self.voice_choice
                     session["tool_choice"] = "none"
                     session["max_response_output_tokens"] = None
-                    updated_message = json.dumps(message)
+                    updated_message = json_codec.dumps(message)
                     if session_id is not None:
                         identifiers = order_state_singleton.get_session_identifiers(session_id)
-                        await self._emit_session_identifiers(client_ws, "extension.session_metadata", identifiers)
+                        connection = self._connections.get(client_ws)
+                        # A resumed client may have reloaded the page, so it gets the order back too.
+                        extra = {"resumed": True, "order": order_state_singleton.get_order_summary(session_id).model_dump()} \
+                            if connection is not None and connection.resumed else {"resumed": False}
+                        await self._emit_session_identifiers(client_ws, "extension.session_metadata", identifiers, extra)
+
+                case "conversation.item.input_audio_transcription.completed":
+                    self._record(session_id, "guest_transcript", {"item_id": message.get("item_id"), "transcript": message.get("transcript")})
+
+                case "response.audio_transcript.done":
+                    self._record(session_id, "assistant_transcript", {
+                        "item_id": message.get("item_id"),
+                        "response_id": message.get("response_id"),
+                        "transcript": message.get("transcript"),
+                    })
+
+                case "response.created":
+                    if connection := self._connections.get(client_ws):
+                        connection.turn_idle.clear()
+                        connection.response_active = True
+                        connection.audio_muted = False
+
+                case "input_audio_buffer.speech_started":
+                    connection = self._connections.get(client_ws)
+                    if connection is not None and connection.response_active and not connection.audio_muted:
+                        connection.audio_muted = True
+                        self.barge_ins += 1
+                        await server_ws.send_json({"type": "response.cancel"}, dumps=json_codec.dumps)
+
+                case "error":
+                    # The response can finish between the guest starting to speak and our cancel arriving.
+                    if message.get("error", {}).get("code") == "response_cancel_not_active":
+                        updated_message = None
 
                 case "response.output_item.added":
                     if "item" in message and message["item"]["type"] == "function_call":
                         updated_message = None
+                    elif "item" in message and message["item"]["type"] == "message" and (connection := self._connections.get(client_ws)):
+                        connection.audio_item_id = message["item"]["id"]
+                        connection.audio_forwarded_ms = 0.0
 
                 case "conversation.item.created":
                     if "item" in message and message["item"]["type"] == "function_call":
@@ -144,10 +309,13 @@ class RTMiddleTier:
                         tool_call = self._tools_pending[message["item"]["call_id"]]
                         tool = self.tools[item["name"]]
                         args = item["arguments"]
-                        if item["name"] in ["update_order", "get_order"]:
-                            result = await tool.target(json.loads(args), session_id)
-                        else:
-                            result = await tool.target(json.loads(args))
+                        result = await self._call_tool(item["name"], tool, json_codec.loads(args), session_id)
+                        self._record(session_id, "tool_call", {
+                            "name": item["name"],
+                            "call_id": item["call_id"],
+                            "arguments": args,
+                            "result": result.to_text(),
+                        })
                         await server_ws.send_json({
                             "type": "conversation.item.create",
                             "item": {
@@ -155,7 +323,7 @@ class RTMiddleTier:
                                 "call_id": item["call_id"],
                                 "output": result.to_text() if result.destination == ToolResultDirection.TO_SERVER else ""
                             }
-                        })
+                        }, dumps=json_codec.dumps)
                         if result.destination == ToolResultDirection.TO_CLIENT:
                             # TODO: this will break clients that don't know about this extra message, rewrite 
                             # this to be a regular text message with a special marker of some sort
@@ -164,15 +332,21 @@ class RTMiddleTier:
                                 "previous_item_id": tool_call.previous_id,
                                 "tool_name": item["name"],
                                 "tool_result": result.to_text()
-                            })
+                            }, dumps=json_codec.dumps)
                         updated_message = None
 
                 case "response.done":
+                    if connection := self._connections.get(client_ws):
+                        connection.response_active = False
+                        connection.audio_muted = False
                     if len(self._tools_pending) > 0:
                         self._tools_pending.clear() # Any chance tool calls could be interleaved across different outstanding responses?
                         await server_ws.send_json({
                             "type": "response.create"
-                        })
+                        }, dumps=json_codec.dumps)
+                    elif connection := self._connections.get(client_ws):
+                        # The turn is over unless a follow-up response was just requested for tool output.
+                        connection.turn_idle.set()
                     if "response" in message:
                         replace = False
                         try:
@@ -181,51 +355,178 @@ class RTMiddleTier:
                                     message["response"]["output"].pop(i)
                                     replace = True
                         except IndexError as e:
-                            logging.error(f"Error processing message: {e}")
+                            logger.error("Error processing message: %s", e)
                         if replace:
-                            updated_message = json.dumps(message)
+                            updated_message = json_codec.dumps(message)
                     if session_id is not None:
                         identifiers = order_state_singleton.advance_round_trip(session_id)
+                        set_round_trip_token(identifiers.round_trip_token)
+                        self._record(session_id, "round_trip", {"round_trip_index": identifiers.round_trip_index})
                         await self._emit_session_identifiers(client_ws, "extension.round_trip_token", identifiers)
 
         return updated_message
 
     async def _process_message_to_server(self, msg: str, ws: web.WebSocketResponse) -> Optional[str]:
-        message = json.loads(msg.data)
+        event_type = json_codec.peek_type(msg.data)
+        if event_type is not None and event_type not in CLIENT_EVENTS_HANDLED:
+            return msg.data
+        message = json_codec.loads(msg.data)
         updated_message = msg.data
         if message is not None:
             match message["type"]:
                 case "session.update":
-                    session = message["session"]
-                    if self.system_message is not None:
-                        session["instructions"] = self.system_message
-                    if self.temperature is not None:
-                        session["temperature"] = self.temperature
-                    if self.max_tokens is not None:
-                        session["max_response_output_tokens"] = self.max_tokens
-                    if self.disable_audio is not None:
-                        session["disable_audio"] = self.disable_audio
-                    if self.voice_choice is not None:
-                        session["voice"] = self.voice_choice
-                    session["tool_choice"] = "auto" if len(self.tools) > 0 else "none"
-                    session["tools"] = [tool.schema for tool in self.tools.values()]
-                    updated_message = json.dumps(message)
+                    self._apply_session_config(message["session"])
+                    updated_message = json_codec.dumps(message)
+
+                case "extension.audio_played":
+                    updated_message = self._truncate_to_playback(message, ws)
 
         return updated_message
 
+    async def _call_tool(self, name: str, tool: Tool, args: Any, session_id: Optional[str]) -> ToolResult:
+        """Run a tool within its deadline. A call that overruns keeps going in the background (so it can
+        still fill caches) while the model gets the tool's fallback answer."""
+        started = time.perf_counter()
+        call = tool.target(args, session_id) if name in SESSION_TOOLS else tool.target(args)
+        try:
+            if tool.deadline is None:
+                return await call
+            task = asyncio.ensure_future(call)
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), tool.deadline)
+            except asyncio.TimeoutError:
+                self.tool_deadline_hits[name] += 1
+                logger.warning("Tool %s missed its %.0f ms deadline; answering with its fallback", name, tool.deadline * 1000)
+                self._background_tool_calls.add(task)
+                task.add_done_callback(lambda finished: self._finish_background_tool_call(name, finished))
+                if tool.fallback is not None:
+                    return tool.fallback(args)
+                return ToolResult(TOOL_DEADLINE_TEXT, ToolResultDirection.TO_SERVER)
+        finally:
+            latencies = self._tool_latencies.setdefault(name, deque(maxlen=1000))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    def _finish_background_tool_call(self, name: str, task: asyncio.Task) -> None:
+        self._background_tool_calls.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Tool %s failed after its deadline", name, exc_info=task.exception())
+
+    def tool_stats(self) -> dict[str, dict[str, Any]]:
+        """Calls, deadline hits and latency (as the model saw it, so capped by the deadline) per tool."""
+        report = {}
+        for name, latencies in sorted(self._tool_latencies.items()):
+            ordered = sorted(latencies)
+            report[name] = {
+                "calls": len(ordered),
+                "deadlineHits": self.tool_deadline_hits[name],
+                "p50Ms": round(ordered[len(ordered) // 2], 1),
+                "p99Ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 1),
+            }
+        return report
+
+    def _truncate_to_playback(self, message: dict[str, Any], ws: web.WebSocketResponse) -> Optional[str]:
+        """Turn the client's report of how much of an interrupted reply it played into a truncate, so the
+        model's copy of the conversation ends where the guest stopped listening."""
+        connection = self._connections.get(ws)
+        if connection is None or connection.audio_item_id is None or message.get("itemId") != connection.audio_item_id:
+            return None
+        played_ms = message.get("playedMs", 0)
+        if not isinstance(played_ms, (int, float)) or isinstance(played_ms, bool) or not math.isfinite(played_ms):
+            logger.warning("Ignoring audio playback report with playedMs %r", played_ms)
+            return None
+        audio_end_ms = int(min(max(0, played_ms), connection.audio_forwarded_ms))
+        connection.audio_item_id = None
+        return json_codec.dumps({
+            "type": "conversation.item.truncate",
+            "item_id": message["itemId"],
+            "content_index": 0,
+            "audio_end_ms": audio_end_ms,
+        })
+
+    def _apply_session_config(self, session: dict[str, Any]) -> None:
+        if self.system_message is not None:
+            session["instructions"] = self.system_message
+        if self.temperature is not None:
+            session["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            session["max_response_output_tokens"] = self.max_tokens
+        if self.disable_audio is not None:
+            session["disable_audio"] = self.disable_audio
+        if self.voice_choice is not None:
+            session["voice"] = self.voice_choice
+        session["tool_choice"] = "auto" if len(self.tools) > 0 else "none"
+        session["tools"] = [tool.schema for tool in self.tools.values()]
+
+    def _upstream_headers(self, endpoint: UpstreamEndpoint, client_request_id: Optional[str] = None) -> dict[str, str]:
+        headers = {}
+        if client_request_id is not None:
+            headers["x-ms-client-request-id"] = client_request_id
+        if endpoint.key is not None:
+            headers["api-key"] = endpoint.key
+        else:
+            headers["Authorization"] = f"Bearer {self._token_provider()}" # NOTE: no async version of token provider, maybe refresh token on a timer?
+        return headers
+
+    def _upstream_params(self, endpoint: UpstreamEndpoint) -> dict[str, str]:
+        return { "api-version": self.api_version, "deployment": endpoint.deployment }
+
+    async def open_warm_socket(self, session: aiohttp.ClientSession) -> WarmSocket:
+        """Connect and apply the server-enforced session configuration before any guest needs the socket."""
+        # No guest is attached yet, so the socket gets its own request id, logged when a session takes it.
+        client_request_id = str(uuid.uuid4())
+        endpoint, target_ws = await self.upstream_pool.connect(
+            session, lambda endpoint: self._upstream_headers(endpoint, client_request_id), self._upstream_params)
+        warm = WarmSocket(target_ws, lambda: self.upstream_pool.release(endpoint), client_request_id=client_request_id)
+        try:
+            update = {"type": "session.update", "session": {}}
+            self._apply_session_config(update["session"])
+            await target_ws.send_json(update, dumps=json_codec.dumps)
+            async with asyncio.timeout(self.upstream_pool.connect_timeout):
+                async for msg in target_ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    event_type = json_codec.peek_type(msg.data) or json_codec.loads(msg.data).get("type")
+                    if event_type == "session.updated":
+                        return warm
+                    if event_type == "error":
+                        raise RuntimeError(f"Upstream rejected the warm-up session.update: {msg.data}")
+                    if event_type == "session.created":
+                        warm.buffered.append(msg)
+            raise ConnectionResetError("Upstream closed the socket while it was being primed")
+        except BaseException:
+            await warm.close()
+            raise
+
+    @asynccontextmanager
+    async def _connect_upstream(self, session: aiohttp.ClientSession, ws: web.WebSocketResponse):
+        """Yield an upstream socket and any events it received before the client was attached."""
+        warm = await self.warm_pool.take() if self.warm_pool is not None else None
+        if warm is not None:
+            logger.info("Session %s uses warm upstream socket with x-ms-client-request-id %s (client sent %s)",
+                        self._session_map.get(ws), warm.client_request_id, ws.headers.get("x-ms-client-request-id"))
+            try:
+                yield warm.ws, warm.buffered
+            finally:
+                await warm.close()
+            return
+
+        client_request_id = ws.headers.get("x-ms-client-request-id")
+        endpoint, target_ws = await self.upstream_pool.connect(
+            session, lambda endpoint: self._upstream_headers(endpoint, client_request_id), self._upstream_params)
+        try:
+            async with target_ws:
+                yield target_ws, []
+        finally:
+            self.upstream_pool.release(endpoint)
+
     async def _forward_messages(self, ws: web.WebSocketResponse):
-        async with aiohttp.ClientSession(base_url=self.endpoint) as session:
-            params = { "api-version": self.api_version, "deployment": self.deployment}
-            headers = {}
-            if "x-ms-client-request-id" in ws.headers:
-                headers["x-ms-client-request-id"] = ws.headers["x-ms-client-request-id"]
-            if self.key is not None:
-                headers = { "api-key": self.key }
-            else:
-                headers = { "Authorization": f"Bearer {self._token_provider()}" } # NOTE: no async version of token provider, maybe refresh token on a timer?
-            async with session.ws_connect("/openai/realtime", headers=headers, params=params) as target_ws:
+        async with aiohttp.ClientSession() as session:
+            async with self._connect_upstream(session, ws) as (target_ws, buffered):
                 session_id = self._session_map.get(ws)
                 greeting_sent = session_id in self._sent_greeting
+                connection = self._connections.get(ws)
+                if connection is not None and connection.resumed:
+                    await self._seed_resumed_conversation(target_ws, session_id)
 
                 async def send_greeting_once():
                     nonlocal greeting_sent
@@ -240,8 +541,8 @@ class RTMiddleTier:
                                 {"type": "input_text", "text": "Please greet the guest with: 'Welcome to Dunkin! How may I help you today?'"}
                             ]
                         }
-                    })
-                    await target_ws.send_json({"type": "response.create"})
+                    }, dumps=json_codec.dumps)
+                    await target_ws.send_json({"type": "response.create"}, dumps=json_codec.dumps)
                     greeting_sent = True
                     if session_id is not None:
                         self._sent_greeting.add(session_id)
@@ -254,21 +555,33 @@ class RTMiddleTier:
                             if new_msg is not None:
                                 await target_ws.send_str(new_msg)
                         else:
-                            print("Error: unexpected message type:", msg.type)
+                            logger.warning("Unexpected message type from client: %s", msg.type)
                     
                     # Means it is gracefully closed by the client then time to close the target_ws
                     if target_ws:
-                        print("Closing OpenAI's realtime socket connection.")
+                        logger.debug("Client closed the socket; closing the upstream realtime socket")
                         await target_ws.close()
                         
+                output = OutputCoalescer(ws.send_str, self.output_stats, self.output_deny,
+                                         self.output_coalesce_ms, self.output_coalesce_bytes)
+
+                async def relay_to_client(msg):
+                    if not output.holds(json_codec.peek_type(msg.data)):
+                        # Deltas held by the output stage go out before anything the relay sends itself.
+                        await output.flush()
+                    new_msg = await self._process_message_to_client(msg, ws, target_ws)
+                    if new_msg is not None:
+                        await output.send(new_msg)
+
                 async def from_server_to_client():
+                    # A warm socket already received session.created; pass it on as if it had just arrived.
+                    for msg in buffered:
+                        await relay_to_client(msg)
                     async for msg in target_ws:
                         if msg.type == aiohttp.WSMsgType.TEXT:
-                            new_msg = await self._process_message_to_client(msg, ws, target_ws)
-                            if new_msg is not None:
-                                await ws.send_str(new_msg)
+                            await relay_to_client(msg)
                         else:
-                            print("Error: unexpected message type:", msg.type)
+                            logger.warning("Unexpected message type from upstream: %s", msg.type)
 
                 try:
                     await asyncio.gather(from_client_to_server(), from_server_to_client())
@@ -276,22 +589,225 @@ class RTMiddleTier:
                     # Ignore the errors resulting from the client disconnecting the socket
                     pass
                 finally:
+                    await output.close()
                     if session_id is not None:
-                        order_state_singleton.delete_session(session_id)
+                        if self._draining:
+                            self._end_session(session_id, handed_off=await self._hand_off_session(session_id))
+                        else:
+                            self._park_session(session_id)
                     # Clean up the session map when the connection is closed
                     if ws in self._session_map:
                         del self._session_map[ws]
 
+    async def _hand_off_session(self, session_id: str) -> bool:
+        # A per-process store goes away with this worker, so nothing could ever resume from it.
+        if not self.session_store.shared or session_id not in order_state_singleton.sessions:
+            return False
+        snapshot = order_state_singleton.snapshot_session(session_id)
+        try:
+            await self.session_store.save(snapshot["session_token"], snapshot)
+            logger.info("Handed off session %s with %d items", session_id, len(snapshot["items"]))
+            return True
+        except Exception:
+            logger.exception("Failed to hand off session %s", session_id)
+            return False
+
+    async def _seed_resumed_conversation(self, target_ws: aiohttp.ClientWebSocketResponse, session_id: str) -> None:
+        """Tell the model about the order so far, since the new upstream conversation starts empty."""
+        order_summary = order_state_singleton.get_order_summary(session_id)
+        if not order_summary.items:
+            return
+        await target_ws.send_json({
+            "type": "conversation.item.create",
+            "item": {
+                "type": "message",
+                "role": "system",
+                "content": [{
+                    "type": "input_text",
+                    "text": "The guest reconnected partway through their order; carry on without greeting them again. "
+                            + format_order_state(order_summary),
+                }],
+            },
+        }, dumps=json_codec.dumps)
+
+    def _end_session(self, session_id: str, handed_off: bool = False) -> None:
+        self._sent_greeting.discard(session_id)
+        order_state_singleton.delete_session(session_id, handed_off=handed_off)
+
+    def _park_session(self, session_id: str) -> None:
+        """Keep a dropped connection's order for ``resume_grace_seconds`` in case the client comes back."""
+        if session_id not in order_state_singleton.sessions:
+            return
+        if self.resume_grace_seconds <= 0:
+            self._end_session(session_id)
+            return
+        session_token = order_state_singleton.get_session_identifiers(session_id).session_token
+        expiry = asyncio.get_running_loop().call_later(self.resume_grace_seconds, self._expire_parked_session, session_token)
+        self._parked[session_token] = (session_id, expiry)
+
+    def _expire_parked_session(self, session_token: str) -> None:
+        if (parked := self._parked.pop(session_token, None)) is not None:
+            logger.info("Session %s was not resumed within %.0fs", parked[0], self.resume_grace_seconds)
+            self._end_session(parked[0])
+
+    async def _detach_live_session(self, session_token: str) -> None:
+        """Close a connection still holding ``session_token``, so its order can be parked and taken over.
+
+        A client that lost its network often reconnects before the server notices the old socket is dead.
+        """
+        for ws, connection in list(self._connections.items()):
+            if connection.session_id in order_state_singleton.sessions and \
+                    order_state_singleton.get_session_identifiers(connection.session_id).session_token == session_token:
+                await ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b"resumed elsewhere")
+                try:
+                    await asyncio.wait_for(connection.closed.wait(), 2.0)
+                except asyncio.TimeoutError:
+                    logger.warning("Session %s did not release its connection for resume", connection.session_id)
+                return
+
+    async def _resume_or_create_session(self, session_token: Optional[str]) -> tuple[str, bool]:
+        """Reattach the order behind ``session_token`` (parked here or handed off by another worker), or
+        start a new session. Also returns whether the session was resumed."""
+        if session_token:
+            await self._detach_live_session(session_token)
+            if (parked := self._parked.pop(session_token, None)) is not None:
+                session_id, expiry = parked
+                expiry.cancel()
+                logger.info("Session %s resumed within the grace window", session_id)
+                return session_id, True
+            snapshot = await self.session_store.take(session_token)
+            if snapshot is not None:
+                session_id = order_state_singleton.restore_session(snapshot)
+                # The guest has already been welcomed on the previous connection.
+                self._sent_greeting.add(session_id)
+                return session_id, True
+        return order_state_singleton.create_session(), False
+
+    async def _drain_connection(self, ws: web.WebSocketResponse, connection: ClientConnection, deadline: float) -> None:
+        loop = asyncio.get_running_loop()
+        # Only hand out a resume token another worker can redeem.
+        identifiers = order_state_singleton.get_session_identifiers(connection.session_id) \
+            if self.session_store.shared and connection.session_id in order_state_singleton.sessions else None
+        try:
+            await ws.send_json({
+                "type": "extension.drain",
+                # Spread reconnects so clients do not all land on the remaining workers at once.
+                "reconnectAfterMs": random.randint(0, self.drain_jitter_ms),
+                "sessionToken": identifiers.session_token if identifiers else None,
+            }, dumps=json_codec.dumps)
+        except ConnectionResetError:
+            pass
+        try:
+            await asyncio.wait_for(connection.turn_idle.wait(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            logger.warning("Drain deadline reached with a response still in progress for session %s", connection.session_id)
+        await ws.close(code=WSCloseCode.SERVICE_RESTART, message=b"draining")
+        try:
+            await asyncio.wait_for(connection.closed.wait(), max(1.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            logger.warning("Session %s did not close before the drain deadline", connection.session_id)
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting sockets, let open sessions finish their current turn, and hand their orders to the store."""
+        self._draining = True
+        if self.warm_pool is not None:
+            await self.warm_pool.shutdown()
+        # Orders waiting for a reconnect go to the store too, where the next worker can pick them up.
+        for session_token, (session_id, expiry) in list(self._parked.items()):
+            expiry.cancel()
+            del self._parked[session_token]
+            self._end_session(session_id, handed_off=await self._hand_off_session(session_id))
+        if not self._connections:
+            return
+        deadline = asyncio.get_running_loop().time() + (self.drain_timeout if timeout is None else timeout)
+        logger.info("Draining %d realtime sessions", len(self._connections))
+        await asyncio.gather(
+            *(self._drain_connection(ws, connection, deadline) for ws, connection in list(self._connections.items())),
+            return_exceptions=True,
+        )
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        await self.drain()
+
     async def _websocket_handler(self, request: web.Request):
+        if self._draining:
+            retry_after = max(1, self.drain_jitter_ms // 1000)
+            return web.json_response({"error": "draining"}, status=503, headers={"Retry-After": str(retry_after)})
+
         ws = web.WebSocketResponse()
         await ws.prepare(request)
-        
-        # Create a new session for each WebSocket connection
-        session_id = order_state_singleton.create_session()
-        self._session_map[ws] = session_id
 
-        await self._forward_messages(ws)
+        ticket = None
+        if self.admission is not None:
+            try:
+                ticket = await self.admission.acquire(self._store_id(request), self._client_ip(request))
+            except AdmissionRejected as rejected:
+                await ws.send_json({"type": "extension.busy", "reason": rejected.reason, "retryAfterMs": rejected.retry_after_ms}, dumps=json_codec.dumps)
+                await ws.close(code=WSCloseCode.TRY_AGAIN_LATER)
+                return ws
+
+        try:
+            await self._run_session(ws, request)
+        finally:
+            if ticket is not None:
+                self.admission.release(ticket)
         return ws
+
+    async def _run_session(self, ws: web.WebSocketResponse, request: web.Request) -> None:
+        # Create a new session for each WebSocket connection, or resume one handed off by a draining worker
+        session_id, resumed = await self._resume_or_create_session(request.query.get("sessionToken"))
+        self._session_map[ws] = session_id
+        identifiers = order_state_singleton.get_session_identifiers(session_id)
+        bind_session_context(identifiers.session_token, identifiers.round_trip_token)
+        connection = ClientConnection(session_id, resumed=resumed)
+        self._connections[ws] = connection
+
+        try:
+            await self._forward_messages(ws)
+        except UpstreamUnavailable:
+            logger.error("No realtime endpoint available for session %s", session_id)
+            self._end_session(session_id)
+            self._session_map.pop(ws, None)
+            if not ws.closed:
+                await ws.send_json({"type": "error", "error": {"type": "upstream_unavailable", "message": "The assistant is busy, please try again shortly."}}, dumps=json_codec.dumps)
+                await ws.close(code=WSCloseCode.TRY_AGAIN_LATER)
+        finally:
+            connection.turn_idle.set()
+            connection.closed.set()
+            self._connections.pop(ws, None)
+
+    @staticmethod
+    def _client_ip(request: web.Request) -> str:
+        # The front end (App Service, Container Apps) appends the address it saw to X-Forwarded-For; earlier
+        # entries come from the client and could be anything, so only the last one is trusted.
+        forwarded = request.headers.get("X-Forwarded-For", "").split(",")[-1].strip()
+        return forwarded or request.remote or "unknown"
+
+    @classmethod
+    def _store_id(cls, request: web.Request) -> str:
+        # Kiosks identify their store; anonymous browsers are treated as a store of their own.
+        return request.query.get("storeId") or request.headers.get("X-Store-Id") or f"ip:{cls._client_ip(request)}"
     
+    def stats(self) -> dict[str, Any]:
+        return {
+            "activeSessions": len(self._connections),
+            "parkedSessions": len(self._parked),
+            "bargeIns": self.barge_ins,
+            "audioDeltasDropped": self.audio_deltas_dropped,
+            "output": self.output_stats.report(),
+            "tools": self.tool_stats(),
+            "admission": self.admission.stats() if self.admission is not None else None,
+            "warmPool": self.warm_pool.stats() if self.warm_pool is not None else None,
+            "upstream": self.upstream_pool.stats(),
+        }
+
+    async def _stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
     def attach_to_app(self, app, path):
         app.router.add_get(path, self._websocket_handler)
+        app.router.add_get(f"{path}/stats", self._stats_handler)
+        app.on_shutdown.append(self._on_shutdown)
+        if self.warm_pool is not None:
+            app.on_startup.append(self.warm_pool.start)
+            app.on_cleanup.append(self.warm_pool.close)
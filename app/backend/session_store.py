@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 600.0
+
+
+class InMemorySessionStore:
+    """Order snapshots keyed by session token, kept in this worker only.
+
+    Good enough for a single worker (a reconnect lands on the same process); use ``FileSessionStore``
+    on a shared volume so another worker can pick a session up after a restart. Snapshots die with the
+    worker, so draining does not hand sessions off to it.
+    """
+
+    shared = False
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._snapshots: dict[str, tuple[float, dict[str, Any]]] = {}
+
+    async def save(self, session_token: str, snapshot: dict[str, Any]) -> None:
+        now = time.time()
+        self._snapshots = {token: entry for token, entry in self._snapshots.items() if entry[0] > now}
+        self._snapshots[session_token] = (now + self.ttl_seconds, snapshot)
+
+    async def take(self, session_token: str) -> Optional[dict[str, Any]]:
+        """Return and remove the snapshot, so a session is resumed by at most one connection."""
+        entry = self._snapshots.pop(session_token, None)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+
+class FileSessionStore:
+    """Order snapshots as JSON files in a directory shared by every worker on the host or volume."""
+
+    shared = True
+
+    def __init__(self, directory: str | Path, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, session_token: str) -> Path:
+        # Tokens come from clients, so never use them as file names directly.
+        return self.directory / f"{hashlib.sha256(session_token.encode('utf-8')).hexdigest()}.json"
+
+    def _save(self, session_token: str, snapshot: dict[str, Any]) -> None:
+        self._purge_expired()
+        path = self._path(session_token)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(json.dumps({"expires_at": time.time() + self.ttl_seconds, "snapshot": snapshot}), encoding="utf-8")
+        os.replace(temporary, path)
+
+    def _take(self, session_token: str) -> Optional[dict[str, Any]]:
+        path = self._path(session_token)
+        claimed = path.with_suffix(f".{os.getpid()}.claimed")
+        try:
+            # The rename is atomic, so only one worker can claim a snapshot.
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            return None
+        try:
+            entry = json.loads(claimed.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            logger.warning("Discarding unreadable session snapshot %s: %s", claimed.name, exc)
+            return None
+        finally:
+            claimed.unlink(missing_ok=True)
+        if entry.get("expires_at", 0) <= time.time():
+            return None
+        return entry.get("snapshot")
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        for path in self.directory.glob("*.json"):
+            try:
+                if json.loads(path.read_text(encoding="utf-8")).get("expires_at", 0) <= now:
+                    path.unlink(missing_ok=True)
+            except (OSError, ValueError):
+                continue
+
+    async def save(self, session_token: str, snapshot: dict[str, Any]) -> None:
+        await asyncio.to_thread(self._save, session_token, snapshot)
+
+    async def take(self, session_token: str) -> Optional[dict[str, Any]]:
+        return await asyncio.to_thread(self._take, session_token)
+
+
+def create_session_store() -> InMemorySessionStore | FileSessionStore:
+    """File-backed store when ``SESSION_STORE_DIR`` is set, otherwise in-memory."""
+    ttl_seconds = float(os.environ.get("SESSION_STORE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    if directory := os.environ.get("SESSION_STORE_DIR"):
+        logger.info("Persisting session snapshots to %s", directory)
+        return FileSessionStore(directory, ttl_seconds)
+    logger.warning(
+        "SESSION_STORE_DIR is not set; orders on a draining worker end with it instead of resuming on another worker"
+    )
+    return InMemorySessionStore(ttl_seconds)
@@ -1,21 +1,28 @@
+import hashlib
 import json
 import logging
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 
 from azure.core.exceptions import ResourceExistsError
 from azure.identity import AzureDeveloperCliCredential
 from azure.search.documents.indexes import SearchIndexClient, SearchIndexerClient
 from azure.search.documents.indexes.models import (
     AzureOpenAIEmbeddingSkill,
-    AzureOpenAIParameters,
     AzureOpenAIVectorizer,
+    AzureOpenAIVectorizerParameters,
+    BinaryQuantizationCompression,
     FieldMapping,
     HnswAlgorithmConfiguration,
     HnswParameters,
     IndexProjectionMode,
     InputFieldMappingEntry,
     OutputFieldMappingEntry,
+    RescoringOptions,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters,
     SearchableField,
     SearchField,
     SearchFieldDataType,
@@ -24,7 +31,7 @@ from azure.search.documents.indexes.models import (
     SearchIndexerDataContainer,
     SearchIndexerDataSourceConnection,
     SearchIndexerDataSourceType,
-    SearchIndexerIndexProjections,
+    SearchIndexerIndexProjection,
     SearchIndexerIndexProjectionSelector,
     SearchIndexerIndexProjectionsParameters,
     SearchIndexerSkillset,
@@ -36,12 +43,41 @@ from azure.search.documents.indexes.models import (
     SplitSkill,
     VectorSearch,
     VectorSearchAlgorithmMetric,
+    VectorSearchCompression,
+    VectorSearchCompressionRescoreStorageMethod,
+    VectorSearchCompressionTarget,
     VectorSearchProfile,
 )
 from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv
 from rich.logging import RichHandler
 
+logger = logging.getLogger("voicerag")
+
+# Blob metadata key holding the SHA-256 of the uploaded file, used to skip unchanged documents.
+CONTENT_HASH_METADATA_KEY = "content_sha256"
+UPLOAD_MAX_CONCURRENCY = int(os.environ.get("AZURE_STORAGE_UPLOAD_CONCURRENCY", "8"))
+BLOCK_UPLOAD_CONCURRENCY = 4
+
+VECTOR_COMPRESSIONS = ("none", "scalar", "binary")
+
+
+def build_vector_compression(kind: str, oversampling: float) -> Optional[VectorSearchCompression]:
+    """Quantized storage for the vector field, rescored against the original vectors; None keeps full precision."""
+    if kind == "none":
+        return None
+    rescoring = RescoringOptions(
+        enable_rescoring=True,
+        default_oversampling=oversampling,
+        rescore_storage_method=VectorSearchCompressionRescoreStorageMethod.PRESERVE_ORIGINALS)
+    if kind == "scalar":
+        return ScalarQuantizationCompression(
+            compression_name="vq",
+            rescoring_options=rescoring,
+            parameters=ScalarQuantizationParameters(quantized_data_type=VectorSearchCompressionTarget.INT8))
+    if kind == "binary":
+        return BinaryQuantizationCompression(compression_name="vq", rescoring_options=rescoring)
+    raise ValueError(f"Unknown vector compression '{kind}', expected one of {', '.join(VECTOR_COMPRESSIONS)}")
 
 def load_azd_env():
     """Get path to current azd env file and load file using python-dotenv"""
@@ -59,7 +95,8 @@ def load_azd_env():
     load_dotenv(env_file_path, override=True)
 
 
-def setup_index(azure_credential, index_name, azure_search_endpoint, azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions):
+def setup_index(azure_credential, index_name, azure_search_endpoint, azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions, vector_compression="none", vector_oversampling=4.0, store_vectors=True):
+    compression = build_vector_compression(vector_compression, vector_oversampling)
     index_client = SearchIndexClient(azure_search_endpoint, azure_credential)
     indexer_client = SearchIndexerClient(azure_search_endpoint, azure_credential)
 
@@ -91,10 +128,11 @@ def setup_index(azure_credential, index_name, azure_search_endpoint, azure_stora
                     SearchField(
                         name="text_vector", 
                         type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
-                        vector_search_dimensions=EMBEDDINGS_DIMENSIONS,
+                        vector_search_dimensions=azure_openai_embeddings_dimensions,
                         vector_search_profile_name="vp",
-                        stored=True,
-                        hidden=False)
+                        # Non-stored vectors cannot be returned, so they must also be hidden.
+                        stored=store_vectors,
+                        hidden=not store_vectors)
                 ],
                 vector_search=VectorSearch(
                     algorithms=[
@@ -102,16 +140,21 @@ def setup_index(azure_credential, index_name, azure_search_endpoint, azure_stora
                     ],
                     vectorizers=[
                         AzureOpenAIVectorizer(
-                            name="openai_vectorizer",
-                            azure_open_ai_parameters=AzureOpenAIParameters(
-                                resource_uri=azure_openai_embedding_endpoint,
-                                deployment_id=azure_openai_embedding_deployment,
+                            vectorizer_name="openai_vectorizer",
+                            parameters=AzureOpenAIVectorizerParameters(
+                                resource_url=azure_openai_embedding_endpoint,
+                                deployment_name=azure_openai_embedding_deployment,
                                 model_name=azure_openai_embedding_model
                             )
                         )
                     ],
+                    compressions=[compression] if compression else None,
                     profiles=[
-                        VectorSearchProfile(name="vp", algorithm_configuration_name="algo", vectorizer="openai_vectorizer")
+                        VectorSearchProfile(
+                            name="vp",
+                            algorithm_configuration_name="algo",
+                            vectorizer_name="openai_vectorizer",
+                            compression_name=compression.compression_name if compression else None)
                     ]
                 ),
                 semantic_search=SemanticSearch(
@@ -144,15 +187,15 @@ def setup_index(azure_credential, index_name, azure_search_endpoint, azure_stora
                         outputs=[OutputFieldMappingEntry(name="textItems", target_name="pages")]),
                     AzureOpenAIEmbeddingSkill(
                         context="/document/pages/*",
-                        resource_uri=azure_openai_embedding_endpoint,
+                        resource_url=azure_openai_embedding_endpoint,
                         api_key=None,
-                        deployment_id=azure_openai_embedding_deployment,
+                        deployment_name=azure_openai_embedding_deployment,
                         model_name=azure_openai_embedding_model,
                         dimensions=azure_openai_embeddings_dimensions,
                         inputs=[InputFieldMappingEntry(name="text", source="/document/pages/*")],
                         outputs=[OutputFieldMappingEntry(name="embedding", target_name="text_vector")])
                 ],
-                index_projections=SearchIndexerIndexProjections(
+                index_projection=SearchIndexerIndexProjection(
                     selectors=[
                         SearchIndexerIndexProjectionSelector(
                             target_index_name=index_name,
@@ -184,28 +227,64 @@ def setup_index(azure_credential, index_name, azure_search_endpoint, azure_stora
             )
         )
 
-def upload_documents(azure_credential, indexer_name, azure_search_endpoint, azure_storage_endpoint, azure_storage_container):
+def _file_sha256(path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as opened_file:
+        while chunk := opened_file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def plan_uploads(local_hashes: dict[str, str], remote_hashes: dict[str, Optional[str]]) -> list[str]:
+    """Return the local files that are new or whose content hash differs from the blob's metadata."""
+    return sorted(name for name, digest in local_hashes.items() if remote_hashes.get(name) != digest)
+
+
+def _upload_file(container_client, path: str, filename: str, digest: str) -> None:
+    with open(path, "rb") as opened_file:
+        # Files above max_single_put_size go up as blocks, several in flight per blob.
+        container_client.upload_blob(
+            filename, opened_file, overwrite=True,
+            metadata={CONTENT_HASH_METADATA_KEY: digest},
+            max_concurrency=BLOCK_UPLOAD_CONCURRENCY)
+
+
+def upload_documents(azure_credential, indexer_name, azure_search_endpoint, azure_storage_endpoint, azure_storage_container, data_directory="data", max_concurrency=UPLOAD_MAX_CONCURRENCY):
+    """Upload new or changed files from ``data_directory`` and run the indexer only if something changed."""
     indexer_client = SearchIndexerClient(azure_search_endpoint, azure_credential)
-    # Upload the documents in /data folder to the blob storage container
     blob_client = BlobServiceClient(
         account_url=azure_storage_endpoint, credential=azure_credential,
-        max_single_put_size=4 * 1024 * 1024
+        max_single_put_size=4 * 1024 * 1024,
+        max_block_size=4 * 1024 * 1024
     )
     container_client = blob_client.get_container_client(azure_storage_container)
     if not container_client.exists():
         container_client.create_container()
-    existing_blobs = [blob.name for blob in container_client.list_blobs()]
-
-    # Open each file in /data folder
-    for file in os.scandir("data"):
-        with open(file.path, "rb") as opened_file:
-            filename = os.path.basename(file.path)
-            # Check if blob already exists
-            if filename in existing_blobs:
-                logger.info("Blob already exists, skipping file: %s", filename)
-            else:
-                logger.info("Uploading blob for file: %s", filename)
-                blob_client = container_client.upload_blob(filename, opened_file, overwrite=True)
+
+    # Only the name and content hash of each blob are kept while paging through the listing.
+    remote_hashes = {
+        blob.name: (blob.metadata or {}).get(CONTENT_HASH_METADATA_KEY)
+        for blob in container_client.list_blobs(include=["metadata"])
+    }
+
+    local_paths = {os.path.basename(entry.path): entry.path for entry in os.scandir(data_directory) if entry.is_file()}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        local_hashes = dict(zip(local_paths, pool.map(_file_sha256, local_paths.values())))
+
+    changed = plan_uploads(local_hashes, remote_hashes)
+    logger.info("%d of %d documents are new or changed", len(changed), len(local_hashes))
+    if not changed:
+        logger.info("No new or changed documents, not starting the indexer")
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = {
+            pool.submit(_upload_file, container_client, local_paths[filename], filename, local_hashes[filename]): filename
+            for filename in changed
+        }
+        for future in as_completed(futures):
+            future.result()
+            logger.info("Uploaded blob for file: %s", futures[future])
 
     # Start the indexer
     try:
@@ -213,6 +292,7 @@ def upload_documents(azure_credential, indexer_name, azure_search_endpoint, azur
         logger.info("Indexer started. Any unindexed blobs should be indexed in a few minutes, check the Azure Portal for status.")
     except ResourceExistsError:
         logger.info("Indexer already running, not starting again")
+    return True
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.WARNING, format="%(message)s", datefmt="[%X]", handlers=[RichHandler(rich_tracebacks=True)])
@@ -235,7 +315,11 @@ if __name__ == "__main__":
     AZURE_OPENAI_EMBEDDING_ENDPOINT = os.environ["AZURE_OPENAI_EASTUS2_ENDPOINT"]
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.environ["AZURE_OPENAI_EMBEDDING_DEPLOYMENT"]
     AZURE_OPENAI_EMBEDDING_MODEL = os.environ["AZURE_OPENAI_EMBEDDING_MODEL"]
-    EMBEDDINGS_DIMENSIONS = 3072
+    # Vector options only apply when the index is created; delete the index to rebuild it with new ones.
+    EMBEDDINGS_DIMENSIONS = int(os.environ.get("AZURE_SEARCH_EMBEDDING_DIMENSIONS", "3072"))
+    VECTOR_COMPRESSION = os.environ.get("AZURE_SEARCH_VECTOR_COMPRESSION", "none").strip().lower()
+    VECTOR_OVERSAMPLING = float(os.environ.get("AZURE_SEARCH_VECTOR_OVERSAMPLING", "4"))
+    STORE_VECTORS = os.environ.get("AZURE_SEARCH_STORE_VECTORS", "true").strip().lower() in {"1", "true", "yes", "on"}
     AZURE_SEARCH_ENDPOINT = os.environ["AZURE_SEARCH_ENDPOINT"]
     AZURE_STORAGE_ENDPOINT = os.environ["AZURE_STORAGE_ENDPOINT"]
     AZURE_STORAGE_CONNECTION_STRING = os.environ["AZURE_STORAGE_CONNECTION_STRING"]
@@ -251,7 +335,10 @@ if __name__ == "__main__":
         azure_openai_embedding_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
         azure_openai_embedding_deployment=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
         azure_openai_embedding_model=AZURE_OPENAI_EMBEDDING_MODEL,
-        azure_openai_embeddings_dimensions=EMBEDDINGS_DIMENSIONS)
+        azure_openai_embeddings_dimensions=EMBEDDINGS_DIMENSIONS,
+        vector_compression=VECTOR_COMPRESSION,
+        vector_oversampling=VECTOR_OVERSAMPLING,
+        store_vectors=STORE_VECTORS)
 
     upload_documents(azure_credential,
         indexer_name=AZURE_SEARCH_INDEX,
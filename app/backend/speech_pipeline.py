@@ -0,0 +1,250 @@
+import asyncio
+import base64
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Callable, Optional, Protocol
+
+from aiohttp import WSMsgType, web
+
+import json_codec
+from conversation_memory import ConversationMemory, estimate_message_tokens
+
+logger = logging.getLogger("speech-pipeline")
+
+# The realtime frontend records and plays 24 kHz 16-bit mono PCM, so the pipeline defaults to the same.
+PIPELINE_SAMPLE_RATE = 24000
+
+
+@dataclass
+class Utterance:
+    text: str
+    speech_ended_at: float
+    recognized_at: float
+
+
+@dataclass
+class PipelineTurnTimings:
+    """Per-turn stage latencies in milliseconds, measured from the end of the guest's speech."""
+
+    stt_ms: Optional[float] = None
+    llm_first_token_ms: Optional[float] = None
+    first_sentence_ms: Optional[float] = None
+    first_audio_ms: Optional[float] = None
+    total_ms: Optional[float] = None
+    sentences: int = 0
+    audio_bytes: int = 0
+    # Prompt size from the ~4 characters per token estimate, not the provider's usage report.
+    estimated_input_tokens: Optional[int] = None
+
+
+class StreamingRecognizer(Protocol):
+    def write(self, audio: bytes) -> None: ...
+
+    async def start(self) -> None: ...
+
+    async def stop(self) -> None: ...
+
+
+RecognizerFactory = Callable[[int, Callable[[Utterance], None]], StreamingRecognizer]
+CompletionStream = Callable[[list[dict]], AsyncIterator[str]]
+SynthesisStream = Callable[[str], AsyncIterator[bytes]]
+
+
+class SentenceSegmenter:
+    """Incrementally split streamed completion text into sentences that can be synthesized on their own."""
+
+    _BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+
+    def __init__(self, min_chars: int = 16):
+        # Very short sentences ("Sure!") are merged into the next one so TTS is not called for fragments.
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in self._BOUNDARY.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return remainder or None
+
+
+class PipelineSession:
+    """Runs one guest's STT -> LLM -> TTS pipeline over a WebSocket.
+
+    Audio arrives as binary PCM frames (or realtime-style ``input_audio_buffer.append`` commands), every
+    recognized utterance starts a turn, and each sentence of the streamed completion is synthesized and
+    sent back as soon as it is complete. A new utterance cancels the turn still in progress.
+    """
+
+    def __init__(
+        self,
+        ws: web.WebSocketResponse,
+        recognizer_factory: RecognizerFactory,
+        complete: CompletionStream,
+        synthesize: SynthesisStream,
+        system_message: str,
+        sample_rate: int = PIPELINE_SAMPLE_RATE,
+        memory: Optional[ConversationMemory] = None,
+    ):
+        self.ws = ws
+        self.system_message = system_message
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self._recognizer_factory = recognizer_factory
+        self._complete = complete
+        self._synthesize = synthesize
+        self._utterances: asyncio.Queue[Utterance] = asyncio.Queue()
+        self._turn_count = 0
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_recognized(utterance: Utterance) -> None:
+            # Recognizer callbacks fire on SDK threads.
+            loop.call_soon_threadsafe(self._utterances.put_nowait, utterance)
+
+        recognizer = self._recognizer_factory(self.sample_rate, on_recognized)
+        await recognizer.start()
+        responder = asyncio.create_task(self._respond_loop())
+        try:
+            async for msg in self.ws:
+                if msg.type == WSMsgType.BINARY:
+                    recognizer.write(msg.data)
+                elif msg.type == WSMsgType.TEXT:
+                    message = json_codec.loads(msg.data)
+                    if message.get("type") == "input_audio_buffer.append":
+                        recognizer.write(base64.b64decode(message["audio"]))
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            try:
+                await recognizer.stop()
+            finally:
+                responder.cancel()
+                await asyncio.gather(responder, return_exceptions=True)
+
+    async def _respond_loop(self) -> None:
+        current: Optional[asyncio.Task] = None
+        try:
+            while True:
+                utterance = await self._utterances.get()
+                if current is not None and not current.done():
+                    logger.info("Guest spoke over the current response; cancelling it")
+                    current.cancel()
+                    await asyncio.gather(current, return_exceptions=True)
+                current = asyncio.create_task(self._respond(utterance))
+        finally:
+            if current is not None and not current.done():
+                current.cancel()
+
+    def build_messages(self, utterance: Utterance) -> list[dict]:
+        if self.memory is None:
+            return [
+                {"role": "system", "content": self.system_message},
+                {"role": "user", "content": utterance.text},
+            ]
+        return self.memory.build_messages(utterance.text)
+
+    async def _respond(self, utterance: Utterance) -> Optional[PipelineTurnTimings]:
+        """Run one turn. A failing completion or synthesis is logged and reported to the client as an
+        ``error`` followed by a failed ``response.done``, so the guest's turn ends instead of stalling."""
+        self._turn_count += 1
+        turn_id = f"turn_{self._turn_count}"
+        try:
+            return await self._run_turn(utterance, turn_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Pipeline turn %s failed", turn_id)
+            try:
+                await self.ws.send_json({
+                    "type": "error",
+                    "error": {"type": "pipeline_error", "message": "The response could not be generated.", "turn_id": turn_id},
+                }, dumps=json_codec.dumps)
+                await self.ws.send_json({
+                    "type": "response.done",
+                    "response": {"id": turn_id, "status": "failed", "output": []},
+                }, dumps=json_codec.dumps)
+            except ConnectionResetError:
+                logger.debug("Client left before turn %s's failure could be reported", turn_id)
+            return None
+
+    async def _run_turn(self, utterance: Utterance, turn_id: str) -> PipelineTurnTimings:
+        timings = PipelineTurnTimings(stt_ms=_elapsed_ms(utterance.speech_ended_at, utterance.recognized_at))
+
+        def elapsed() -> float:
+            return _elapsed_ms(utterance.speech_ended_at, time.perf_counter())
+
+        await self.ws.send_json({
+            "type": "conversation.item.input_audio_transcription.completed",
+            "transcript": utterance.text,
+        }, dumps=json_codec.dumps)
+
+        sentences: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        reply: list[str] = []
+        messages = self.build_messages(utterance)
+        timings.estimated_input_tokens = estimate_message_tokens(messages)
+
+        async def produce_sentences() -> None:
+            segmenter = SentenceSegmenter()
+            try:
+                async for delta in self._complete(messages):
+                    if timings.llm_first_token_ms is None:
+                        timings.llm_first_token_ms = elapsed()
+                    reply.append(delta)
+                    for sentence in segmenter.feed(delta):
+                        if timings.first_sentence_ms is None:
+                            timings.first_sentence_ms = elapsed()
+                        sentences.put_nowait(sentence)
+                if (tail := segmenter.flush()) is not None:
+                    if timings.first_sentence_ms is None:
+                        timings.first_sentence_ms = elapsed()
+                    sentences.put_nowait(tail)
+            finally:
+                sentences.put_nowait(None)
+
+        # The completion keeps streaming while earlier sentences are synthesized.
+        producer = asyncio.create_task(produce_sentences())
+        try:
+            while (sentence := await sentences.get()) is not None:
+                timings.sentences += 1
+                await self.ws.send_json({"type": "response.audio_transcript.delta", "delta": sentence + " "}, dumps=json_codec.dumps)
+                async for chunk in self._synthesize(sentence):
+                    if timings.first_audio_ms is None:
+                        timings.first_audio_ms = elapsed()
+                    timings.audio_bytes += len(chunk)
+                    await self.ws.send_json({
+                        "type": "response.audio.delta",
+                        "delta": base64.b64encode(chunk).decode("ascii"),
+                    }, dumps=json_codec.dumps)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+        timings.total_ms = elapsed()
+        if self.memory is not None:
+            self.memory.add_turn(utterance.text, "".join(reply))
+        await self.ws.send_json({
+            "type": "response.done",
+            "response": {"id": turn_id, "output": [{"content": [{"type": "audio", "transcript": "".join(reply)}]}]},
+        }, dumps=json_codec.dumps)
+        await self.ws.send_json({"type": "extension.pipeline_timings", "timings": asdict(timings)}, dumps=json_codec.dumps)
+        logger.info("Pipeline turn %s timings: %s", turn_id, timings)
+        return timings
+
+
+def _elapsed_ms(start: float, end: float) -> float:
+    return round(max(0.0, end - start) * 1000, 1)
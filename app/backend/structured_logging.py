@@ -0,0 +1,168 @@
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+# One mutable dict per realtime session. Tasks spawned by the session copy the context and so share the
+# dict, which lets the relay move the round-trip token forward for every task at once.
+_session_context: contextvars.ContextVar[Optional[dict[str, Any]]] = contextvars.ContextVar("session_log_context", default=None)
+
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None))
+
+
+def bind_session_context(session_token: str, round_trip_token: Optional[str] = None) -> None:
+    """Attach the session's tokens to every record logged from the current task and its children."""
+    _session_context.set({"session_token": session_token, "round_trip_token": round_trip_token})
+
+
+def set_round_trip_token(round_trip_token: str) -> None:
+    if (context := _session_context.get()) is not None:
+        context["round_trip_token"] = round_trip_token
+
+
+class SessionContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _session_context.get()
+        record.session_token = context["session_token"] if context else None
+        record.round_trip_token = context["round_trip_token"] if context else None
+        return True
+
+
+class SessionSampler(logging.Filter):
+    """Keeps a deterministic fraction of sessions and caps each session's records per second.
+
+    Warnings and errors always pass, as do records logged outside a session. Sampling hashes the session
+    token, so a sampled session is logged in full rather than as scattered lines.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, rate_limit: float = 0.0, burst: Optional[float] = None):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(1.0, rate_limit * 2)
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _sampled(self, session_token: str) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        digest = hashlib.blake2b(session_token.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2**64 < self.sample_rate
+
+    def _take_token(self, session_token: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(session_token, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate_limit)
+            if tokens < 1.0:
+                self._buckets[session_token] = (tokens, now)
+                return False
+            self._buckets[session_token] = (tokens - 1.0, now)
+            if len(self._buckets) > 10_000:
+                # Forget sessions that have been quiet long enough to have a full bucket again.
+                horizon = now - self.burst / self.rate_limit
+                self._buckets = {token: entry for token, entry in self._buckets.items() if entry[1] > horizon}
+            return True
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        session_token = getattr(record, "session_token", None)
+        if record.levelno >= logging.WARNING or session_token is None:
+            return True
+        keep = self._sampled(session_token) and (self.rate_limit <= 0 or self._take_token(session_token))
+        if not keep:
+            self.dropped += 1
+        return keep
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if session_token := getattr(record, "session_token", None):
+            entry["session_token"] = session_token
+        if round_trip_token := getattr(record, "round_trip_token", None):
+            entry["round_trip_token"] = round_trip_token
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread.
+
+    ``QueueHandler.prepare`` renders every message on the calling thread. Here records whose arguments are
+    immutable are queued as they are; only records with mutable arguments (which could change before the
+    listener gets to them) or exceptions are rendered up front. A full queue drops the record instead of
+    blocking the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        args = record.args if isinstance(record.args, tuple) else (record.args,) if record.args else ()
+        if not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """Route all logging through a bounded queue to a background writer; call ``stop()`` on shutdown.
+
+    ``LOG_LEVEL``, ``LOG_FORMAT`` (``json`` or ``text``), ``LOG_SAMPLE_RATE`` (fraction of sessions logged
+    below WARNING), ``LOG_SESSION_RATE_LIMIT``/``LOG_SESSION_BURST`` (records per second per session, 0 for
+    no limit) and ``LOG_QUEUE_SIZE`` configure the pipeline.
+    """
+    log_queue: queue.Queue = queue.Queue(maxsize=int(os.environ.get("LOG_QUEUE_SIZE", 10_000)))
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SessionContextFilter())
+    rate_limit = float(os.environ.get("LOG_SESSION_RATE_LIMIT", 20))
+    burst = os.environ.get("LOG_SESSION_BURST")
+    queue_handler.addFilter(SessionSampler(
+        sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", 1.0)),
+        rate_limit=rate_limit,
+        burst=float(burst) if burst else None,
+    ))
+
+    writer = logging.StreamHandler(sys.stderr)
+    if os.environ.get("LOG_FORMAT", "json").lower() == "json":
+        writer.setFormatter(JsonFormatter())
+    else:
+        writer.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(session_token)s %(message)s"))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
+    listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,158 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import aiohttp
+from aiohttp import WSCloseCode, web
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from admission import AdmissionController, AdmissionRejected
+from order_state import order_state_singleton
+from rtmt import RTMiddleTier
+
+
+class AdmissionControllerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_per_ip_limit_rejects_without_queueing(self):
+        controller = AdmissionController(max_sessions=10, max_sessions_per_store=10, max_sessions_per_ip=1, retry_after_ms=1000)
+        await controller.acquire("store-1", "10.0.0.1")
+        with self.assertRaises(AdmissionRejected) as caught:
+            await controller.acquire("store-2", "10.0.0.1")
+        self.assertEqual(caught.exception.reason, "client_limit")
+        self.assertTrue(500 <= caught.exception.retry_after_ms <= 1500)
+        self.assertEqual(controller.queued, 0)
+
+    async def test_queued_session_is_admitted_when_a_slot_frees(self):
+        controller = AdmissionController(max_sessions=1, max_sessions_per_ip=0, queue_timeout=1.0)
+        first = await controller.acquire("store-1", "10.0.0.1")
+        waiting = asyncio.create_task(controller.acquire("store-1", "10.0.0.2"))
+        await asyncio.sleep(0)
+        self.assertEqual(controller.queued, 1)
+        controller.release(first)
+        second = await waiting
+        self.assertEqual(second.client_ip, "10.0.0.2")
+        self.assertEqual(controller.stats()["active"], 1)
+
+    async def test_slot_handed_over_at_the_timeout_is_not_leaked(self):
+        controller = AdmissionController(max_sessions=1, max_sessions_per_ip=0, queue_timeout=1.0)
+        first = await controller.acquire("store-1", "10.0.0.1")
+
+        async def wait_for_racing_release(awaitable, timeout):
+            # The slot frees after the timeout fired but before the waiter got to handle it.
+            awaitable.cancel()
+            controller.release(first)
+            raise asyncio.TimeoutError
+
+        with mock.patch("admission.asyncio.wait_for", wait_for_racing_release):
+            second = await controller.acquire("store-1", "10.0.0.2")
+        self.assertEqual(controller.stats()["active"], 1)
+        controller.release(second)
+        self.assertEqual(controller.stats()["active"], 0)
+
+    async def test_freed_slots_go_round_robin_across_stores(self):
+        controller = AdmissionController(max_sessions=1, max_sessions_per_ip=0, queue_timeout=1.0)
+        ticket = await controller.acquire("busy", "ip-0")
+        queued = [("busy", "ip-1"), ("busy", "ip-2"), ("busy", "ip-3"), ("quiet", "ip-4")]
+        tasks = [asyncio.create_task(controller.acquire(store, ip)) for store, ip in queued]
+        await asyncio.sleep(0)
+
+        admitted = []
+        for _ in queued:
+            controller.release(ticket)
+            done, _ = await asyncio.wait([task for task in tasks if not task.done()], return_when=asyncio.FIRST_COMPLETED)
+            ticket = done.pop().result()
+            admitted.append(ticket)
+        self.assertEqual([ticket.store for ticket in admitted], ["busy", "quiet", "busy", "busy"])
+
+    async def test_queue_timeout_and_full_queue_are_rejected(self):
+        controller = AdmissionController(max_sessions=1, max_sessions_per_ip=0, max_queue=1, queue_timeout=0.05)
+        await controller.acquire("store-1", "10.0.0.1")
+        waiting = asyncio.create_task(controller.acquire("store-1", "10.0.0.2"))
+        await asyncio.sleep(0)
+        with self.assertRaises(AdmissionRejected) as full:
+            await controller.acquire("store-2", "10.0.0.3")
+        self.assertEqual(full.exception.reason, "queue_full")
+        with self.assertRaises(AdmissionRejected) as timed_out:
+            await waiting
+        self.assertEqual(timed_out.exception.reason, "queue_timeout")
+        self.assertEqual(controller.queued, 0)
+        self.assertEqual(controller.stats()["rejections"], {"queue_full": 1, "queue_timeout": 1})
+        self.assertNotIn("10.0.0.2", controller._per_ip)
+
+    async def test_cancelled_and_released_sessions_leave_no_counters_behind(self):
+        controller = AdmissionController(max_sessions=1, queue_timeout=1.0)
+        first = await controller.acquire("store-1", "10.0.0.1")
+        waiting = asyncio.create_task(controller.acquire("store-2", "10.0.0.2"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        controller.release(first)
+        self.assertEqual((dict(controller._per_ip), dict(controller._per_store)), ({}, {}))
+
+
+class ClientIpTests(unittest.TestCase):
+    def test_uses_the_entry_the_proxy_appended(self):
+        spoofed = make_mocked_request("GET", "/realtime", headers={"X-Forwarded-For": "1.2.3.4, 203.0.113.7"})
+        self.assertEqual(RTMiddleTier._client_ip(spoofed), "203.0.113.7")
+        self.assertEqual(RTMiddleTier._client_ip(make_mocked_request("GET", "/realtime", headers={"X-Forwarded-For": "203.0.113.7"})), "203.0.113.7")
+
+    def test_falls_back_to_the_peer_address(self):
+        request = make_mocked_request("GET", "/realtime", transport=mock.Mock(get_extra_info=lambda name, default=None: ("198.51.100.2", 4242)))
+        self.assertEqual(RTMiddleTier._client_ip(request), "198.51.100.2")
+
+
+class RealtimeAdmissionTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        order_state_singleton.sessions = {}
+
+        async def upstream_handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for _ in ws:
+                pass
+            return ws
+
+        upstream_app = web.Application()
+        upstream_app.router.add_get("/openai/realtime", upstream_handler)
+        self.upstream_client = TestClient(TestServer(upstream_app))
+        await self.upstream_client.start_server()
+
+        self.rtmt = RTMiddleTier(str(self.upstream_client.make_url("/")), "deployment", AzureKeyCredential("key"))
+        self.rtmt.admission = AdmissionController(max_sessions=1, max_queue=0)
+        app = web.Application()
+        self.rtmt.attach_to_app(app, "/realtime")
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.upstream_client.close()
+
+    async def test_busy_worker_sends_retry_hint_and_frees_slot_on_close(self):
+        first = await self.client.ws_connect("/realtime?storeId=store-1")
+        await first.send_json({"type": "session.update", "session": {}})
+        while self.rtmt.admission.active == 0:
+            await asyncio.sleep(0.01)
+
+        second = await self.client.ws_connect("/realtime?storeId=store-2")
+        busy = await second.receive_json()
+        self.assertEqual(busy["type"], "extension.busy")
+        self.assertEqual(busy["reason"], "queue_full")
+        self.assertGreater(busy["retryAfterMs"], 0)
+        closing = await second.receive()
+        self.assertEqual(closing.type, aiohttp.WSMsgType.CLOSE)
+        self.assertEqual(closing.data, WSCloseCode.TRY_AGAIN_LATER)
+
+        await first.close()
+        while self.rtmt.admission.active:
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.rtmt.admission.stats()["stores"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
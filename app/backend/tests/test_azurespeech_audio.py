@@ -0,0 +1,146 @@
+import os
+import struct
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import httpx
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from openai import APITimeoutError
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from azurespeech import AzureSpeech, parse_wav_header
+from order_state import order_state_singleton
+
+TEST_ENV = {
+    "AZURE_SPEECH_KEY": "test-key",
+    "AZURE_SPEECH_REGION": "eastus",
+    "AZURE_OPENAI_EASTUS_ENDPOINT": "https://example.openai.azure.com",
+    "AZURE_OPENAI_EASTUS_API_KEY": "test-key",
+    "AZURE_OPENAI_API_VERSION": "2024-12-01-preview",
+}
+
+
+def _wav_header(sample_rate: int = 16000, bits_per_sample: int = 16, channels: int = 1, extra_chunk: bytes = b"") -> bytes:
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + extra_chunk + b"data" + struct.pack("<I", 0)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+class ParseWavHeaderTests(unittest.TestCase):
+    def test_parses_standard_header(self):
+        header = parse_wav_header(_wav_header(24000, 16, 1) + b"\x01\x02")
+
+        self.assertIsNotNone(header)
+        self.assertEqual(header.sample_rate, 24000)
+        self.assertEqual(header.bits_per_sample, 16)
+        self.assertEqual(header.channels, 1)
+        self.assertEqual(header.data_offset, 44)
+
+    def test_skips_unknown_chunks_with_padding(self):
+        list_chunk = b"LIST" + struct.pack("<I", 3) + b"abc" + b"\x00"
+        header = parse_wav_header(_wav_header(extra_chunk=list_chunk))
+
+        self.assertIsNotNone(header)
+        self.assertEqual(header.data_offset, 44 + len(list_chunk))
+
+    def test_returns_none_until_header_is_complete(self):
+        raw = _wav_header()
+
+        self.assertIsNone(parse_wav_header(raw[:20]))
+        self.assertIsNone(parse_wav_header(raw[:40]))
+        self.assertIsNotNone(parse_wav_header(raw))
+
+    def test_rejects_non_wave_payloads(self):
+        with self.assertRaises(ValueError):
+            parse_wav_header(b"OggS" + b"\x00" * 40)
+
+
+class TextToSpeechStreamingTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with mock.patch.dict(os.environ, TEST_ENV):
+            self.speech = AzureSpeech("You are a barista.")
+        app = web.Application()
+        self.speech.attach_to_app(app)
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.speech.close()
+
+    async def test_streams_pcm_chunks_without_writing_files(self):
+        async def synthesize(text):
+            yield b"\x01\x00" * 4
+            yield b"\x02\x00" * 4
+
+        self.speech.synthesize_stream = synthesize
+        response = await self.client.post("/azurespeech/text-to-speech", json={"content": "Have a great day!"})
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers["Content-Type"], "audio/pcm")
+        self.assertEqual(response.headers["X-Audio-Sample-Rate"], "24000")
+        self.assertEqual(response.headers["Transfer-Encoding"], "chunked")
+        self.assertEqual(await response.read(), b"\x01\x00" * 4 + b"\x02\x00" * 4)
+        self.assertFalse(Path("response_audio.wav").exists())
+
+    async def test_failure_before_first_chunk_returns_error_status(self):
+        async def synthesize(text):
+            raise RuntimeError("synthesis canceled")
+            yield b""
+
+        self.speech.synthesize_stream = synthesize
+        response = await self.client.post("/azurespeech/text-to-speech", json={"content": "Hello"})
+
+        self.assertEqual(response.status, 500)
+
+
+class GenerateResponseTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with mock.patch.dict(os.environ, TEST_ENV):
+            self.speech = AzureSpeech("You are a barista.")
+        app = web.Application()
+        self.speech.attach_to_app(app)
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.speech.close()
+
+    async def test_openai_timeout_returns_gateway_timeout(self):
+        timeout = APITimeoutError(request=httpx.Request("POST", "https://example.openai.azure.com"))
+        with mock.patch.object(self.speech.aoai_client.chat.completions, "create", mock.AsyncMock(side_effect=timeout)):
+            response = await self.client.post("/azurespeech/generate-response", json={"content": "A latte please"})
+
+        self.assertEqual(response.status, 504)
+        self.assertEqual(await response.json(), {"error": "Response generation timed out."})
+
+
+class ConversationMemoryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with mock.patch.dict(os.environ, TEST_ENV):
+            self.speech = AzureSpeech("You are a barista.")
+
+    async def asyncTearDown(self):
+        await self.speech.close()
+
+    async def test_sessions_keep_memory_without_creating_orders(self):
+        order_state_singleton.sessions = {}
+        session_id, memory = self.speech.get_memory(None)
+        self.assertIs(self.speech.get_memory(session_id)[1], memory)
+        self.assertNotEqual(self.speech.get_memory("unknown")[0], "unknown")
+        self.assertEqual(order_state_singleton.sessions, {})
+
+        self.speech.max_sessions = 1
+        self.speech.get_memory(None)
+        self.assertNotIn(session_id, self.speech._memories)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from rtmt import ClientConnection, RTMiddleTier
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.sent: list[dict] = []
+
+    async def send_json(self, data, dumps=json.dumps):
+        self.sent.append(json.loads(dumps(data)))
+
+
+def frame(**event) -> SimpleNamespace:
+    return SimpleNamespace(data=json.dumps(event, separators=(",", ":")))
+
+
+class BargeInTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.rtmt = RTMiddleTier("https://example.openai.azure.com", "deployment", AzureKeyCredential("key"))
+        self.client_ws = object()
+        self.connection = ClientConnection("session")
+        self.rtmt._connections[self.client_ws] = self.connection
+        self.upstream = FakeUpstream()
+
+    async def to_client(self, **event):
+        return await self.rtmt._process_message_to_client(frame(**event), self.client_ws, self.upstream)
+
+    async def to_server(self, **event):
+        return await self.rtmt._process_message_to_server(frame(**event), self.client_ws)
+
+    async def start_reply(self) -> str:
+        await self.to_client(type="response.created", response={"id": "resp_1"})
+        await self.to_client(type="response.output_item.added", item={"id": "item_1", "type": "message", "role": "assistant"})
+        # 9600 base64 characters of pcm16 at 24 kHz are 150 ms of audio.
+        audio = frame(type="response.audio.delta", item_id="item_1", delta="A" * 9600)
+        self.assertIs(await self.rtmt._process_message_to_client(audio, self.client_ws, self.upstream), audio.data)
+        return audio.data
+
+    async def test_speech_cancels_the_reply_and_drops_its_remaining_audio(self):
+        audio = await self.start_reply()
+        started = await self.to_client(type="input_audio_buffer.speech_started", audio_start_ms=800)
+
+        self.assertIn("speech_started", started)
+        self.assertEqual(self.upstream.sent, [{"type": "response.cancel"}])
+        self.assertIsNone(await self.rtmt._process_message_to_client(SimpleNamespace(data=audio), self.client_ws, self.upstream))
+        self.assertEqual((self.rtmt.barge_ins, self.rtmt.audio_deltas_dropped), (1, 1))
+
+        await self.to_client(type="response.done", response={"id": "resp_1", "status": "cancelled", "output": []})
+        await self.to_client(type="response.created", response={"id": "resp_2"})
+        self.assertIsNotNone(await self.rtmt._process_message_to_client(SimpleNamespace(data=audio), self.client_ws, self.upstream))
+
+    async def test_non_compact_audio_deltas_are_muted_and_counted(self):
+        await self.to_client(type="response.created", response={"id": "resp_1"})
+        await self.to_client(type="response.output_item.added", item={"id": "item_1", "type": "message", "role": "assistant"})
+        # Spaced JSON with "type" not first cannot be peeked, so the relay has to decode it.
+        audio = SimpleNamespace(data=json.dumps({"item_id": "item_1", "delta": "A" * 9600, "type": "response.audio.delta"}, indent=1))
+        self.assertIs(await self.rtmt._process_message_to_client(audio, self.client_ws, self.upstream), audio.data)
+        self.assertGreater(self.connection.audio_forwarded_ms, 150)
+
+        await self.to_client(type="input_audio_buffer.speech_started", audio_start_ms=800)
+        self.assertIsNone(await self.rtmt._process_message_to_client(audio, self.client_ws, self.upstream))
+        self.assertEqual(self.rtmt.audio_deltas_dropped, 1)
+        truncate = json.loads(await self.to_server(type="extension.audio_played", itemId="item_1", playedMs=120))
+        self.assertEqual(truncate["audio_end_ms"], 120)
+
+    async def test_speech_between_replies_is_only_relayed(self):
+        await self.to_client(type="input_audio_buffer.speech_started", audio_start_ms=0)
+        self.assertEqual(self.upstream.sent, [])
+
+    async def test_late_cancel_error_is_not_relayed(self):
+        self.assertIsNone(await self.to_client(type="error", error={"type": "invalid_request_error", "code": "response_cancel_not_active"}))
+        self.assertIsNotNone(await self.to_client(type="error", error={"type": "server_error", "code": None}))
+
+    async def test_playback_report_truncates_the_unheard_audio(self):
+        await self.start_reply()
+        await self.to_client(type="input_audio_buffer.speech_started", audio_start_ms=800)
+
+        truncate = json.loads(await self.to_server(type="extension.audio_played", itemId="item_1", playedMs=90))
+        self.assertEqual(truncate, {"type": "conversation.item.truncate", "item_id": "item_1", "content_index": 0, "audio_end_ms": 90})
+        # Reports are answered once, and never for audio the relay did not send.
+        self.assertIsNone(await self.to_server(type="extension.audio_played", itemId="item_1", playedMs=90))
+        self.assertIsNone(await self.to_server(type="extension.audio_played", itemId="item_0", playedMs=90))
+
+    async def test_malformed_playback_reports_are_ignored(self):
+        await self.start_reply()
+        for played in ("90", None, True, [90], float("nan")):
+            with self.subTest(played=played):
+                report = {"type": "extension.audio_played", "itemId": "item_1", "playedMs": played}
+                self.assertIsNone(self.rtmt._truncate_to_playback(report, self.client_ws))
+        truncate = json.loads(await self.to_server(type="extension.audio_played", itemId="item_1", playedMs=90))
+        self.assertEqual(truncate["audio_end_ms"], 90)
+
+    async def test_playback_report_is_capped_at_the_audio_forwarded(self):
+        await self.start_reply()
+        truncate = json.loads(await self.to_server(type="extension.audio_played", itemId="item_1", playedMs=60_000))
+        self.assertLess(truncate["audio_end_ms"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
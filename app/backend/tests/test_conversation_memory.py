@@ -0,0 +1,74 @@
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from conversation_memory import ConversationMemory, estimate_message_tokens, format_order_state
+from menu_catalog import format_menu_prompt
+from models import OrderItem, OrderSummary
+
+PREFIX = [
+    {"role": "system", "content": "You are a barista."},
+    {"role": "system", "content": "Menu (prices per size):\nDonuts & Bakery: Glazed Donut (standard $1.49)"},
+]
+
+
+class ConversationMemoryTests(unittest.TestCase):
+    def test_prefix_is_byte_stable_across_turns(self):
+        memory = ConversationMemory(PREFIX)
+        first = json.dumps(memory.build_messages("hi")[:2])
+        memory.add_turn("hi", "Welcome to Dunkin!")
+        second = json.dumps(memory.build_messages("a donut please")[:2])
+
+        self.assertEqual(first, second)
+
+    def test_history_precedes_latest_utterance(self):
+        memory = ConversationMemory(PREFIX)
+        memory.add_turn("a glazed donut", "Added a glazed donut.")
+
+        messages = memory.build_messages("that's all")
+
+        self.assertEqual([m["role"] for m in messages], ["system", "system", "user", "assistant", "user"])
+        self.assertEqual(messages[-1]["content"], "that's all")
+
+    def test_order_state_is_compact(self):
+        summary = OrderSummary(
+            items=[OrderItem(item="Glazed Donut", size="standard", quantity=1, price=1.49, display="Glazed Donut")],
+            total=1.49,
+            tax=0.12,
+            finalTotal=1.61,
+        )
+        self.assertEqual(
+            format_order_state(summary),
+            'Current order state: {"items":[{"item":"Glazed Donut","size":"standard","qty":1,"price":1.49}],"total":1.61}',
+        )
+
+    def test_evicts_oldest_turns_down_to_low_water(self):
+        turn_tokens = estimate_message_tokens([
+            {"role": "user", "content": "x" * 40},
+            {"role": "assistant", "content": "y" * 40},
+        ])
+        memory = ConversationMemory(PREFIX, max_history_tokens=turn_tokens * 5, low_water=0.6)
+        for _ in range(5):
+            memory.add_turn("x" * 40, "y" * 40)
+        self.assertEqual(memory.turn_count, 5)
+
+        memory.add_turn("x" * 40, "y" * 40)
+
+        self.assertEqual(memory.turn_count, 3)
+        self.assertLessEqual(memory.history_tokens, turn_tokens * 5 * 0.6)
+
+
+class MenuPromptTests(unittest.TestCase):
+    def test_formats_categories_with_sized_prices(self):
+        menu = {"menuItems": [{"category": "Cold Beverages", "items": [
+            {"name": "Original Cold Brew", "sizes": [{"size": "small", "price": 3.79}, {"size": "large", "price": 4.79}]},
+        ]}]}
+
+        self.assertEqual(format_menu_prompt(menu), "Cold Beverages: Original Cold Brew (small $3.79, large $4.79)")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from event_sink import SqliteEventSink
+from order_state import order_state_singleton
+from rtmt import RTMiddleTier
+
+
+class SqliteEventSinkTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name) / "events.db"
+
+    def rows(self) -> list[tuple]:
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute("SELECT kind, session_token, round_trip_token, payload FROM events ORDER BY id").fetchall()
+
+    async def test_events_are_group_committed_in_wal_mode(self):
+        sink = SqliteEventSink(self.path, batch_size=10, flush_interval=0.01)
+        await sink.start()
+        for i in range(25):
+            self.assertTrue(sink.emit("guest_transcript", "token", f"token-{i:04d}", {"transcript": f"turn {i}"}))
+        await sink.close()
+
+        rows = self.rows()
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(json.loads(rows[-1][3]), {"transcript": "turn 24"})
+        self.assertLessEqual(sink.batches, 3)
+        self.assertEqual(sink.metrics()["written"], 25)
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    async def test_full_queue_drops_newest_by_default(self):
+        sink = SqliteEventSink(self.path, max_queue=3)
+        results = [sink.emit("round_trip", "token", None, {"round_trip_index": i}) for i in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        await sink.start()
+        await sink.close()
+        self.assertEqual([json.loads(row[3])["round_trip_index"] for row in self.rows()], [0, 1, 2])
+        self.assertEqual(sink.metrics()["dropped"], 2)
+
+    async def test_drop_oldest_keeps_the_latest_events(self):
+        sink = SqliteEventSink(self.path, max_queue=3, drop_policy="drop_oldest")
+        for i in range(5):
+            sink.emit("round_trip", "token", None, {"round_trip_index": i})
+        await sink.start()
+        await sink.close()
+        self.assertEqual([json.loads(row[3])["round_trip_index"] for row in self.rows()], [2, 3, 4])
+
+    def test_unknown_drop_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            SqliteEventSink(self.path, drop_policy="block")
+
+    async def test_order_changes_and_relay_events_are_recorded(self):
+        order_state_singleton.sessions = {}
+        sink = SqliteEventSink(self.path)
+        order_state_singleton.add_listener(sink.record_order_event)
+        self.addCleanup(order_state_singleton.listeners.remove, sink.record_order_event)
+        rtmt = RTMiddleTier("https://example.openai.azure.com", "deployment", AzureKeyCredential("key"))
+        rtmt.event_sink = sink
+
+        session_id = order_state_singleton.create_session()
+        token = order_state_singleton.get_session_identifiers(session_id).session_token
+        order_state_singleton.handle_order_update(session_id, "add", "Iced Latte", "medium", 2, 4.29)
+        rtmt._session_map[None] = session_id
+        transcript = {"type": "conversation.item.input_audio_transcription.completed", "item_id": "item_1", "transcript": "Two iced lattes"}
+        await rtmt._process_message_to_client(SimpleNamespace(data=json.dumps(transcript)), None, None)
+        order_state_singleton.delete_session(session_id)
+
+        await sink.start()
+        await sink.close()
+        rows = self.rows()
+        self.assertEqual([row[0] for row in rows], ["session_created", "order_updated", "guest_transcript", "session_ended"])
+        self.assertTrue(all(row[1] == token for row in rows))
+        self.assertEqual(json.loads(rows[1][3])["item_count"], 2)
+        self.assertEqual(json.loads(rows[2][3])["transcript"], "Two iced lattes")
+        self.assertEqual(json.loads(rows[3][3])["handed_off"], False)
+
+
+if __name__ == "__main__":
+    unittest.main()
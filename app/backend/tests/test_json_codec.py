@@ -0,0 +1,82 @@
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import json_codec
+from benchmarks.relay_json import DEFAULT_EVENTS, load_frames, run_benchmark
+from rtmt import RTMiddleTier
+
+
+def installed_backends():
+    for name in json_codec.BACKENDS:
+        try:
+            yield json_codec.load_backend(name)
+        except ImportError:
+            continue
+
+
+class JsonCodecTests(unittest.TestCase):
+    def test_backends_round_trip_recorded_events_identically(self):
+        for frame in load_frames(DEFAULT_EVENTS):
+            expected = json_codec.load_backend("stdlib")[2](frame["frame"])
+            for name, dumps_bytes, loads in installed_backends():
+                with self.subTest(backend=name, event=frame["type"]):
+                    self.assertEqual(loads(frame["frame"]), expected)
+                    self.assertEqual(loads(frame["frame"].encode("utf-8")), expected)
+                    self.assertEqual(loads(dumps_bytes(expected)), expected)
+
+    def test_stdlib_output_is_compact(self):
+        _, dumps_bytes, _ = json_codec.load_backend("stdlib")
+        self.assertEqual(dumps_bytes({"type": "response.create", "note": "café"}), '{"type":"response.create","note":"café"}'.encode("utf-8"))
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            json_codec.load_backend("simplejson")
+
+    def test_peek_type_only_trusts_a_leading_type_key(self):
+        self.assertEqual(json_codec.peek_type('{"type":"response.audio.delta","delta":"AAAA"}'), "response.audio.delta")
+        self.assertEqual(json_codec.peek_type(b'{"type":"response.done"}'), "response.done")
+        self.assertIsNone(json_codec.peek_type('{"event_id":"e1","type":"response.done"}'))
+        self.assertIsNone(json_codec.peek_type('{ "type": "response.done"}'))
+        self.assertIsNone(json_codec.peek_type('{"type":"response.\\u0064one"}'))
+
+    def test_peek_value_span_reads_raw_values(self):
+        frame = '{"type":"response.audio_transcript.delta","item_id":"item_1","content_index":0,"delta":"a \\"b\\\\"}'
+
+        def peek(key):
+            span = json_codec.peek_value_span(frame, key)
+            return span and frame[span[0]:span[1]]
+
+        self.assertEqual(peek("item_id"), "item_1")
+        self.assertEqual(peek("content_index"), "0")
+        self.assertEqual(peek("delta"), 'a \\"b\\\\')
+        self.assertIsNone(peek("response_id"))
+
+
+class RelayPassThroughTests(unittest.IsolatedAsyncioTestCase):
+    async def test_uninspected_events_are_relayed_without_decoding(self):
+        rtmt = RTMiddleTier("https://example.openai.azure.com", "deployment", AzureKeyCredential("key"))
+        frames = {frame["type"]: frame["frame"] for frame in load_frames(DEFAULT_EVENTS)}
+        audio = frames["response.audio.delta"]
+        self.assertIs(await rtmt._process_message_to_client(SimpleNamespace(data=audio), None, None), audio)
+        append = frames["input_audio_buffer.append"]
+        self.assertIs(await rtmt._process_message_to_server(SimpleNamespace(data=append), None), append)
+
+        rtmt.system_message = "You take coffee orders."
+        update = await rtmt._process_message_to_server(SimpleNamespace(data=frames["session.update"]), None)
+        self.assertEqual(json_codec.loads(update)["session"]["instructions"], "You take coffee orders.")
+
+    def test_benchmark_reports_every_installed_backend(self):
+        report = run_benchmark(DEFAULT_EVENTS, iterations=2)
+        self.assertEqual([result["backend"] for result in report["results"]], [name for name, *_ in installed_backends()])
+        for result in report["results"]:
+            self.assertLess(result["turn_peek_us"], result["turn_decode_all_us"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import math
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from menu_catalog import MenuCatalog
+from order_state import order_state_singleton
+from tools import update_order
+
+MENU = {
+    "menuItems": [
+        {
+            "category": "Signature Lattes",
+            "items": [
+                {"name": "Caramel Craze Latte", "sizes": [{"size": "small", "price": 4.49}, {"size": "medium", "price": 4.99}]},
+                {"name": "Cocoa Mocha Latte", "sizes": [{"size": "small", "price": 4.59}, {"size": "medium", "price": 5.09}]},
+            ],
+        },
+        {
+            "category": "Donuts & Bakery",
+            "items": [
+                {"name": "Boston Kreme Donut", "sizes": [{"size": "standard", "price": 1.79}], "aliases": ["boston cream"]},
+                {"name": "MUNCHKINS® Donut Hole Treats (10 ct)", "sizes": [{"size": "standard", "price": 3.99}]},
+                {"name": "Everything Bagel & Cream Cheese", "sizes": [{"size": "standard", "price": 3.29}]},
+            ],
+        },
+        {
+            "category": "Breakfast Sandwiches",
+            "items": [
+                {"name": "Bacon Egg & Cheese on Croissant", "sizes": [{"size": "standard", "price": 4.99}]},
+                {"name": "Turkey Sausage Wake-Up Wrap", "sizes": [{"size": "standard", "price": 2.59}]},
+            ],
+        },
+        {
+            "category": "Extras",
+            "items": [{"name": "Extra Espresso Shot", "sizes": [{"size": "standard", "price": 1.0}]}],
+        },
+    ]
+}
+
+
+class MenuCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.catalog = MenuCatalog(MENU, aliases={"donut holes": "MUNCHKINS® Donut Hole Treats (10 ct)"})
+
+    def test_names_resolve_by_exact_alias_and_near_exact_spelling(self):
+        cases = {
+            "caramel craze latte": "Caramel Craze Latte",
+            "Boston Cream": "Boston Kreme Donut",
+            "donut holes": "MUNCHKINS® Donut Hole Treats (10 ct)",
+            "carmel craze latte": "Caramel Craze Latte",
+            "Boston Kreme Donuts": "Boston Kreme Donut",
+        }
+        for spoken, name in cases.items():
+            with self.subTest(spoken=spoken):
+                self.assertEqual(self.catalog.resolve(spoken).name, name)
+
+    def test_unknown_or_ambiguous_names_do_not_resolve(self):
+        self.assertIsNone(self.catalog.resolve("Cappuccino"))
+        self.assertIsNone(self.catalog.resolve("latte"))
+
+    def test_near_miss_names_do_not_resolve(self):
+        for spoken in ("Espresso", "Bagel", "Sandwich", "Wrap", "munchkins", "cocoa mocha", "Iced Caramel Craze Latte"):
+            with self.subTest(spoken=spoken):
+                self.assertIsNone(self.catalog.resolve(spoken))
+
+    def test_items_sharing_words_are_not_confused(self):
+        for spoken in ("Sausage Egg and Cheese Croissant", "Bacon Egg and Cheese Wrap", "Cocoa Craze Latte"):
+            with self.subTest(spoken=spoken):
+                self.assertIsNone(self.catalog.resolve(spoken))
+
+    def test_sizes_are_normalized_and_priced(self):
+        match = self.catalog.resolve("Caramel Craze Latte", "Regular")
+        self.assertEqual((match.size, match.price), ("medium", 4.99))
+        donut = self.catalog.resolve("Boston Kreme Donut", "large")
+        self.assertEqual((donut.size, donut.price), ("standard", 1.79))
+        unpriced = self.catalog.resolve("Caramel Craze Latte", "extra large")
+        self.assertEqual((unpriced.size, unpriced.price), (None, None))
+
+
+class UpdateOrderPricingTests(unittest.TestCase):
+    def setUp(self):
+        order_state_singleton.sessions = {}
+        self.session_id = order_state_singleton.create_session()
+
+    def add(self, item_name: str, size: str, **extra) -> None:
+        args = {"action": "add", "item_name": item_name, "size": size, "quantity": 2, **extra}
+        asyncio.run(update_order(args, self.session_id))
+
+    def test_menu_price_replaces_the_models_guess(self):
+        self.add("carmel craze latte", "Large", price=3.0)
+        item = order_state_singleton.get_order_summary(self.session_id).items[0]
+        self.assertEqual((item.item, item.size, item.price), ("Caramel Craze Latte", "large", 5.49))
+        self.assertTrue(math.isclose(order_state_singleton.get_order_summary(self.session_id).total, 10.98, rel_tol=1e-9))
+
+    def test_price_is_optional_for_menu_items(self):
+        self.add("Glazed Donut", "standard")
+        self.assertEqual(order_state_singleton.get_order_summary(self.session_id).items[0].price, 1.49)
+
+    def test_off_menu_items_keep_the_given_price(self):
+        self.add("Pumpkin Muffin", "standard", price=2.79)
+        item = order_state_singleton.get_order_summary(self.session_id).items[0]
+        self.assertEqual((item.item, item.price), ("Pumpkin Muffin", 2.79))
+
+    def test_removal_matches_the_canonical_entry(self):
+        self.add("Caramel Craze Latte", "medium")
+        asyncio.run(update_order({"action": "remove", "item_name": "caramel craze lattes", "size": "Medium", "quantity": 2}, self.session_id))
+        self.assertEqual(order_state_singleton.get_order_summary(self.session_id).items, [])
+
+    def test_unpriced_items_are_refused_rather_than_added_for_free(self):
+        for item_name, size in (("Sausage Egg and Cheese Croissant", "standard"), ("Caramel Craze Latte", "extra large")):
+            with self.subTest(item_name=item_name):
+                result = asyncio.run(update_order({"action": "add", "item_name": item_name, "size": size, "quantity": 1}, self.session_id))
+                self.assertIn("Nothing was changed", result.to_text())
+        self.assertEqual(order_state_singleton.get_order_summary(self.session_id).items, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
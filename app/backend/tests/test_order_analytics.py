@@ -0,0 +1,135 @@
+import sys
+import unittest
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from order_analytics import OrderAnalytics, RollingCounters, SpaceSavingTopK
+from order_state import OrderEvent, order_state_singleton
+from tools import is_extra_item
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def event(event_type: str, session_id: str, **payload) -> OrderEvent:
+    return OrderEvent(event_type, session_id, f"token-{session_id}", f"token-{session_id}-0000", payload)
+
+
+class RollingCountersTests(unittest.TestCase):
+    def test_buckets_leave_the_window_as_time_passes(self):
+        clock = FakeClock()
+        counters = RollingCounters(("orders",), bucket_seconds=60, buckets=3, clock=clock)
+        counters.add("orders", 2)
+        clock.now += 60
+        counters.add("orders", 5)
+        self.assertEqual(counters.totals(), {"orders": 7})
+        clock.now += 120
+        self.assertEqual(counters.totals(), {"orders": 5})
+        clock.now += 3600
+        self.assertEqual(counters.totals(), {"orders": 0})
+
+
+class SpaceSavingTopKTests(unittest.TestCase):
+    def test_heavy_hitters_survive_a_long_tail(self):
+        top = SpaceSavingTopK(capacity=5)
+        for i in range(200):
+            top.add("Iced Latte")
+            top.add(f"one-off {i}")
+            if i % 2 == 0:
+                top.add("Boston Kreme")
+        ranked = top.top(2)
+        self.assertEqual([entry["item"] for entry in ranked], ["Iced Latte", "Boston Kreme"])
+        self.assertGreaterEqual(ranked[0]["count"], 200)
+        self.assertLessEqual(ranked[0]["count"] - ranked[0]["error"], 200)
+
+
+class OrderAnalyticsTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.analytics = OrderAnalytics(is_extra=is_extra_item, clock=self.clock)
+
+    def order(self, session_id: str, items: list[tuple[str, int, float]], reviewed: bool, handed_off: bool = False) -> None:
+        self.analytics.record(event("session_created", session_id))
+        count, total, final_items = 0, 0.0, {}
+        for item, quantity, price in items:
+            final_items[item] = quantity
+            count += quantity
+            total += quantity * price
+            self.analytics.record(event("order_updated", session_id, action="add", item=item, size="medium", quantity=quantity, price=price))
+        if reviewed:
+            self.analytics.record(event("order_reviewed", session_id))
+        self.analytics.record(event("session_ended", session_id, item_count=count, total=total, final_total=total * 1.08,
+                                    items=final_items, handed_off=handed_off))
+
+    def test_completed_abandoned_and_handed_off_orders(self):
+        self.order("a", [("Iced Latte", 1, 4.0), ("Whipped Cream", 1, 0.5)], reviewed=True)
+        self.order("b", [("Boston Kreme", 2, 1.5)], reviewed=True)
+        self.order("c", [("Iced Latte", 1, 4.0)], reviewed=False)
+        self.order("d", [("Iced Latte", 3, 4.0)], reviewed=True, handed_off=True)
+        self.order("e", [], reviewed=False)
+        self.clock.now += 1800
+
+        snapshot = self.analytics.snapshot()
+        self.assertEqual(snapshot["sessionsStarted"], 5)
+        self.assertEqual(snapshot["activeSessions"], 0)
+        self.assertEqual(snapshot["ordersCompleted"], 2)
+        self.assertEqual(snapshot["ordersAbandoned"], 1)
+        self.assertAlmostEqual(snapshot["abandonRate"], 1 / 3, places=4)
+        self.assertEqual(snapshot["extrasAttachRate"], 0.5)
+        self.assertAlmostEqual(snapshot["averageTicket"], (4.5 + 3.0) * 1.08 / 2, places=2)
+        # Four items sold over the half hour observed so far.
+        self.assertEqual(snapshot["itemsPerHour"], 8.0)
+        # Only completed orders count towards top items.
+        self.assertEqual(snapshot["topItems"][0], {"item": "Boston Kreme", "count": 2, "error": 0.0})
+        self.assertEqual(snapshot["topItems"][1], {"item": "Iced Latte", "count": 1, "error": 0.0})
+
+    def test_replaced_items_do_not_count_as_top_items(self):
+        self.analytics.record(event("session_created", "a"))
+        self.analytics.record(event("order_updated", "a", action="add", item="Hot Latte", size="medium", quantity=1, price=4.0))
+        self.analytics.record(event("order_updated", "a", action="remove", item="Hot Latte", size="medium", quantity=1, price=4.0))
+        self.analytics.record(event("order_updated", "a", action="add", item="Iced Latte", size="medium", quantity=1, price=4.0))
+        self.analytics.record(event("order_reviewed", "a"))
+        self.analytics.record(event("session_ended", "a", item_count=1, total=4.0, final_total=4.32, items={"Iced Latte": 1}, handed_off=False))
+        self.assertEqual(self.analytics.snapshot()["topItems"], [{"item": "Iced Latte", "count": 1, "error": 0.0}])
+
+    def test_changes_after_a_read_back_need_another_review(self):
+        self.analytics.record(event("session_created", "a"))
+        self.analytics.record(event("order_updated", "a", action="add", item="Iced Latte", size="medium", quantity=1, price=4.0))
+        self.analytics.record(event("order_reviewed", "a"))
+        self.analytics.record(event("order_updated", "a", action="add", item="Boston Kreme", size="", quantity=1, price=1.5))
+        self.analytics.record(event("session_ended", "a", item_count=2, total=5.5, final_total=5.94, handed_off=False))
+        self.assertEqual(self.analytics.snapshot()["ordersAbandoned"], 1)
+
+
+class OrderAnalyticsEndpointTests(unittest.IsolatedAsyncioTestCase):
+    async def test_order_state_feeds_the_endpoint(self):
+        order_state_singleton.sessions = {}
+        analytics = OrderAnalytics(is_extra=is_extra_item)
+        order_state_singleton.add_listener(analytics.record)
+        self.addCleanup(order_state_singleton.listeners.remove, analytics.record)
+        session_id = order_state_singleton.create_session()
+        order_state_singleton.handle_order_update(session_id, "add", "Iced Latte", "medium", 2, 4.29)
+        order_state_singleton.review_order(session_id)
+        order_state_singleton.delete_session(session_id)
+
+        app = web.Application()
+        analytics.attach_to_app(app)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/analytics")
+            body = await response.json()
+        self.assertEqual(body["ordersCompleted"], 1)
+        self.assertEqual(body["averageTicket"], round(2 * 4.29 * 1.08, 2))
+        self.assertEqual(body["topItems"][0]["item"], "Iced Latte")
+
+
+if __name__ == "__main__":
+    unittest.main()
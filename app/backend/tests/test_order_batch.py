@@ -0,0 +1,86 @@
+import asyncio
+import math
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from order_state import order_state_singleton
+from rtmt import ToolResultDirection
+from tools import update_order_batch
+
+
+def add(item_name: str, size: str, quantity: int, price: float) -> dict:
+    return {"action": "add", "item_name": item_name, "size": size, "quantity": quantity, "price": price}
+
+
+class OrderBatchTests(unittest.TestCase):
+    def setUp(self):
+        order_state_singleton.sessions = {}
+        self.session_id = order_state_singleton.create_session()
+        self.events = []
+        order_state_singleton.add_listener(self.events.append)
+        self.addCleanup(order_state_singleton.listeners.remove, self.events.append)
+
+    def test_batch_is_applied_with_one_summary(self):
+        result = asyncio.run(update_order_batch({"operations": [
+            add("Caramel Craze Latte", "medium", 2, 4.99),
+            add("Glazed Donut", "standard", 1, 1.49),
+            {"action": "remove", "item_name": "Caramel Craze Latte", "size": "medium", "quantity": 1},
+        ]}, self.session_id))
+
+        self.assertEqual(result.destination, ToolResultDirection.TO_CLIENT)
+        summary = order_state_singleton.get_order_summary(self.session_id)
+        self.assertEqual([(item.item, item.quantity) for item in summary.items], [("Caramel Craze Latte", 1), ("Glazed Donut", 1)])
+        self.assertTrue(math.isclose(summary.total, 4.99 + 1.49, rel_tol=1e-9))
+        updates = [event for event in self.events if event.type == "order_updated"]
+        self.assertEqual(len(updates), 3)
+        self.assertTrue(all(event.payload["item_count"] == 2 for event in updates))
+
+    def test_extra_can_ride_along_with_its_latte(self):
+        result = asyncio.run(update_order_batch({"operations": [
+            add("Caramel Craze Latte", "medium", 1, 4.99),
+            add("Whipped Cream", "standard", 1, 0.5),
+        ]}, self.session_id))
+
+        self.assertEqual(result.destination, ToolResultDirection.TO_CLIENT)
+        self.assertEqual(len(order_state_singleton.get_order_summary(self.session_id).items), 2)
+
+    def test_blocked_extra_rejects_the_whole_batch(self):
+        order_state_singleton.handle_order_update(self.session_id, "add", "Caramel Craze Latte", "medium", 1, 4.99)
+        result = asyncio.run(update_order_batch({"operations": [
+            add("Glazed Donut", "standard", 1, 1.49),
+            {"action": "remove", "item_name": "Caramel Craze Latte", "size": "medium", "quantity": 1},
+            add("Extra Espresso Shot", "standard", 1, 1.0),
+        ]}, self.session_id))
+
+        self.assertEqual(result.destination, ToolResultDirection.TO_SERVER)
+        self.assertIn("extras", result.text.lower())
+        summary = order_state_singleton.get_order_summary(self.session_id)
+        self.assertEqual([item.item for item in summary.items], ["Caramel Craze Latte"])
+
+    def test_malformed_operation_changes_nothing(self):
+        result = asyncio.run(update_order_batch({"operations": [
+            add("Glazed Donut", "standard", 1, 1.49),
+            add("Boston Kreme Donut", "standard", 0, 1.49),
+        ]}, self.session_id))
+
+        self.assertEqual(result.destination, ToolResultDirection.TO_SERVER)
+        self.assertIn("Operation 2", result.text)
+        self.assertEqual(order_state_singleton.get_order_summary(self.session_id).items, [])
+        self.assertFalse([event for event in self.events if event.type == "order_updated"])
+
+    def test_order_state_rolls_back_a_failed_batch(self):
+        order_state_singleton.handle_order_update(self.session_id, "add", "Glazed Donut", "standard", 1, 1.49)
+        with self.assertRaises(ValueError):
+            order_state_singleton.handle_order_batch(self.session_id, [
+                add("Glazed Donut", "standard", 2, 1.49),
+                {"action": "replace", "item_name": "Glazed Donut", "size": "standard", "quantity": 1},
+            ])
+        summary = order_state_singleton.get_order_summary(self.session_id)
+        self.assertEqual([(item.item, item.quantity) for item in summary.items], [("Glazed Donut", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import json
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from order_state import order_state_singleton
+from output_coalescer import DEFAULT_DENY, OutputCoalescer
+from rtmt import RTMiddleTier
+
+
+def audio_delta(pcm: bytes, item_id: str = "item_1") -> str:
+    return json.dumps({"type": "response.audio.delta", "response_id": "resp_1", "item_id": item_id,
+                       "output_index": 0, "content_index": 0, "delta": base64.b64encode(pcm).decode("ascii")}, separators=(",", ":"))
+
+
+def transcript_delta(text: str) -> str:
+    return json.dumps({"type": "response.audio_transcript.delta", "response_id": "resp_1", "item_id": "item_1",
+                       "output_index": 0, "content_index": 0, "delta": text}, separators=(",", ":"))
+
+
+class OutputCoalescerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.sent: list[dict] = []
+
+    async def send(self, data: str) -> None:
+        self.sent.append(json.loads(data))
+
+    async def test_deltas_merge_until_a_control_event(self):
+        output = OutputCoalescer(self.send, deny=DEFAULT_DENY, window_ms=1000)
+        for chunk in (b"\x01\x00" * 12, b"\x02\x00" * 12, b"\x03\x00" * 12):
+            await output.send(audio_delta(chunk))
+        await output.send(transcript_delta("Welcome "))
+        await output.send(transcript_delta("to Dunkin!"))
+        await output.send(json.dumps({"type": "rate_limits.updated", "rate_limits": []}))
+        await output.send(json.dumps({"type": "response.done", "response": {"output": []}}))
+
+        self.assertEqual([message["type"] for message in self.sent],
+                         ["response.audio.delta", "response.audio_transcript.delta", "response.done"])
+        self.assertEqual(base64.b64decode(self.sent[0]["delta"]), b"\x01\x00" * 12 + b"\x02\x00" * 12 + b"\x03\x00" * 12)
+        self.assertEqual(self.sent[0]["item_id"], "item_1")
+        self.assertEqual(self.sent[1]["delta"], "Welcome to Dunkin!")
+
+        report = output.stats.report()
+        self.assertEqual(report["response.audio.delta"], {"in": 3, "out": 1, "dropped": 0, "reduction": 0.6667})
+        self.assertEqual(report["rate_limits.updated"]["dropped"], 1)
+
+    async def test_payloads_are_spliced_without_decoding_frames(self):
+        output = OutputCoalescer(self.send, window_ms=1000)
+        with mock.patch("output_coalescer.json_codec.loads", side_effect=AssertionError("decoded")):
+            await output.send(audio_delta(b"\x01\x02\x03"))
+            await output.send(audio_delta(b"\x04\x05\x06"))
+            await output.send(transcript_delta('Say "hi"\\'))
+            await output.send(transcript_delta(" there"))
+            await output.close()
+        self.assertEqual(base64.b64decode(self.sent[0]["delta"]), b"\x01\x02\x03\x04\x05\x06")
+        self.assertEqual(self.sent[1]["delta"], 'Say "hi"\\ there')
+
+    async def test_padded_audio_ends_the_merged_frame(self):
+        output = OutputCoalescer(self.send, window_ms=1000)
+        for chunk in (b"\x01\x02\x03", b"\x04\x05", b"\x06\x07\x08"):
+            await output.send(audio_delta(chunk))
+        await output.close()
+        self.assertEqual([base64.b64decode(message["delta"]) for message in self.sent], [b"\x01\x02\x03\x04\x05", b"\x06\x07\x08"])
+
+    async def test_window_and_size_limits_flush_held_deltas(self):
+        output = OutputCoalescer(self.send, window_ms=20, max_bytes=40)
+        await output.send(audio_delta(b"\x00" * 24))
+        await output.send(audio_delta(b"\x00" * 24))
+        self.assertEqual(len(self.sent), 1)
+
+        await output.send(audio_delta(b"\x00" * 8))
+        self.assertEqual(len(self.sent), 1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(len(base64.b64decode(self.sent[1]["delta"])), 8)
+
+    async def test_a_new_item_is_not_merged_into_the_previous_one(self):
+        output = OutputCoalescer(self.send, window_ms=1000)
+        await output.send(audio_delta(b"\x00\x00", item_id="item_1"))
+        await output.send(audio_delta(b"\x00\x00", item_id="item_2"))
+        await output.close()
+        self.assertEqual([message["item_id"] for message in self.sent], ["item_1", "item_2"])
+
+    async def test_zero_window_relays_frames_unchanged(self):
+        output = OutputCoalescer(self.send, window_ms=0)
+        await output.send(audio_delta(b"\x00\x00"))
+        await output.send(audio_delta(b"\x00\x00"))
+        self.assertEqual(len(self.sent), 2)
+
+
+class RelayOutputStageTests(unittest.IsolatedAsyncioTestCase):
+    async def upstream_handler(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.json()["type"] == "session.update":
+                await ws.send_json({"type": "session.created", "session": {}})
+                await ws.send_json({"type": "response.created", "response": {"id": "resp_1"}})
+                for _ in range(5):
+                    await ws.send_str(audio_delta(b"\x00" * 480))
+                await ws.send_json({"type": "response.content_part.done", "part": {}})
+                await ws.send_json({"type": "response.done", "response": {"output": []}})
+        return ws
+
+    async def test_relay_sends_merged_audio_ahead_of_the_response_end(self):
+        order_state_singleton.sessions = {}
+        upstream_app = web.Application()
+        upstream_app.router.add_get("/openai/realtime", self.upstream_handler)
+        async with TestClient(TestServer(upstream_app)) as upstream:
+            rtmt = RTMiddleTier(str(upstream.make_url("/")), "deployment", AzureKeyCredential("key"))
+            rtmt.output_coalesce_ms = 1000
+            rtmt.output_deny = DEFAULT_DENY
+            app = web.Application()
+            rtmt.attach_to_app(app, "/realtime")
+            async with TestClient(TestServer(app)) as client:
+                ws = await client.ws_connect("/realtime")
+                await ws.send_json({"type": "session.update", "session": {}})
+                received = []
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        received.append(msg.json())
+                        if received[-1]["type"] == "response.done":
+                            break
+                await ws.close()
+                stats = await (await client.get("/realtime/stats")).json()
+
+        types = [message["type"] for message in received]
+        self.assertEqual(types.count("response.audio.delta"), 1)
+        self.assertNotIn("response.content_part.done", types)
+        self.assertLess(types.index("response.audio.delta"), types.index("response.done"))
+        self.assertEqual(len(base64.b64decode(received[types.index("response.audio.delta")]["delta"])), 2400)
+        self.assertEqual(stats["output"]["response.audio.delta"]["reduction"], 0.8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.pipeline_ab import percentile, run_benchmark
+from order_state import order_state_singleton
+
+
+class PercentileTests(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = [float(value) for value in range(1, 101)]
+
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([7.0], 90), 7.0)
+
+
+class PipelineBenchmarkSmokeTests(unittest.TestCase):
+    def setUp(self):
+        order_state_singleton.sessions = {}
+
+    def test_runs_both_pathways_offline(self):
+        script = {
+            "audio": {"sample_rate": 24000, "words_per_second": 20, "chunk_ms": 100},
+            "profiles": {
+                "realtime": {"transcription_ms": 0, "tool_call_ms": 0, "first_audio_ms": 0, "audio_chunk_ms": 100,
+                             "audio_chunk_interval_ms": 0, "search_ms": 0},
+                "cascaded": {"stt_ms": 0, "llm_first_token_ms": 0, "llm_token_interval_ms": 0, "tts_first_chunk_ms": 0,
+                             "audio_chunk_ms": 100, "audio_chunk_interval_ms": 0},
+            },
+            "conversations": [{
+                "name": "smoke",
+                "turns": [{
+                    "utterance": "One glazed donut please.",
+                    "audio": "audio/missing.wav",
+                    "tool_calls": [{"name": "update_order", "arguments": {"action": "add", "item_name": "Glazed Donut",
+                                                                           "size": "standard", "quantity": 1, "price": 1.49}}],
+                    "reply": "One glazed donut, coming right up. Anything else?",
+                }],
+            }],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            script_path = Path(directory) / "script.json"
+            script_path.write_text(json.dumps(script), encoding="utf-8")
+            with self.assertLogs("pipeline-benchmark", level="WARNING") as logs:
+                report = asyncio.run(run_benchmark(script_path, runs=1, pathways=["realtime", "cascaded"]))
+
+        self.assertIn("missing.wav", logs.output[0])
+        self.assertEqual(report["audio_input"], {"recorded": 0, "synthesized": 1})
+
+        for pathway in ("realtime", "cascaded"):
+            turns = report["pathways"][pathway]["turns"]
+            self.assertEqual(len(turns), 1)
+            self.assertIsNotNone(turns[0]["ttfa_ms"])
+            self.assertGreater(turns[0]["bytes_received"], 0)
+            self.assertIn("p99", report["pathways"][pathway]["summary"]["turn_ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
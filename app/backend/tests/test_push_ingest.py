@@ -0,0 +1,144 @@
+import re
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+from openai import RateLimitError
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from push_ingest import (
+    LocalSearchIndex,
+    SourceDocument,
+    batch_documents,
+    build_chunks,
+    chunk_text,
+    delete_chunks,
+    find_other_chunks,
+    ingest,
+    menu_documents,
+)
+
+MENU = {
+    "menuItems": [
+        {
+            "category": "Signature Lattes",
+            "items": [
+                {
+                    "name": "Caramel Craze Latte",
+                    "description": "Espresso with caramel drizzle",
+                    "origin": "Dunkin U.S. Menu",
+                    "sizes": [{"size": "small", "price": 4.49}, {"size": "large", "price": 5.49}],
+                }
+            ],
+        }
+    ]
+}
+
+
+class FilteringIndex(LocalSearchIndex):
+    """Adds the parent filter and deletes that the pre-push check uses."""
+
+    def __init__(self):
+        super().__init__()
+        self.filters: list[str] = []
+
+    async def search(self, search_text, filter, select):
+        self.filters.append(filter)
+        pushed = set(re.search(r"search\.in\(parent_id, '([^']*)'", filter).group(1).split(","))
+
+        async def matches():
+            for document in list(self.documents.values()):
+                if document["parent_id"] not in pushed:
+                    yield {field: document[field] for field in select}
+        return matches()
+
+    async def delete_documents(self, documents):
+        for document in documents:
+            self.documents.pop(document[self.key_field], None)
+
+
+class FakeEmbeddings:
+    def __init__(self, throttle_first: int = 0):
+        self.throttle_first = throttle_first
+        self.calls: list[int] = []
+
+    async def create(self, input, model, **kwargs):
+        self.calls.append(len(input))
+        if self.throttle_first:
+            self.throttle_first -= 1
+            response = httpx.Response(429, headers={"retry-after-ms": "1"}, request=httpx.Request("POST", "https://example"))
+            raise RateLimitError("Too many requests", response=response, body=None)
+        data = [SimpleNamespace(index=i, embedding=[float(len(text)), 1.0]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+class ChunkTextTests(unittest.TestCase):
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(chunk_text("  Hot coffee.\n Iced tea. "), ["Hot coffee. Iced tea."])
+
+    def test_chunks_are_bounded_and_overlap(self):
+        text = " ".join(f"Sentence number {i} about cold brew." for i in range(200))
+        chunks = chunk_text(text, max_chars=400, overlap=100)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 400 for chunk in chunks))
+        for previous, current in zip(chunks, chunks[1:]):
+            self.assertIn(current[:20], previous)
+        self.assertTrue(chunks[-1].endswith("about cold brew."))
+
+
+class BatchDocumentsTests(unittest.TestCase):
+    def test_batches_respect_count_and_size(self):
+        documents = [{"chunk_id": str(i), "chunk": "x" * 100} for i in range(10)]
+
+        self.assertEqual([len(b) for b in batch_documents(documents, max_count=4, max_bytes=10_000)], [4, 4, 2])
+        self.assertEqual([len(b) for b in batch_documents(documents, max_count=100, max_bytes=300)], [2, 2, 2, 2, 2])
+
+
+class IngestTests(unittest.IsolatedAsyncioTestCase):
+    async def test_pushes_menu_and_documents_into_local_index(self):
+        index = LocalSearchIndex()
+        embeddings = FakeEmbeddings(throttle_first=1)
+        sources = menu_documents(MENU) + [SourceDocument("doc_recipes_md", "recipes.md", "Cold brew recipe. " * 200)]
+
+        stats = await ingest(index, SimpleNamespace(embeddings=embeddings), "embedding", sources,
+                             embedding_batch_size=2, retry_base_delay=0)
+
+        self.assertEqual(stats.chunks, len(build_chunks(sources)))
+        self.assertEqual(stats.uploaded, stats.chunks)
+        self.assertEqual(stats.failed_keys, [])
+        self.assertEqual(len(embeddings.calls), stats.embedding_requests + 1)
+        menu_chunk = index.documents["menu_signature_lattes_caramel_craze_latte_pages_0"]
+        self.assertEqual(menu_chunk["title"], "Caramel Craze Latte")
+        self.assertIn("small $4.49", menu_chunk["chunk"])
+        self.assertEqual(menu_chunk["text_vector"], [float(len(menu_chunk["chunk"])), 1.0])
+
+    async def test_reingest_merges_instead_of_duplicating(self):
+        index = LocalSearchIndex()
+        client = SimpleNamespace(embeddings=FakeEmbeddings())
+        sources = menu_documents(MENU)
+
+        await ingest(index, client, "embedding", sources)
+        await ingest(index, client, "embedding", sources)
+
+        self.assertEqual(len(index.documents), 1)
+        self.assertEqual(index.batch_sizes, [1, 1])
+
+    async def test_chunks_from_other_sources_are_found_and_deleted(self):
+        index = FilteringIndex()
+        sources = menu_documents(MENU)
+        await ingest(index, SimpleNamespace(embeddings=FakeEmbeddings()), "embedding", sources)
+        index.documents["aHR0cHM6_0_pages_0"] = {"chunk_id": "aHR0cHM6_0_pages_0", "parent_id": "aHR0cHM6", "chunk": "Pulled"}
+
+        other = await find_other_chunks(index, {source.parent_id for source in sources})
+        self.assertEqual(other, ["aHR0cHM6_0_pages_0"])
+        await delete_chunks(index, other)
+        self.assertEqual(await find_other_chunks(index, {source.parent_id for source in sources}), [])
+        self.assertEqual(list(index.documents), ["menu_signature_lattes_caramel_craze_latte_pages_0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from readiness import StartupWarmup
+
+
+class StartupWarmupTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.warmup = StartupWarmup(retry_initial_delay=0.01)
+        self.app = web.Application()
+
+    async def start(self):
+        self.warmup.attach_to_app(self.app)
+        self.client = TestClient(TestServer(self.app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def wait_ready(self):
+        for _ in range(200):
+            if (await self.client.get("/ready")).status == 200:
+                return
+            await asyncio.sleep(0.01)
+        self.fail("worker never became ready")
+
+    async def test_blocking_steps_run_concurrently_without_delaying_startup(self):
+        for name in ("credentials", "search", "catalog"):
+            self.warmup.add(name, lambda: time.sleep(0.2))
+
+        started = time.perf_counter()
+        await self.start()
+        self.assertLess(time.perf_counter() - started, 0.2)
+        self.assertEqual((await self.client.get("/ready")).status, 503)
+
+        await self.wait_ready()
+        self.assertLess(time.perf_counter() - started, 0.55)
+        body = await (await self.client.get("/ready")).json()
+        self.assertTrue(all(step["ready"] for step in body["steps"].values()))
+
+    async def test_failing_step_is_retried_until_it_succeeds(self):
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("search unavailable")
+
+        self.warmup.add("search", flaky)
+        await self.start()
+
+        await self.wait_ready()
+        body = await (await self.client.get("/ready")).json()
+        self.assertEqual(body["steps"]["search"]["attempts"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,221 @@
+import asyncio
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import aiohttp
+from aiohttp import WSCloseCode, web
+from aiohttp.test_utils import TestClient, TestServer
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from order_state import order_state_singleton
+from rtmt import RTMiddleTier
+from session_store import FileSessionStore, InMemorySessionStore
+
+
+class FakeRealtimeUpstream:
+    """Answers every response.create with a response that takes ``response_seconds`` to finish."""
+
+    def __init__(self, response_seconds: float = 0.2):
+        self.response_seconds = response_seconds
+        self.received: list[dict] = []
+
+    async def handler(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            message = msg.json()
+            self.received.append(message)
+            if message["type"] == "session.update":
+                await ws.send_json({"type": "session.created", "session": {}})
+            elif message["type"] == "response.create":
+                await ws.send_json({"type": "response.created", "response": {}})
+                await asyncio.sleep(self.response_seconds)
+                await ws.send_json({"type": "response.done", "response": {"output": []}})
+        return ws
+
+
+class RealtimeDrainTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        order_state_singleton.sessions = {}
+        self.upstream = FakeRealtimeUpstream()
+        upstream_app = web.Application()
+        upstream_app.router.add_get("/openai/realtime", self.upstream.handler)
+        self.upstream_client = TestClient(TestServer(upstream_app))
+        await self.upstream_client.start_server()
+        self.clients = []
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            await client.close()
+        await self.upstream_client.close()
+
+    async def start_worker(self, store) -> tuple[RTMiddleTier, TestClient]:
+        rtmt = RTMiddleTier(str(self.upstream_client.make_url("/")), "deployment", AzureKeyCredential("key"))
+        rtmt.session_store = store
+        rtmt.drain_jitter_ms = 1000
+        app = web.Application()
+        rtmt.attach_to_app(app, "/realtime")
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        self.clients.append(client)
+        return rtmt, client
+
+    async def receive_until(self, ws, event_type: str) -> dict:
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT and (message := msg.json())["type"] == event_type:
+                return message
+        self.fail(f"socket closed before {event_type}")
+
+    def shared_store(self) -> FileSessionStore:
+        # Cleanups run after asyncTearDown, so the directory outlives the workers using it.
+        return FileSessionStore(self.enterContext(tempfile.TemporaryDirectory()))
+
+    async def test_drain_waits_for_turn_and_hands_off_order(self):
+        store = self.shared_store()
+        rtmt, client = await self.start_worker(store)
+        ws = await client.ws_connect("/realtime")
+        await ws.send_json({"type": "session.update", "session": {}})
+        metadata = await self.receive_until(ws, "extension.session_metadata")
+        await ws.send_json({"type": "response.create"})
+        await self.receive_until(ws, "response.created")
+        session_id = next(iter(order_state_singleton.sessions))
+        order_state_singleton.handle_order_update(session_id, "add", "Glazed Donut", "standard", 2, 1.49)
+
+        drain = asyncio.create_task(rtmt.drain(timeout=2))
+        notice = await self.receive_until(ws, "extension.drain")
+        self.assertEqual(notice["sessionToken"], metadata["sessionToken"])
+        self.assertTrue(0 <= notice["reconnectAfterMs"] <= 1000)
+        # The in-flight response still reaches the client before the socket is closed.
+        await self.receive_until(ws, "response.done")
+        self.assertEqual((await ws.receive()).type, aiohttp.WSMsgType.CLOSE)
+        await drain
+        self.assertEqual(ws.close_code, WSCloseCode.SERVICE_RESTART)
+
+        with self.assertRaises(aiohttp.WSServerHandshakeError) as rejected:
+            await client.ws_connect("/realtime")
+        self.assertEqual(rejected.exception.status, 503)
+
+        snapshot = await store.take(metadata["sessionToken"])
+        self.assertEqual(snapshot["items"][0]["item"], "Glazed Donut")
+        self.assertEqual(snapshot["items"][0]["quantity"], 2)
+
+    async def test_reconnect_resumes_order_on_another_worker_without_greeting(self):
+        with tempfile.TemporaryDirectory() as directory:
+            await FileSessionStore(directory).save("token-1", {
+                "session_token": "token-1",
+                "round_trip_index": 3,
+                "items": [{"item": "Original Cold Brew", "size": "large", "quantity": 1, "price": 4.29,
+                           "display": "Large Original Cold Brew"}],
+            })
+            _, client = await self.start_worker(FileSessionStore(directory))
+
+            ws = await client.ws_connect("/realtime", params={"sessionToken": "token-1"})
+            await ws.send_json({"type": "session.update", "session": {}})
+            metadata = await self.receive_until(ws, "extension.session_metadata")
+            await ws.close()
+
+            self.assertEqual(metadata["sessionToken"], "token-1")
+            self.assertEqual(metadata["roundTripIndex"], 3)
+            self.assertTrue(metadata["resumed"])
+            self.assertEqual(metadata["order"]["items"][0]["item"], "Original Cold Brew")
+            # No greeting; the model is only told about the order so far.
+            created = [message["item"] for message in self.upstream.received if message["type"] == "conversation.item.create"]
+            self.assertEqual([item["role"] for item in created], ["system"])
+            self.assertIn("Original Cold Brew", created[0]["content"][0]["text"])
+            self.assertIsNone(await FileSessionStore(directory).take("token-1"))
+            await client.close()
+
+    async def connect(self, client: TestClient, session_token: str | None = None):
+        params = {"sessionToken": session_token} if session_token else None
+        ws = await client.ws_connect("/realtime", params=params)
+        await ws.send_json({"type": "session.update", "session": {}})
+        return ws, await self.receive_until(ws, "extension.session_metadata")
+
+    async def test_dropped_connection_resumes_within_grace_window(self):
+        _, client = await self.start_worker(InMemorySessionStore())
+        ws, metadata = await self.connect(client)
+        self.assertFalse(metadata["resumed"])
+        session_id = next(iter(order_state_singleton.sessions))
+        order_state_singleton.handle_order_update(session_id, "add", "Glazed Donut", "standard", 2, 1.49)
+        await ws.close()
+
+        ws, resumed = await self.connect(client, metadata["sessionToken"])
+        await ws.close()
+        self.assertTrue(resumed["resumed"])
+        self.assertEqual(resumed["sessionToken"], metadata["sessionToken"])
+        self.assertEqual(resumed["order"]["items"][0]["quantity"], 2)
+        self.assertEqual(list(order_state_singleton.sessions), [session_id])
+
+    async def test_reconnect_takes_over_a_connection_the_server_still_holds(self):
+        _, client = await self.start_worker(InMemorySessionStore())
+        stale, metadata = await self.connect(client)
+        ws, resumed = await self.connect(client, metadata["sessionToken"])
+        self.assertTrue(resumed["resumed"])
+        async for _ in stale:
+            pass
+        self.assertTrue(stale.closed)
+        await ws.close()
+        self.assertEqual(len(order_state_singleton.sessions), 1)
+
+    async def test_order_ends_when_grace_window_passes(self):
+        rtmt, client = await self.start_worker(InMemorySessionStore())
+        rtmt.resume_grace_seconds = 0.05
+        ws, metadata = await self.connect(client)
+        await ws.close()
+        async with asyncio.timeout(2):
+            while order_state_singleton.sessions:
+                await asyncio.sleep(0.01)
+
+        ws, fresh = await self.connect(client, metadata["sessionToken"])
+        await ws.close()
+        self.assertFalse(fresh["resumed"])
+        self.assertNotEqual(fresh["sessionToken"], metadata["sessionToken"])
+
+    async def test_drain_hands_off_orders_waiting_for_a_reconnect(self):
+        store = self.shared_store()
+        rtmt, client = await self.start_worker(store)
+        ws, metadata = await self.connect(client)
+        order_state_singleton.handle_order_update(next(iter(order_state_singleton.sessions)), "add", "Glazed Donut", "standard", 1, 1.49)
+        await ws.close()
+        async with asyncio.timeout(2):
+            while not rtmt._parked:
+                await asyncio.sleep(0.01)
+
+        await rtmt.drain(timeout=1)
+        self.assertEqual(order_state_singleton.sessions, {})
+        self.assertEqual((await store.take(metadata["sessionToken"]))["items"][0]["item"], "Glazed Donut")
+
+    async def test_drain_without_a_shared_store_gives_no_resume_token(self):
+        store = InMemorySessionStore()
+        rtmt, client = await self.start_worker(store)
+        ws, metadata = await self.connect(client)
+
+        drain = asyncio.create_task(rtmt.drain(timeout=1))
+        notice = await self.receive_until(ws, "extension.drain")
+        async for _ in ws:
+            pass
+        await drain
+        self.assertIsNone(notice["sessionToken"])
+        self.assertIsNone(await store.take(metadata["sessionToken"]))
+        self.assertEqual(order_state_singleton.sessions, {})
+
+
+class SessionStoreTests(unittest.IsolatedAsyncioTestCase):
+    async def test_snapshots_are_taken_once_and_expire(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for store in (InMemorySessionStore(), FileSessionStore(directory)):
+                await store.save("token", {"items": []})
+                self.assertEqual(await store.take("token"), {"items": []})
+                self.assertIsNone(await store.take("token"))
+
+                store.ttl_seconds = 0
+                await store.save("expired", {"items": []})
+                self.assertIsNone(await store.take("expired"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from setup_intvect import plan_uploads
+
+
+class PlanUploadsTests(unittest.TestCase):
+    def test_uploads_only_new_or_changed_files(self):
+        local = {"menu.pdf": "aaa", "recipes.pdf": "bbb", "new.pdf": "ccc"}
+        remote = {"menu.pdf": "aaa", "recipes.pdf": "old", "retired.pdf": "zzz"}
+
+        self.assertEqual(plan_uploads(local, remote), ["new.pdf", "recipes.pdf"])
+
+    def test_blobs_without_hash_metadata_are_reuploaded(self):
+        self.assertEqual(plan_uploads({"menu.pdf": "aaa"}, {"menu.pdf": None}), ["menu.pdf"])
+
+    def test_nothing_to_upload_when_hashes_match(self):
+        self.assertEqual(plan_uploads({"menu.pdf": "aaa"}, {"menu.pdf": "aaa"}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from azurespeech import SpeechExecutor, SpeechExecutorBusy
+
+
+class SpeechExecutorTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.executor = SpeechExecutor(max_workers=1, max_queue=1, timeout=1.0)
+        self.release = threading.Event()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    async def test_runs_blocking_call_off_the_loop(self):
+        result = await self.executor.run(lambda value: value * 2, 21)
+
+        self.assertEqual(result, 42)
+        self.assertEqual(self.executor.stats()["running"], 0)
+
+    async def test_rejects_calls_when_queue_is_full(self):
+        first = asyncio.create_task(self.executor.run(self.release.wait))
+        second = asyncio.create_task(self.executor.run(self.release.wait))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.executor.queue_depth, 1)
+        with self.assertRaises(SpeechExecutorBusy):
+            await self.executor.run(self.release.wait)
+        self.assertEqual(self.executor.stats()["rejected"], 1)
+
+        self.release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(self.executor.queue_depth, 0)
+
+    async def test_timeout_invokes_cancel_callback(self):
+        cancelled = []
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.executor.run(self.release.wait, timeout=0.05, on_cancel=lambda: cancelled.append(True))
+
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(self.executor.stats()["timeouts"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from speech_pipeline import PipelineSession, SentenceSegmenter, Utterance
+
+
+class SentenceSegmenterTests(unittest.TestCase):
+    def test_emits_sentences_as_boundaries_arrive(self):
+        segmenter = SentenceSegmenter(min_chars=1)
+
+        self.assertEqual(segmenter.feed("A medium latte is $4"), [])
+        self.assertEqual(segmenter.feed(".99. Anything"), ["A medium latte is $4.99."])
+        self.assertEqual(segmenter.feed(" else?"), [])
+        self.assertEqual(segmenter.flush(), "Anything else?")
+        self.assertIsNone(segmenter.flush())
+
+    def test_merges_short_sentences(self):
+        segmenter = SentenceSegmenter(min_chars=16)
+
+        self.assertEqual(segmenter.feed("Sure! I added a glazed donut. "), ["Sure! I added a glazed donut."])
+
+
+class _ScriptedRecognizer:
+    def __init__(self, on_recognized):
+        self._on_recognized = on_recognized
+        self.received = bytearray()
+
+    def write(self, audio: bytes) -> None:
+        self.received.extend(audio)
+        if len(self.received) >= 4:
+            now = time.perf_counter()
+            self._on_recognized(Utterance("one glazed donut please", speech_ended_at=now, recognized_at=now))
+            self.received.clear()
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+async def _complete(messages):
+    for delta in ["One glazed donut, coming right up. ", "Anything ", "else today?"]:
+        yield delta
+
+
+async def _synthesize(text):
+    yield text.encode("utf-8")
+
+
+class PipelineSessionTests(unittest.IsolatedAsyncioTestCase):
+    async def test_streams_audio_per_sentence_and_reports_timings(self):
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            session = PipelineSession(
+                ws,
+                recognizer_factory=lambda rate, on_recognized: _ScriptedRecognizer(on_recognized),
+                complete=_complete,
+                synthesize=_synthesize,
+                system_message="You are a barista.",
+            )
+            await session.run()
+            return ws
+
+        app = web.Application()
+        app.router.add_get("/pipeline", handler)
+        async with TestClient(TestServer(app)) as client:
+            ws = await client.ws_connect("/pipeline")
+            await ws.send_bytes(b"\x00\x00\x00\x00")
+
+            events = []
+            while True:
+                message = await asyncio.wait_for(ws.receive_json(), timeout=2)
+                events.append(message)
+                if message["type"] == "extension.pipeline_timings":
+                    break
+            await ws.close()
+
+        types = [event["type"] for event in events]
+        self.assertEqual(types[0], "conversation.item.input_audio_transcription.completed")
+        self.assertEqual(types.count("response.audio.delta"), 2)
+        # The first sentence's audio is sent before the reply is complete.
+        self.assertLess(types.index("response.audio.delta"), types.index("response.done"))
+
+        timings = events[-1]["timings"]
+        self.assertEqual(timings["sentences"], 2)
+        self.assertIsNotNone(timings["first_audio_ms"])
+        self.assertGreaterEqual(timings["total_ms"], timings["first_audio_ms"])
+
+    async def test_failed_turn_is_logged_and_ended_for_the_client(self):
+        async def failing_complete(messages):
+            yield "One glazed donut. "
+            raise RuntimeError("completion stream dropped")
+
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            session = PipelineSession(
+                ws,
+                recognizer_factory=lambda rate, on_recognized: _ScriptedRecognizer(on_recognized),
+                complete=failing_complete,
+                synthesize=_synthesize,
+                system_message="You are a barista.",
+            )
+            await session.run()
+            return ws
+
+        app = web.Application()
+        app.router.add_get("/pipeline", handler)
+        with self.assertLogs("speech-pipeline", level="ERROR") as logs:
+            async with TestClient(TestServer(app)) as client:
+                ws = await client.ws_connect("/pipeline")
+                await ws.send_bytes(b"\x00\x00\x00\x00")
+                events = []
+                while not events or events[-1]["type"] != "response.done":
+                    events.append(await asyncio.wait_for(ws.receive_json(), timeout=2))
+                await ws.close()
+
+        error = next(event for event in events if event["type"] == "error")
+        self.assertEqual(error["error"]["turn_id"], "turn_1")
+        # The cause is only logged; clients get a fixed message.
+        self.assertEqual(error["error"]["message"], "The response could not be generated.")
+        self.assertEqual(events[-1]["response"]["status"], "failed")
+        self.assertIn("turn_1", logs.output[0])
+
+    async def test_responder_is_stopped_when_the_recognizer_fails_to_stop(self):
+        class _FailingStop(_ScriptedRecognizer):
+            async def stop(self) -> None:
+                raise RuntimeError("recognizer already closed")
+
+        class _ClosedSocket:
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                raise StopAsyncIteration
+
+        session = PipelineSession(
+            _ClosedSocket(),
+            recognizer_factory=lambda rate, on_recognized: _FailingStop(on_recognized),
+            complete=_complete,
+            synthesize=_synthesize,
+            system_message="You are a barista.",
+        )
+        with self.assertRaises(RuntimeError):
+            await session.run()
+        self.assertEqual(asyncio.all_tasks() - {asyncio.current_task()}, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from structured_logging import (
+    DeferredQueueHandler,
+    JsonFormatter,
+    SessionContextFilter,
+    SessionSampler,
+    bind_session_context,
+    set_round_trip_token,
+)
+
+
+def make_record(message: str, *args, level: int = logging.INFO, session_token=None) -> logging.LogRecord:
+    record = logging.LogRecord("test", level, __file__, 1, message, args, None)
+    record.session_token = session_token
+    return record
+
+
+class DeferredQueueHandlerTests(unittest.TestCase):
+    def test_immutable_arguments_are_formatted_by_the_listener(self):
+        log_queue = queue.Queue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.handle(make_record("Added %s x%d", "Boston Kreme", 2))
+        queued = log_queue.get_nowait()
+        self.assertEqual(queued.args, ("Boston Kreme", 2))
+        self.assertEqual(queued.getMessage(), "Added Boston Kreme x2")
+
+    def test_mutable_arguments_are_rendered_before_queueing(self):
+        log_queue = queue.Queue()
+        handler = DeferredQueueHandler(log_queue)
+        items = ["Latte"]
+        handler.handle(make_record("Order %s", items))
+        items.append("Donut")
+        queued = log_queue.get_nowait()
+        self.assertIsNone(queued.args)
+        self.assertEqual(queued.getMessage(), "Order ['Latte']")
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = DeferredQueueHandler(queue.Queue(maxsize=1))
+        handler.handle(make_record("first"))
+        handler.handle(make_record("second"))
+        self.assertEqual(handler.dropped, 1)
+
+
+class SessionSamplerTests(unittest.TestCase):
+    def test_rate_limit_applies_per_session_but_not_to_warnings(self):
+        sampler = SessionSampler(rate_limit=0.001, burst=2)
+        kept = [sampler.filter(make_record("turn", session_token="a")) for _ in range(5)]
+        self.assertEqual(kept, [True, True, False, False, False])
+        self.assertTrue(sampler.filter(make_record("other session", session_token="b")))
+        self.assertTrue(sampler.filter(make_record("problem", level=logging.WARNING, session_token="a")))
+        self.assertTrue(sampler.filter(make_record("no session")))
+        self.assertEqual(sampler.dropped, 3)
+
+    def test_sampling_keeps_or_drops_whole_sessions(self):
+        sampler = SessionSampler(sample_rate=0.5)
+        tokens = [f"session-{i}" for i in range(200)]
+        first = [sampler.filter(make_record("a", session_token=token)) for token in tokens]
+        second = [sampler.filter(make_record("b", session_token=token)) for token in tokens]
+        self.assertEqual(first, second)
+        self.assertTrue(40 < sum(first) < 160)
+
+
+class SessionContextTests(unittest.IsolatedAsyncioTestCase):
+    async def test_json_records_carry_tokens_shared_with_child_tasks(self):
+        stream = io.StringIO()
+        log_queue = queue.Queue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.addFilter(SessionContextFilter())
+        writer = logging.StreamHandler(stream)
+        writer.setFormatter(JsonFormatter())
+        listener = logging.handlers.QueueListener(log_queue, writer)
+        logger = logging.getLogger("structured-logging-test")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        listener.start()
+        try:
+            async def session():
+                bind_session_context("token-1", "token-1-0000")
+
+                async def relay():
+                    await asyncio.sleep(0)
+                    logger.info("Round trip %d", 1)
+
+                child = asyncio.create_task(relay())
+                set_round_trip_token("token-1-0001")
+                await child
+
+            await asyncio.create_task(session())
+            logger.info("Outside a session")
+        finally:
+            listener.stop()
+            logger.removeHandler(handler)
+
+        inside, outside = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(inside["message"], "Round trip 1")
+        self.assertEqual(inside["session_token"], "token-1")
+        self.assertEqual(inside["round_trip_token"], "token-1-0001")
+        self.assertNotIn("session_token", outside)
+
+
+if __name__ == "__main__":
+    unittest.main()
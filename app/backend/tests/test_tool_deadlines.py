@@ -0,0 +1,80 @@
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from rtmt import TOOL_DEADLINE_TEXT, RTMiddleTier, Tool, ToolResult, ToolResultDirection
+from tools import SearchResultCache, search_fallback
+
+
+class ToolDeadlineTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.rtmt = RTMiddleTier("https://example.openai.azure.com", "deployment", AzureKeyCredential("key"))
+        self.cache = SearchResultCache()
+
+    async def slow_search(self, args) -> ToolResult:
+        await asyncio.sleep(0.2)
+        self.cache.put(args["query"], "Fresh answer")
+        return ToolResult("Fresh answer", ToolResultDirection.TO_SERVER)
+
+    async def test_slow_tool_answers_with_its_fallback_and_finishes_in_background(self):
+        tool = Tool(self.slow_search, {}, deadline=0.02, fallback=lambda args: search_fallback(self.cache, args))
+
+        started = time.perf_counter()
+        result = await self.rtmt._call_tool("search", tool, {"query": "Boston Kreme"}, "session")
+        self.assertLess(time.perf_counter() - started, 0.15)
+        self.assertIn("Boston Kreme Donut", result.to_text())
+        self.assertEqual(self.rtmt.tool_deadline_hits["search"], 1)
+
+        async with asyncio.timeout(2):
+            while self.rtmt._background_tool_calls:
+                await asyncio.sleep(0.01)
+        self.assertEqual(self.cache.get("boston  kreme"), "Fresh answer")
+        stats = self.rtmt.tool_stats()["search"]
+        self.assertEqual((stats["calls"], stats["deadlineHits"]), (1, 1))
+        self.assertLess(stats["p99Ms"], 150)
+
+    async def test_tool_without_fallback_gives_a_holding_answer(self):
+        tool = Tool(self.slow_search, {}, deadline=0.02)
+        result = await self.rtmt._call_tool("search", tool, {"query": "xyzzy"}, "session")
+        self.assertEqual(result.to_text(), TOOL_DEADLINE_TEXT)
+        await asyncio.gather(*self.rtmt._background_tool_calls)
+
+    async def test_fast_tool_result_is_returned_as_is(self):
+        async def get_order(args, session_id) -> ToolResult:
+            return ToolResult(session_id, ToolResultDirection.TO_SERVER)
+
+        result = await self.rtmt._call_tool("get_order", Tool(get_order, {}, deadline=1), {}, "session")
+        self.assertEqual(result.to_text(), "session")
+        self.assertEqual(self.rtmt.tool_deadline_hits["get_order"], 0)
+
+
+class SearchFallbackTests(unittest.TestCase):
+    def test_stale_cache_beats_the_menu_and_the_menu_beats_the_holding_line(self):
+        cache = SearchResultCache(ttl_seconds=0)
+        cache.put("Glazed Donut", "Cached answer")
+        self.assertIsNone(cache.get("glazed donut"))
+        self.assertEqual(search_fallback(cache, {"query": "glazed donut"}).to_text(), "Cached answer")
+
+        menu_answer = search_fallback(cache, {"query": "What cold brew drinks do you have?"}).to_text()
+        self.assertIn("Cold Brew", menu_answer)
+        self.assertIn("Sizes:", menu_answer)
+        self.assertEqual(search_fallback(None, {"query": "xyzzy"}).to_text(), TOOL_DEADLINE_TEXT)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = SearchResultCache(max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), ("1", "3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
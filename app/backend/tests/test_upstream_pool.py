@@ -0,0 +1,161 @@
+import socket
+import sys
+import unittest
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from order_state import order_state_singleton
+from rtmt import RTMiddleTier
+from upstream_pool import UpstreamEndpoint, UpstreamPool, UpstreamUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RoutingTests(unittest.TestCase):
+    def test_prefers_fewest_sessions_per_weight(self):
+        busy = UpstreamEndpoint("wss://a", "rt", weight=1, active_sessions=2)
+        heavy = UpstreamEndpoint("wss://b", "rt", weight=4, active_sessions=4)
+        pool = UpstreamPool([busy, heavy])
+
+        self.assertEqual(pool.candidates()[0], heavy)
+
+    def test_slow_connects_push_an_endpoint_down_the_list(self):
+        slow = UpstreamEndpoint("wss://a", "rt", connect_latency_ms=900)
+        fast = UpstreamEndpoint("wss://b", "rt", connect_latency_ms=20, active_sessions=1)
+        pool = UpstreamPool([slow, fast])
+
+        self.assertEqual(pool.candidates(), [fast, slow])
+
+    def test_circuit_opens_after_threshold_and_half_opens_after_cooldown(self):
+        clock = FakeClock()
+        flaky, steady = UpstreamEndpoint("wss://a", "rt"), UpstreamEndpoint("wss://b", "rt", active_sessions=5)
+        pool = UpstreamPool([flaky, steady], failure_threshold=2, cooldown_seconds=30, clock=clock)
+
+        pool.record_failure(flaky)
+        self.assertIn(flaky, pool.candidates())
+        pool.record_failure(flaky)
+        self.assertEqual(pool.candidates(), [steady])
+
+        clock.now += 31
+        self.assertEqual(pool.candidates(), [steady, flaky])
+        pool.record_success(flaky, latency_ms=10)
+        self.assertEqual(pool.candidates()[0], flaky)
+
+    def test_throttling_opens_the_circuit_for_retry_after(self):
+        clock = FakeClock()
+        endpoint = UpstreamEndpoint("wss://a", "rt")
+        pool = UpstreamPool([endpoint], cooldown_seconds=30, clock=clock)
+
+        pool.record_failure(endpoint, throttled=True, retry_after=5)
+        self.assertEqual(pool.candidates(), [])
+        clock.now += 5
+        self.assertEqual(pool.candidates(), [endpoint])
+
+    def test_from_json_applies_default_key_and_weights(self):
+        pool = UpstreamPool.from_json('[{"endpoint": "wss://a", "deployment": "rt", "weight": 3}, '
+                                      '{"endpoint": "wss://b", "deployment": "rt", "apiKey": "own"}]', default_key="shared")
+
+        self.assertEqual([(e.key, e.weight) for e in pool.endpoints], [("shared", 3.0), ("own", 1.0)])
+
+
+class FakeUpstream:
+    def __init__(self, status: int = 0):
+        self.status = status
+        self.connections = 0
+
+    async def handler(self, request: web.Request):
+        if self.status:
+            return web.Response(status=self.status, headers={"Retry-After": "7"})
+        self.connections += 1
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.json()["type"] == "session.update":
+                await ws.send_json({"type": "session.created", "session": {}})
+        return ws
+
+
+class PoolFailoverTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        order_state_singleton.sessions = {}
+        self.servers = []
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            await server.close()
+
+    async def start(self, upstream: FakeUpstream) -> str:
+        app = web.Application()
+        app.router.add_get("/openai/realtime", upstream.handler)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        self.servers.append(client)
+        return str(client.make_url("")).rstrip("/")
+
+    async def start_middle_tier(self, pool: UpstreamPool) -> TestClient:
+        rtmt = RTMiddleTier(pool.endpoints[0].endpoint, "rt", AzureKeyCredential("key"), upstream_pool=pool)
+        app = web.Application()
+        rtmt.attach_to_app(app, "/realtime")
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        self.servers.append(client)
+        return client
+
+    async def test_session_fails_over_from_throttled_and_dead_endpoints(self):
+        throttled, healthy = FakeUpstream(status=429), FakeUpstream()
+        dead = UpstreamEndpoint(f"http://127.0.0.1:{_unused_port()}", "rt", key="k")
+        throttled_endpoint = UpstreamEndpoint(await self.start(throttled), "rt", key="k")
+        healthy_endpoint = UpstreamEndpoint(await self.start(healthy), "rt", key="k", active_sessions=3)
+        pool = UpstreamPool([dead, throttled_endpoint, healthy_endpoint])
+        client = await self.start_middle_tier(pool)
+
+        ws = await client.ws_connect("/realtime")
+        await ws.send_json({"type": "session.update", "session": {}})
+        async for msg in ws:
+            if msg.json()["type"] == "session.created":
+                break
+        await ws.close()
+
+        self.assertEqual(healthy.connections, 1)
+        self.assertEqual(healthy_endpoint.active_sessions, 4)
+        self.assertGreater(throttled_endpoint.open_until, 0)
+        self.assertEqual(dead.consecutive_failures, 1)
+        self.assertNotIn(throttled_endpoint, pool.candidates())
+
+    async def test_client_is_told_to_retry_when_no_endpoint_accepts(self):
+        pool = UpstreamPool([UpstreamEndpoint(await self.start(FakeUpstream(status=429)), "rt", key="k")])
+        client = await self.start_middle_tier(pool)
+
+        ws = await client.ws_connect("/realtime")
+        message = await ws.receive_json()
+        self.assertEqual(message["error"]["type"], "upstream_unavailable")
+        self.assertEqual((await ws.receive()).type, aiohttp.WSMsgType.CLOSE)
+        self.assertEqual(order_state_singleton.sessions, {})
+
+    async def test_connect_raises_when_pool_is_exhausted(self):
+        pool = UpstreamPool([UpstreamEndpoint(f"http://127.0.0.1:{_unused_port()}", "rt", key="k")])
+        async with aiohttp.ClientSession() as session:
+            with self.assertRaises(UpstreamUnavailable):
+                await pool.connect(session, lambda endpoint: {}, lambda endpoint: {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.vector_index import DEFAULT_QUERIES, BinaryQuantizedIndex, hashed_embedding, run_benchmark
+from setup_intvect import build_vector_compression
+
+MENU = {
+    "menuItems": [
+        {"category": "Donuts", "items": [
+            {"name": "Glazed Donut", "description": "Classic yeast donut coated in vanilla glaze"},
+            {"name": "Boston Kreme Donut", "description": "Custard-filled donut topped with chocolate icing"},
+        ]},
+        {"category": "Cold Beverages", "items": [
+            {"name": "Original Cold Brew", "description": "12-hour steeped cold brew over ice"},
+        ]},
+    ]
+}
+
+
+class HashedEmbeddingTests(unittest.TestCase):
+    def test_is_deterministic_and_normalized(self):
+        first = hashed_embedding("glazed donut", 64)
+
+        self.assertEqual(first, hashed_embedding("glazed donut", 64))
+        self.assertAlmostEqual(sum(value * value for value in first), 1.0)
+
+    def test_binary_codes_pack_sign_bits(self):
+        self.assertEqual(BinaryQuantizedIndex.pack([0.5, -0.1, 0.0, 0.2]), 0b1001)
+
+
+class VectorIndexBenchmarkTests(unittest.TestCase):
+    def test_full_precision_baseline_has_perfect_recall(self):
+        report = run_benchmark(DEFAULT_QUERIES, [256, 64], ["none", "binary"], oversampling=2.0, menu_data=MENU)
+        results = {result["name"]: result for result in report["results"]}
+
+        self.assertEqual(report["documents"], 3)
+        self.assertEqual(results["256d none"]["recall_at_k"], 1.0)
+        self.assertIn("64d binary x2 rescore", results)
+        self.assertEqual(results["64d binary"]["bytes_per_vector"], 8)
+
+
+class VectorCompressionTests(unittest.TestCase):
+    def test_quantization_rescores_with_preserved_originals(self):
+        compression = build_vector_compression("scalar", 4.0).as_dict()
+
+        self.assertEqual(compression["kind"], "scalarQuantization")
+        self.assertEqual(compression["rescoring_options"]["default_oversampling"], 4.0)
+        self.assertEqual(compression["rescoring_options"]["rescore_storage_method"], "preserveOriginals")
+        self.assertIsNone(build_vector_compression("none", 4.0))
+        with self.assertRaises(ValueError):
+            build_vector_compression("pq", 4.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from azure_speech_gpt4o_mini import FALLBACK_REPLY, VoiceLoop
+from conversation_memory import ConversationMemory
+
+
+class _Signal:
+    def __init__(self):
+        self.handlers = []
+
+    def connect(self, handler) -> None:
+        self.handlers.append(handler)
+
+    def fire(self, text: str) -> None:
+        for handler in self.handlers:
+            handler(SimpleNamespace(result=SimpleNamespace(text=text, reason=None)))
+
+
+class FakeRecognizer:
+    """Speech SDK recognizer stand-in; tests fire its events as the SDK threads would."""
+
+    def __init__(self):
+        self.recognizing = _Signal()
+        self.recognized = _Signal()
+        self.canceled = _Signal()
+        self.running = False
+
+    def start_continuous_recognition_async(self):
+        self.running = True
+        return SimpleNamespace(get=lambda: None)
+
+    def stop_continuous_recognition_async(self):
+        self.running = False
+        return SimpleNamespace(get=lambda: None)
+
+
+class VoiceLoopTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.recognizer = FakeRecognizer()
+        self.memory = ConversationMemory([{"role": "system", "content": "You are a barista."}])
+        self.spoken: list[str] = []
+        self.requests: list[list[dict]] = []
+        self.stopped = 0
+        self.speak_delay = 0.0
+        self.replies = iter([])
+
+    async def complete(self, messages):
+        self.requests.append(messages)
+        for delta in next(self.replies):
+            yield delta
+
+    async def speak(self, text: str) -> None:
+        await asyncio.sleep(self.speak_delay)
+        self.spoken.append(text)
+
+    def stop_speaking(self) -> None:
+        self.stopped += 1
+
+    def make_loop(self, **options) -> VoiceLoop:
+        return VoiceLoop(self.recognizer, self.complete, self.speak, self.stop_speaking, self.memory, **options)
+
+    async def start(self, voice_loop: VoiceLoop) -> asyncio.Task:
+        task = asyncio.create_task(voice_loop.run())
+        async with asyncio.timeout(2):
+            while not self.recognizer.running:
+                await asyncio.sleep(0.01)
+        return task
+
+    async def wait_for(self, condition) -> None:
+        async with asyncio.timeout(2):
+            while not condition():
+                await asyncio.sleep(0.01)
+
+    async def test_reply_is_spoken_sentence_by_sentence_and_remembered(self):
+        self.replies = iter([["One glazed donut, coming ", "right up. Anything else today?"]])
+        voice_loop = self.make_loop()
+        task = await self.start(voice_loop)
+
+        self.recognizer.recognized.fire("One glazed donut please.")
+        await self.wait_for(lambda: self.memory.turn_count == 1)
+        self.recognizer.recognized.fire("quit")
+        await task
+
+        self.assertEqual(self.spoken, ["One glazed donut, coming right up.", "Anything else today?"])
+        self.assertEqual(self.requests[0][-1], {"role": "user", "content": "one glazed donut please."})
+        self.assertFalse(self.recognizer.running)
+
+    async def test_completion_failure_speaks_the_fallback(self):
+        async def failing(messages):
+            raise RuntimeError("service unavailable")
+            yield ""
+
+        voice_loop = VoiceLoop(self.recognizer, failing, self.speak, self.stop_speaking, self.memory)
+        task = await self.start(voice_loop)
+        self.recognizer.recognized.fire("A latte please")
+        await self.wait_for(lambda: self.spoken)
+        self.recognizer.recognized.fire("q")
+        await task
+        self.assertEqual(self.spoken, [FALLBACK_REPLY])
+
+    async def test_new_utterance_cancels_the_reply_and_keeps_its_context(self):
+        self.replies = iter([["Sure, one medium latte. ", "Would you like whipped cream on that?"], ["Done, it's iced."]])
+        self.speak_delay = 0.05
+        voice_loop = self.make_loop()
+        task = await self.start(voice_loop)
+
+        self.recognizer.recognized.fire("A medium latte")
+        await self.wait_for(lambda: self.spoken)
+        self.recognizer.recognized.fire("Make it iced")
+        await self.wait_for(lambda: len(self.requests) == 2 and self.memory.turn_count == 2)
+        self.recognizer.recognized.fire("quit")
+        await task
+
+        self.assertEqual(self.stopped, 1)
+        history = [message["content"] for message in self.requests[1][1:-1]]
+        self.assertEqual(history, ["a medium latte", "Sure, one medium latte."])
+        self.assertEqual(self.requests[1][-1]["content"], "make it iced")
+
+    async def test_barge_in_is_off_by_default_and_ignores_short_partials(self):
+        self.replies = iter([["Sure, one medium latte. ", "Would you like whipped cream on that?"]])
+        self.speak_delay = 0.05
+        task = await self.start(self.make_loop())
+        self.recognizer.recognized.fire("A medium latte")
+        await self.wait_for(lambda: self.spoken)
+        self.recognizer.recognizing.fire("would you like whipped cream")
+        await self.wait_for(lambda: self.memory.turn_count == 1)
+        self.recognizer.recognized.fire("quit")
+        await task
+        self.assertEqual((len(self.spoken), self.stopped), (2, 0))
+
+    async def test_barge_in_cancels_on_a_long_enough_partial(self):
+        self.replies = iter([["Sure, one medium latte. ", "Would you like whipped cream on that?"]])
+        self.speak_delay = 0.05
+        task = await self.start(self.make_loop(barge_in=True, barge_in_min_chars=12))
+        self.recognizer.recognized.fire("A medium latte")
+        await self.wait_for(lambda: self.spoken)
+
+        self.recognizer.recognizing.fire("uh")
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.stopped, 0)
+        self.recognizer.recognizing.fire("actually make that")
+        await self.wait_for(lambda: self.stopped == 1)
+        self.assertEqual(self.memory.turn_count, 1)
+        self.recognizer.recognized.fire("quit")
+        await task
+        self.assertEqual(self.spoken, ["Sure, one medium latte."])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from azure.core.credentials import AzureKeyCredential
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from order_state import order_state_singleton
+from rtmt import RTMiddleTier
+from warm_pool import WarmSocketPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class WarmSocketPoolSizingTests(unittest.TestCase):
+    def test_target_size_follows_arrival_rate(self):
+        clock = FakeClock()
+        pool = WarmSocketPool(None, min_size=1, max_size=4, rate_window_seconds=60, clock=clock)
+        self.assertEqual(pool.target_size(), 1)
+        for _ in range(120):
+            pool.record_arrival()
+        pool._prime_seconds = 1.0
+        # About two arrivals a second with a one second priming time.
+        self.assertEqual(pool.target_size(), 4)
+        clock.now = 600
+        self.assertEqual(pool.target_size(), 1)
+
+    def test_max_age_must_leave_session_lifetime(self):
+        with self.assertRaises(ValueError):
+            WarmSocketPool(None, max_age_seconds=1800)
+
+
+class FakeRealtimeUpstream:
+    def __init__(self):
+        self.connections = 0
+        self.session_updates: list[dict] = []
+        self.request_ids: list[str] = []
+        self.sockets: list[web.WebSocketResponse] = []
+
+    async def handler(self, request: web.Request) -> web.WebSocketResponse:
+        self.connections += 1
+        self.request_ids.append(request.headers.get("x-ms-client-request-id"))
+        ws = web.WebSocketResponse()
+        self.sockets.append(ws)
+        await ws.prepare(request)
+        await ws.send_json({"type": "session.created", "session": {"instructions": "secret", "tools": []}})
+        async for msg in ws:
+            message = msg.json()
+            if message["type"] == "session.update":
+                self.session_updates.append(message["session"])
+                await ws.send_json({"type": "session.updated", "session": message["session"]})
+        return ws
+
+
+class RealtimeWarmPoolTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        order_state_singleton.sessions = {}
+        self.upstream = FakeRealtimeUpstream()
+        upstream_app = web.Application()
+        upstream_app.router.add_get("/openai/realtime", self.upstream.handler)
+        self.upstream_client = TestClient(TestServer(upstream_app))
+        await self.upstream_client.start_server()
+
+        self.rtmt = RTMiddleTier(str(self.upstream_client.make_url("/")), "deployment", AzureKeyCredential("key"))
+        self.rtmt.system_message = "You take coffee orders."
+        self.rtmt.warm_pool = WarmSocketPool(self.rtmt.open_warm_socket, min_size=1, max_size=2)
+        app = web.Application()
+        self.rtmt.attach_to_app(app, "/realtime")
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.upstream_client.close()
+
+    async def wait_for_idle(self, count: int) -> None:
+        async with asyncio.timeout(5):
+            while self.rtmt.warm_pool.idle < count:
+                await asyncio.sleep(0.01)
+
+    async def test_client_gets_primed_socket_and_pool_refills(self):
+        await self.wait_for_idle(1)
+        self.assertEqual(self.upstream.connections, 1)
+        self.assertEqual(self.upstream.session_updates[0]["instructions"], "You take coffee orders.")
+
+        ws = await self.client.ws_connect("/realtime")
+        metadata = await ws.receive_json()
+        self.assertEqual(metadata["type"], "extension.session_metadata")
+        created = await ws.receive_json()
+        self.assertEqual(created["type"], "session.created")
+        self.assertEqual(created["session"]["instructions"], "")
+        self.assertEqual(self.rtmt.warm_pool.hits, 1)
+
+        await self.wait_for_idle(1)
+        self.assertEqual(self.upstream.connections, 2)
+        await ws.close()
+
+    async def test_expired_sockets_are_not_handed_out(self):
+        await self.wait_for_idle(1)
+        self.rtmt.warm_pool.max_age_seconds = 0
+        self.assertIsNone(await self.rtmt.warm_pool.take())
+        self.assertEqual(self.rtmt.warm_pool.misses, 1)
+        self.rtmt.warm_pool.max_age_seconds = 300
+        await self.wait_for_idle(1)
+        # The retired socket gives its slot on the endpoint back once it has closed.
+        async with asyncio.timeout(5):
+            while self.rtmt.upstream_pool.endpoints[0].active_sessions != 1:
+                await asyncio.sleep(0.01)
+
+    async def test_sockets_closed_by_the_service_while_idle_are_replaced(self):
+        await self.wait_for_idle(1)
+        first_id = self.upstream.request_ids[0]
+        self.assertIsNotNone(first_id)
+        await self.upstream.sockets[0].close()
+
+        async with asyncio.timeout(5):
+            while self.upstream.connections < 2 or self.rtmt.warm_pool.idle < 1:
+                await asyncio.sleep(0.01)
+        warm = await self.rtmt.warm_pool.take()
+        self.assertFalse(warm.ws.closed)
+        self.assertEqual(warm.client_request_id, self.upstream.request_ids[1])
+        self.assertNotEqual(warm.client_request_id, first_id)
+        await warm.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
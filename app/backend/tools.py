@@ -1,8 +1,7 @@
-import json
 import logging
-import os
-from pathlib import Path
-from typing import Any
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
 
 from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import HttpResponseError
@@ -10,8 +9,10 @@ from azure.identity import DefaultAzureCredential
 from azure.search.documents.aio import SearchClient
 from azure.search.documents.models import VectorizableTextQuery
 
+from menu_catalog import MenuEntry, default_catalog
 from order_state import order_state_singleton
-from rtmt import RTMiddleTier, Tool, ToolResult, ToolResultDirection
+from readiness import StartupWarmup
+from rtmt import TOOL_DEADLINE_TEXT, RTMiddleTier, Tool, ToolResult, ToolResultDirection
 
 
 logger = logging.getLogger(__name__)
@@ -28,53 +29,15 @@ ALLOWED_EXTRA_CATEGORIES = {"signature lattes", "cold beverages"}
 BLOCKED_EXTRA_CATEGORIES = {"donuts & bakery", "breakfast sandwiches"}
 
 
-def _load_menu_category_map() -> dict[str, str]:
-    env_override = (
-        os.environ.get("DUNKIN_MENU_ITEMS_PATH")
-        or os.environ.get("MENU_ITEMS_PATH")
-    )
-
-    candidate_paths = []
-    if env_override:
-        candidate_paths.append(Path(env_override))
-
-    # Preferred: keep backend self-contained (Docker image can copy this in).
-    candidate_paths.append(Path(__file__).resolve().parent / "data" / "menuItems.json")
-
-    # Fallback: repo layout (local dev).
-    candidate_paths.append(Path(__file__).resolve().parent.parent / "frontend" / "src" / "data" / "menuItems.json")
-
-    menu_path = next((path for path in candidate_paths if path.exists()), None)
-    if menu_path is None:
-        return {}
-    try:
-        with menu_path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        mapping = {}
-        for category_entry in data.get("menuItems", []):
-            category = category_entry.get("category", "").strip().lower()
-            for item in category_entry.get("items", []):
-                name = item.get("name")
-                if name:
-                    mapping[name.lower()] = category
-        return mapping
-    except Exception as exc:  # pragma: no cover - defensive fallback
-        logger.warning("Failed to load menu items; falling back to keyword category inference: %s", exc)
-        return {}
-
-
-MENU_CATEGORY_MAP = _load_menu_category_map()
-
-
-def _is_extra_item(item_name: str) -> bool:
+def is_extra_item(item_name: str) -> bool:
     normalized = item_name.lower()
     return any(keyword in normalized for keyword in EXTRAS_KEYWORDS)
 
 
 def _infer_category(item_name: str) -> str:
+    if category := default_catalog().category(item_name):
+        return category
     normalized = item_name.lower()
-    if normalized in MENU_CATEGORY_MAP:
-        return MENU_CATEGORY_MAP[normalized]
     if "latte" in normalized:
         return "signature lattes"
     if "cold brew" in normalized or "refresher" in normalized or "cold" in normalized:
@@ -86,6 +49,31 @@ def _infer_category(item_name: str) -> str:
     return ""
 
 
+def _extras_apology(item_names: Iterable[str]) -> Optional[str]:
+    """Why an extra can't be added to an order holding ``item_names``, or None if it can."""
+    has_allowed_base = False
+    has_blocked_base = False
+
+    for name in item_names:
+        category = _infer_category(name)
+        if category in ALLOWED_EXTRA_CATEGORIES:
+            has_allowed_base = True
+        if category in BLOCKED_EXTRA_CATEGORIES:
+            has_blocked_base = True
+
+    if has_allowed_base:
+        return None
+    if has_blocked_base:
+        return (
+            "I can add extras to signature lattes or cold beverages, "
+            "but I can't add them to donuts or breakfast sandwiches."
+        )
+    return (
+        "I can add extras to signature lattes or cold beverages, "
+        "but not to donuts or breakfast sandwiches."
+    )
+
+
 """"
 Purpose of the Tool:
     Knowledge Base Search:
@@ -114,6 +102,55 @@ search_tool_schema = {
     }
 }
 
+class SearchResultCache:
+    """Recent search answers by normalized query. Entries older than ``ttl_seconds`` are stale: search
+    calls them again, but a deadline fallback will still use them."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def get(self, query: str, allow_stale: bool = False) -> Optional[str]:
+        key = self._key(query)
+        if (entry := self._entries.get(key)) is None:
+            return None
+        stored_at, text = entry
+        if not allow_stale and time.monotonic() - stored_at > self.ttl_seconds:
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, query: str, text: str) -> None:
+        key = self._key(query)
+        self._entries[key] = (time.monotonic(), text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _format_menu_entry(entry: MenuEntry) -> str:
+    sizes = [{"size": size, "price": price} for size, price in entry.prices.items()]
+    return (
+        f"[menu]: Name: {entry.name}, Category: {entry.category}, "
+        f"Description: {entry.description or 'N/A'}, Sizes: {sizes or 'N/A'}"
+    )
+
+
+def search_fallback(cache: Optional[SearchResultCache], args: Any) -> ToolResult:
+    """Answer for a search that ran out of time: a stale cached answer, else the local menu, else a holding line."""
+    query = args.get("query", "")
+    if cache is not None and (cached := cache.get(query, allow_stale=True)) is not None:
+        return ToolResult(cached, ToolResultDirection.TO_SERVER)
+    if entries := default_catalog().lookup(query):
+        return ToolResult("\n-----\n".join(_format_menu_entry(entry) for entry in entries), ToolResultDirection.TO_SERVER)
+    return ToolResult(TOOL_DEADLINE_TEXT, ToolResultDirection.TO_SERVER)
+
+
 async def search(
     search_client: SearchClient,
     semantic_configuration: str,
@@ -122,11 +159,15 @@ async def search(
     embedding_field: str,
     use_vector_query: bool,
     args: Any,
+    cache: Optional[SearchResultCache] = None,
 ) -> ToolResult:
     """Execute a hybrid Azure AI Search query with safe fallbacks."""
 
     query = args["query"]
     logger.info("Knowledge search requested for query '%s'", query)
+    if cache is not None and (cached := cache.get(query)) is not None:
+        logger.debug("Search answered from cache")
+        return ToolResult(cached, ToolResultDirection.TO_SERVER)
 
     vector_queries = []
     if use_vector_query and embedding_field:
@@ -184,6 +225,8 @@ async def search(
 
     joined_results = "\n-----\n".join(results)
     logger.debug("Search results returned %d documents", len(results))
+    if cache is not None and joined_results:
+        cache.put(query, joined_results)
     return ToolResult(joined_results or "No matching menu entries found.", ToolResultDirection.TO_SERVER)
 
 
@@ -223,7 +266,7 @@ update_order_tool_schema = {
             },
             "price": { 
                 "type": "number", 
-                "description": "Price of a single item to add. Required only for 'add' action. Note: This is the price per individual item, not the total price for the quantity."
+                "description": "Optional price of a single item, not the total for the quantity. Menu items are priced from the menu automatically, so only give this for items the menu doesn't list."
             }
         },
         "required": ["action", "item_name", "size", "quantity"],
@@ -231,34 +274,40 @@ update_order_tool_schema = {
     }
 }
 
+def _resolve_from_menu(action: str, item_name: str, size: str, price: Optional[float]) -> tuple[str, str, float]:
+    """Canonical name, size and unit price for an item; the model's values are kept for anything the
+    menu can't answer. Raises ValueError when an item the menu can't price is added without a price."""
+    match = default_catalog().resolve(item_name, size)
+    if match is None or match.price is None:
+        name = item_name if match is None else match.name
+        if price is None and action == "add":
+            if match is None:
+                raise ValueError(
+                    f"'{item_name}' doesn't match a single menu item. Ask the guest which menu item they mean, "
+                    "or give a price if it really is off the menu"
+                )
+            raise ValueError(f"{match.name} doesn't come in size '{size}'. Ask the guest which size they want")
+        logger.info("No menu price for '%s' in size '%s'; using the price given", name, size)
+        return name, size, price if price is not None else 0.0
+    if price is not None and abs(price - match.price) >= 0.005:
+        logger.debug("Replacing price %.2f for %s %s with the menu price %.2f", price, match.size, match.name, match.price)
+    return match.name, match.size, match.price
+
+
 async def update_order(args, session_id: str) -> ToolResult:
     """Update the current order by adding or removing items."""
 
-    logger.info("Updating order for session %s with payload %s", session_id, args)
+    logger.info("Updating order for session %s: %s %s x%s", session_id, args.get("action"), args.get("item_name"), args.get("quantity"))
+    logger.debug("Update payload for session %s: %s", session_id, args)
 
-    item_name = args["item_name"]
-    if args["action"] == "add" and _is_extra_item(item_name):
+    try:
+        item_name, size, price = _resolve_from_menu(args["action"], args["item_name"], args.get("size", ""), args.get("price"))
+    except ValueError as exc:
+        logger.info("Rejected update for session %s: %s", session_id, exc)
+        return ToolResult(f"{exc}. Nothing was changed.", ToolResultDirection.TO_SERVER)
+    if args["action"] == "add" and is_extra_item(item_name):
         current_items = order_state_singleton.get_order_summary(session_id).items
-        has_allowed_base = False
-        has_blocked_base = False
-
-        for order_item in current_items:
-            category = _infer_category(order_item.item)
-            if category in ALLOWED_EXTRA_CATEGORIES:
-                has_allowed_base = True
-            if category in BLOCKED_EXTRA_CATEGORIES:
-                has_blocked_base = True
-
-        if not has_allowed_base:
-            apology = (
-                "I can add extras to signature lattes or cold beverages, "
-                "but not to donuts or breakfast sandwiches."
-            )
-            if has_blocked_base:
-                apology = (
-                    "I can add extras to signature lattes or cold beverages, "
-                    "but I can't add them to donuts or breakfast sandwiches."
-                )
+        if apology := _extras_apology(order_item.item for order_item in current_items):
             logger.info("Blocked extra '%s' for session %s", item_name, session_id)
             return ToolResult(apology, ToolResultDirection.TO_SERVER)
 
@@ -266,9 +315,9 @@ async def update_order(args, session_id: str) -> ToolResult:
         session_id,
         args["action"],
         item_name,
-        args["size"],
+        size,
         args.get("quantity", 0),
-        args.get("price", 0.0),
+        price,
     )
 
     order_summary = order_state_singleton.get_order_summary(session_id)
@@ -278,6 +327,110 @@ async def update_order(args, session_id: str) -> ToolResult:
     return ToolResult(json_order_summary, ToolResultDirection.TO_CLIENT)
 
 
+"""
+Purpose of the Tool:
+    Batched Order Management:
+        Let GPT-4o apply several adds and removes in one call when the guest orders multiple items at once,
+        instead of one 'update_order' round trip per item.
+    State Management:
+        Validate the whole batch up front and apply it atomically, so the order never shows half of a request.
+"""
+update_order_batch_tool_schema = {
+    "type": "function",
+    "name": "update_order_batch",
+    "description": "Add or remove several items in one step. Either every operation is applied or none is.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "operations": {
+                "type": "array",
+                "description": "Operations to apply, in order.",
+                "items": {
+                    "type": "object",
+                    "properties": update_order_tool_schema["parameters"]["properties"],
+                    "required": update_order_tool_schema["parameters"]["required"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["operations"],
+        "additionalProperties": False
+    }
+}
+
+
+def _batch_problem(operations: list) -> Optional[str]:
+    """Describe the first malformed operation in a batch, or None if they are all well formed."""
+    if not operations:
+        return "The batch has no operations."
+    for position, operation in enumerate(operations, start=1):
+        if not isinstance(operation, dict):
+            return f"Operation {position} is not an object."
+        if operation.get("action") not in ("add", "remove"):
+            return f"Operation {position} must use the action 'add' or 'remove'."
+        if not isinstance(operation.get("item_name"), str) or not operation["item_name"].strip():
+            return f"Operation {position} is missing an item name."
+        quantity = operation.get("quantity")
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            return f"Operation {position} needs a quantity of at least 1."
+    return None
+
+
+def _items_after(current_items, operations: list) -> list[str]:
+    """Names of the items an order would hold once ``operations`` are applied."""
+    quantities: dict[tuple[str, str], int] = {}
+    for order_item in current_items:
+        quantities[(order_item.item, order_item.size)] = order_item.quantity
+    for operation in operations:
+        key = (operation["item_name"], operation.get("size", ""))
+        change = operation["quantity"] if operation["action"] == "add" else -operation["quantity"]
+        quantities[key] = max(0, quantities.get(key, 0) + change)
+    return [name for (name, _), quantity in quantities.items() if quantity > 0]
+
+
+async def update_order_batch(args, session_id: str) -> ToolResult:
+    """Apply several order updates at once, all or nothing."""
+
+    operations = args.get("operations") or []
+    logger.info("Updating order for session %s with a batch of %d operations", session_id, len(operations))
+    logger.debug("Batch payload for session %s: %s", session_id, args)
+
+    if problem := _batch_problem(operations):
+        return ToolResult(f"{problem} Nothing was changed.", ToolResultDirection.TO_SERVER)
+
+    resolved = []
+    for position, operation in enumerate(operations, start=1):
+        try:
+            item_name, size, price = _resolve_from_menu(operation["action"], operation["item_name"], operation.get("size", ""), operation.get("price"))
+        except ValueError as exc:
+            logger.info("Rejected order batch for session %s: %s", session_id, exc)
+            return ToolResult(f"Operation {position}: {exc}. Nothing was changed.", ToolResultDirection.TO_SERVER)
+        resolved.append({**operation, "item_name": item_name, "size": size, "price": price})
+    operations = resolved
+
+    # Extras are checked against the order as it will be after the batch, so a latte and its
+    # whipped cream can arrive together.
+    current_items = order_state_singleton.get_order_summary(session_id).items
+    base_items = [name for name in _items_after(current_items, operations) if not is_extra_item(name)]
+    for operation in operations:
+        if operation["action"] == "add" and is_extra_item(operation["item_name"]):
+            if apology := _extras_apology(base_items):
+                logger.info("Blocked batch with extra '%s' for session %s", operation["item_name"], session_id)
+                return ToolResult(f"{apology} Nothing else in that request was changed.", ToolResultDirection.TO_SERVER)
+
+    try:
+        order_state_singleton.handle_order_batch(session_id, operations)
+    except ValueError as exc:
+        logger.warning("Rejected order batch for session %s: %s", session_id, exc)
+        return ToolResult(f"{exc}. Nothing was changed.", ToolResultDirection.TO_SERVER)
+
+    order_summary = order_state_singleton.get_order_summary(session_id)
+    json_order_summary = order_summary.model_dump_json()
+    logger.debug("Session %s order summary after batch: %s", session_id, json_order_summary)
+
+    return ToolResult(json_order_summary, ToolResultDirection.TO_CLIENT)
+
+
 """
 Purpose of the Tool:
     Order Summary Retrieval:
@@ -303,7 +456,7 @@ async def get_order(session_id: str) -> ToolResult:
     """Retrieve the current order summary."""
 
     logger.info("Retrieving order summary for session %s", session_id)
-    order_summary = order_state_singleton.get_order_summary(session_id)
+    order_summary = order_state_singleton.review_order(session_id)
     return ToolResult(order_summary.model_dump_json(), ToolResultDirection.TO_SERVER)
 
 
@@ -316,15 +469,30 @@ def attach_tools_rtmt(rtmt: RTMiddleTier,
     content_field: str,
     embedding_field: str,
     title_field: str,
-    use_vector_query: bool
+    use_vector_query: bool,
+    warmup: Optional[StartupWarmup] = None,
+    search_deadline_ms: Optional[float] = 1500
     ) -> None:
 
-    if not isinstance(credentials, AzureKeyCredential):
-        credentials.get_token("https://search.azure.com/.default")  # warm up prior to first call
     search_client = SearchClient(search_endpoint, search_index, credentials, user_agent="RTMiddleTier")
-
-    rtmt.tools["search"] = Tool(schema=search_tool_schema, target=lambda args: search(search_client, semantic_configuration, identifier_field, content_field, embedding_field, use_vector_query, args))
+    if warmup is not None:
+        if not isinstance(credentials, AzureKeyCredential):
+            warmup.add("search_credentials", lambda: credentials.get_token("https://search.azure.com/.default"))
+        # A cheap round trip opens the client's connection pool and proves the index is reachable.
+        warmup.add("search_client", search_client.get_document_count)
+        warmup.add("menu_catalog", default_catalog)
+
+    # A search that outruns its deadline is answered from the cache or the local menu; the call still
+    # finishes in the background and caches its answer for the next guest who asks.
+    search_cache = SearchResultCache()
+    rtmt.tools["search"] = Tool(
+        schema=search_tool_schema,
+        target=lambda args: search(search_client, semantic_configuration, identifier_field, content_field, embedding_field, use_vector_query, args, search_cache),
+        deadline=search_deadline_ms / 1000 if search_deadline_ms else None,
+        fallback=lambda args: search_fallback(search_cache, args),
+    )
     rtmt.tools["update_order"] = Tool(schema=update_order_tool_schema, target=lambda args, session_id: update_order(args, session_id))
+    rtmt.tools["update_order_batch"] = Tool(schema=update_order_batch_tool_schema, target=lambda args, session_id: update_order_batch(args, session_id))
     rtmt.tools["get_order"] = Tool(schema=get_order_tool_schema, target=lambda _, session_id: get_order(session_id))
 
 
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import aiohttp
+
+logger = logging.getLogger("coffee-chat")
+
+# Connect latency that doubles an endpoint's load score.
+LATENCY_REFERENCE_MS = 100.0
+
+
+class UpstreamUnavailable(Exception):
+    """Every endpoint in the pool failed or is circuit-broken."""
+
+
+@dataclass
+class UpstreamEndpoint:
+    endpoint: str
+    deployment: str
+    # None means the middle tier's Entra ID token is used.
+    key: Optional[str] = None
+    weight: float = 1.0
+
+    active_sessions: int = 0
+    connect_latency_ms: Optional[float] = None
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    trial_in_flight: bool = False
+
+    @property
+    def name(self) -> str:
+        return f"{self.endpoint.rstrip('/')}#{self.deployment}"
+
+    def score(self) -> float:
+        """Lower is better: live sessions per unit of weight, inflated by recent connect latency."""
+        latency = self.connect_latency_ms or 0.0
+        return (self.active_sessions + 1) / self.weight * (1 + latency / LATENCY_REFERENCE_MS)
+
+
+class UpstreamPool:
+    """Weighted realtime endpoints with least-loaded routing, failover and per-endpoint circuit breaking.
+
+    An endpoint opens its circuit after ``failure_threshold`` consecutive connect failures, or at once on a
+    429, and is skipped until the cooldown (or the service's Retry-After) has passed. It then gets a single
+    trial connection; success closes the circuit again.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[UpstreamEndpoint],
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        latency_alpha: float = 0.3,
+        connect_timeout: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not endpoints:
+            raise ValueError("An upstream pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.latency_alpha = latency_alpha
+        self.connect_timeout = connect_timeout
+        self._clock = clock
+
+    @classmethod
+    def from_json(cls, raw: str, default_key: Optional[str] = None, **kwargs: Any) -> "UpstreamPool":
+        """Parse ``[{"endpoint": ..., "deployment": ..., "apiKey": ..., "weight": ...}, ...]``."""
+        entries = json.loads(raw)
+        return cls([
+            UpstreamEndpoint(
+                endpoint=entry["endpoint"],
+                deployment=entry["deployment"],
+                key=entry.get("apiKey") or default_key,
+                weight=float(entry.get("weight", 1.0)),
+            )
+            for entry in entries
+        ], **kwargs)
+
+    def candidates(self) -> list[UpstreamEndpoint]:
+        """Healthy endpoints by score, followed by at most one endpoint whose cooldown has passed."""
+        now = self._clock()
+        closed = [endpoint for endpoint in self.endpoints if endpoint.open_until == 0.0]
+        half_open = [
+            endpoint for endpoint in self.endpoints
+            if endpoint.open_until and endpoint.open_until <= now and not endpoint.trial_in_flight
+        ]
+        ordered = sorted(closed, key=lambda endpoint: endpoint.score())
+        return ordered + sorted(half_open, key=lambda endpoint: endpoint.open_until)[:1]
+
+    def record_success(self, endpoint: UpstreamEndpoint, latency_ms: float) -> None:
+        if endpoint.connect_latency_ms is None:
+            endpoint.connect_latency_ms = latency_ms
+        else:
+            endpoint.connect_latency_ms += self.latency_alpha * (latency_ms - endpoint.connect_latency_ms)
+        if endpoint.open_until:
+            logger.info("Upstream %s recovered; closing its circuit", endpoint.name)
+        endpoint.consecutive_failures = 0
+        endpoint.open_until = 0.0
+
+    def record_failure(self, endpoint: UpstreamEndpoint, throttled: bool = False, retry_after: Optional[float] = None) -> None:
+        endpoint.consecutive_failures += 1
+        if throttled or endpoint.open_until or endpoint.consecutive_failures >= self.failure_threshold:
+            cooldown = retry_after if retry_after is not None else self.cooldown_seconds
+            endpoint.open_until = self._clock() + cooldown
+            logger.warning("Opening circuit for upstream %s for %.0fs", endpoint.name, cooldown)
+
+    @staticmethod
+    def _retry_after(headers: Any) -> Optional[float]:
+        try:
+            return float(headers["Retry-After"]) if headers and "Retry-After" in headers else None
+        except ValueError:
+            return None
+
+    async def connect(
+        self,
+        session: aiohttp.ClientSession,
+        headers_for: Callable[[UpstreamEndpoint], dict[str, str]],
+        params_for: Callable[[UpstreamEndpoint], dict[str, str]],
+    ) -> tuple[UpstreamEndpoint, aiohttp.ClientWebSocketResponse]:
+        """Open a realtime socket on the best endpoint, failing over to the next one on throttling or errors.
+
+        The returned endpoint has its session counted; call ``release`` when the socket closes.
+        """
+        last_error: Optional[BaseException] = None
+        for endpoint in self.candidates():
+            is_trial = endpoint.open_until != 0.0
+            endpoint.trial_in_flight = is_trial
+            started = time.perf_counter()
+            try:
+                ws = await asyncio.wait_for(
+                    session.ws_connect(
+                        f"{endpoint.endpoint.rstrip('/')}/openai/realtime",
+                        headers=headers_for(endpoint),
+                        params=params_for(endpoint),
+                    ),
+                    self.connect_timeout,
+                )
+            except aiohttp.WSServerHandshakeError as exc:
+                throttled = exc.status == 429
+                self.record_failure(endpoint, throttled=throttled, retry_after=self._retry_after(exc.headers) if throttled else None)
+                logger.warning("Upstream %s rejected the connection with %s; trying the next endpoint", endpoint.name, exc.status)
+                last_error = exc
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as exc:
+                self.record_failure(endpoint)
+                logger.warning("Upstream %s unreachable (%s); trying the next endpoint", endpoint.name, type(exc).__name__)
+                last_error = exc
+            else:
+                self.record_success(endpoint, (time.perf_counter() - started) * 1000)
+                endpoint.active_sessions += 1
+                return endpoint, ws
+            finally:
+                endpoint.trial_in_flight = False
+        raise UpstreamUnavailable("No realtime endpoint accepted the connection") from last_error
+
+    def release(self, endpoint: UpstreamEndpoint) -> None:
+        endpoint.active_sessions = max(0, endpoint.active_sessions - 1)
+
+    def stats(self) -> list[dict[str, Any]]:
+        now = self._clock()
+        return [
+            {
+                "endpoint": endpoint.name,
+                "weight": endpoint.weight,
+                "activeSessions": endpoint.active_sessions,
+                "connectLatencyMs": round(endpoint.connect_latency_ms, 1) if endpoint.connect_latency_ms is not None else None,
+                "circuitOpen": endpoint.open_until > now,
+            }
+            for endpoint in self.endpoints
+        ]
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger("coffee-chat")
+
+# Azure OpenAI ends realtime sessions after 30 minutes.
+SESSION_LIFETIME_SECONDS = 1800.0
+# Warm sockets kept for roughly this many priming times' worth of arrivals.
+SIZE_HEADROOM = 2.0
+
+
+@dataclass
+class WarmSocket:
+    ws: aiohttp.ClientWebSocketResponse
+    # Returns the socket's endpoint to the upstream pool once the socket is closed.
+    release: Callable[[], None]
+    # Upstream events received while priming that the client still has to see, e.g. session.created.
+    buffered: list[aiohttp.WSMessage] = field(default_factory=list)
+    created_at: float = 0.0
+    # Sent upstream as x-ms-client-request-id, to correlate the session with service-side logs.
+    client_request_id: Optional[str] = None
+    # Reads the socket while it sits idle in the pool.
+    watcher: Optional[asyncio.Task] = None
+
+    async def stop_watching(self) -> None:
+        if self.watcher is not None:
+            self.watcher.cancel()
+            await asyncio.gather(self.watcher, return_exceptions=True)
+            self.watcher = None
+
+    async def close(self) -> None:
+        try:
+            await self.stop_watching()
+            await self.ws.close()
+        finally:
+            self.release()
+
+
+class WarmSocketPool:
+    """Already-connected upstream realtime sockets, primed with the server-enforced session.update.
+
+    The pool is sized from an exponentially decayed estimate of the session arrival rate times the time it
+    takes to open and prime a socket, clamped to ``[min_size, max_size]``. Idle sockets are retired once they
+    are ``max_age_seconds`` old, so a guest always gets most of the service's session lifetime. Each idle
+    socket is read while it waits, so pings are answered and a socket the service closed is dropped instead
+    of being handed to a guest.
+    """
+
+    def __init__(
+        self,
+        open_socket: Callable[[aiohttp.ClientSession], Awaitable[WarmSocket]],
+        min_size: int = 1,
+        max_size: int = 4,
+        max_age_seconds: float = 300.0,
+        rate_window_seconds: float = 60.0,
+        maintenance_interval: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_age_seconds >= SESSION_LIFETIME_SECONDS:
+            raise ValueError("Warm sockets must be retired well before the realtime session lifetime")
+        self._open_socket = open_socket
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age_seconds = max_age_seconds
+        self.rate_window_seconds = rate_window_seconds
+        self.maintenance_interval = maintenance_interval
+        self._clock = clock
+        self._idle: deque[WarmSocket] = deque()
+        self._opening = 0
+        self._rate = 0.0
+        self._rate_at = clock()
+        self._prime_seconds: Optional[float] = None
+        self._wake = asyncio.Event()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def arrival_rate(self) -> float:
+        """Sessions per second, decayed over ``rate_window_seconds``."""
+        return self._rate * math.exp(-(self._clock() - self._rate_at) / self.rate_window_seconds)
+
+    def record_arrival(self) -> None:
+        self._rate = self.arrival_rate() + 1.0 / self.rate_window_seconds
+        self._rate_at = self._clock()
+
+    def target_size(self) -> int:
+        # Little's law: sockets taken while replacements are still being primed.
+        expected = self.arrival_rate() * (self._prime_seconds or 1.0) * SIZE_HEADROOM
+        return max(self.min_size, min(self.max_size, math.ceil(expected)))
+
+    def _expired(self, warm: WarmSocket) -> bool:
+        return warm.ws.closed or self._clock() - warm.created_at >= self.max_age_seconds
+
+    async def take(self) -> Optional[WarmSocket]:
+        """Hand out the oldest usable warm socket, or None when the pool is empty."""
+        self.record_arrival()
+        self._wake.set()
+        while self._idle:
+            warm = self._idle.popleft()
+            # The guest's connection reads the socket from here on.
+            await warm.stop_watching()
+            if not self._expired(warm) and warm.ws.exception() is None:
+                self.hits += 1
+                return warm
+            self._close_later(warm)
+        self.misses += 1
+        return None
+
+    def _close_later(self, warm: WarmSocket) -> None:
+        task = asyncio.create_task(warm.close())
+        self._closing.add(task)
+        task.add_done_callback(self._finish_close)
+
+    def _finish_close(self, task: asyncio.Task) -> None:
+        self._closing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Could not close a retired warm realtime socket", exc_info=task.exception())
+
+    def _retire_expired(self) -> None:
+        for warm in [warm for warm in self._idle if self._expired(warm)]:
+            self._idle.remove(warm)
+            self._close_later(warm)
+
+    async def _watch(self, warm: WarmSocket) -> None:
+        # Reading lets aiohttp answer pings and see the service's close frame.
+        async for msg in warm.ws:
+            if msg.type == aiohttp.WSMsgType.ERROR:
+                logger.warning("Idle warm realtime socket failed: %s", warm.ws.exception())
+                break
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                warm.buffered.append(msg)
+        if warm in self._idle:
+            self._idle.remove(warm)
+            warm.watcher = None
+            self._close_later(warm)
+            self._wake.set()
+
+    async def _open_one(self) -> None:
+        self._opening += 1
+        started = time.perf_counter()
+        try:
+            warm = await self._open_socket(self._session)
+        finally:
+            self._opening -= 1
+        elapsed = time.perf_counter() - started
+        warm.created_at = self._clock()
+        self._prime_seconds = elapsed if self._prime_seconds is None else self._prime_seconds + 0.3 * (elapsed - self._prime_seconds)
+        if self._task is None:
+            await warm.close()
+        else:
+            warm.watcher = asyncio.create_task(self._watch(warm))
+            self._idle.append(warm)
+
+    async def _maintain(self) -> None:
+        delay = 1.0
+        while True:
+            self._wake.clear()
+            self._retire_expired()
+            missing = self.target_size() - len(self._idle) - self._opening
+            if missing > 0:
+                results = await asyncio.gather(*(self._open_one() for _ in range(missing)), return_exceptions=True)
+                if failures := [result for result in results if isinstance(result, Exception)]:
+                    logger.warning("Could not prime %d warm realtime sockets: %s; retrying in %.0fs", len(failures), failures[0], delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+                    continue
+                delay = 1.0
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.maintenance_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self, app: Optional[web.Application] = None) -> None:
+        self._session = aiohttp.ClientSession()
+        self._task = asyncio.create_task(self._maintain())
+
+    async def shutdown(self) -> None:
+        """Stop refilling and close the idle sockets; sockets already handed out are left alone."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        while self._idle:
+            await self._idle.popleft().close()
+        await asyncio.gather(*self._closing, return_exceptions=True)
+
+    async def close(self, app: Optional[web.Application] = None) -> None:
+        await self.shutdown()
+        if self._session is not None:
+            await self._session.close()
+
+    def stats(self) -> dict:
+        return {
+            "idle": len(self._idle),
+            "opening": self._opening,
+            "target": self.target_size(),
+            "arrivalRatePerMinute": round(self.arrival_rate() * 60, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
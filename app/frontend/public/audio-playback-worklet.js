@@ -7,6 +7,8 @@ class AudioPlaybackWorklet extends AudioWorkletProcessor {
 
     handleMessage(event) {
         if (event.data === null) {
+            // Report what was cut off so the server can truncate the reply to what was heard.
+            this.port.postMessage({ type: "stopped", unplayedSamples: this.buffer.length });
             this.buffer = [];
             return;
         }
@@ -109,6 +109,7 @@ function CoffeeApp() {
     };
 
     const isSessionActiveRef = useRef(false);
+    const sessionResumedRef = useRef(false);
     const awaitingGreetingDoneRef = useRef(false);
     const greetingAudioSeenRef = useRef(false);
     const startMicInFlightRef = useRef<Promise<void> | null>(null);
@@ -122,13 +123,17 @@ function CoffeeApp() {
         onReceivedResponseAudioDelta: message => {
             if (!isSessionActiveRef.current) return;
             greetingAudioSeenRef.current = true;
-            playAudio(message.delta);
+            playAudio(message.delta, message.item_id);
         },
         onReceivedInputAudioBufferSpeechStarted: () => {
-            stopAudioPlayer();
+            stopAudioPlayer().then(position => {
+                if (position) {
+                    realtime.reportAudioPlayed(position.itemId, position.playedMs);
+                }
+            });
         },
         onReceivedExtensionMiddleTierToolResponse: ({ tool_name, tool_result }: ExtensionMiddleTierToolResponse) => {
-            if (tool_name === "update_order") {
+            if (tool_name === "update_order" || tool_name === "update_order_batch") {
                 const orderSummary: OrderSummaryProps = JSON.parse(tool_result);
                 setOrder(orderSummary);
 
@@ -137,7 +142,14 @@ function CoffeeApp() {
                 console.log("Final Total:", orderSummary.finalTotal);
             }
         },
-        onReceivedSessionMetadata: handleSessionIdentifiers,
+        onReceivedSessionMetadata: message => {
+            handleSessionIdentifiers(message);
+            // A resumed session has already been greeted and may hold an order this page hasn't seen.
+            sessionResumedRef.current = !!message.resumed;
+            if (message.resumed && message.order) {
+                setOrder(message.order);
+            }
+        },
         onReceivedRoundTripToken: handleSessionIdentifiers,
         onReceivedInputAudioTranscriptionCompleted: message => {
             const newTranscriptItem = {
@@ -182,7 +194,7 @@ function CoffeeApp() {
 
     const azureSpeech = useAzureSpeech({
         onReceivedToolResponse: ({ tool_name, tool_result }: ExtensionMiddleTierToolResponse) => {
-            if (tool_name === "update_order") {
+            if (tool_name === "update_order" || tool_name === "update_order_batch") {
                 const orderSummary: OrderSummaryProps = JSON.parse(tool_result);
                 setOrder(orderSummary);
 
@@ -212,11 +224,19 @@ function CoffeeApp() {
             };
             setTranscripts(prev => [...prev, newTranscriptItem]);
         },
+        onResponseAudioStream: (stream: ReadableStream<Uint8Array>) => {
+            playAudioStream(stream).catch(error => console.error("Error:", error));
+        },
         onError: (error: any) => console.error("Error:", error)
     });
 
-    const { reset: resetAudioPlayer, play: playAudio, stop: stopAudioPlayer, waitForDrain: waitForAudioDrain } =
-        useAudioPlayer();
+    const {
+        reset: resetAudioPlayer,
+        play: playAudio,
+        playStream: playAudioStream,
+        stop: stopAudioPlayer,
+        waitForDrain: waitForAudioDrain
+    } = useAudioPlayer();
     const { start: startAudioRecording, stop: stopAudioRecording } = useAudioRecorder({
         onAudioRecorded: useAzureSpeechOn ? azureSpeech.addUserAudio : realtime.addUserAudio
     });
@@ -227,7 +247,7 @@ function CoffeeApp() {
 
             // Start session and playback immediately, but delay mic capture until the greeting finishes.
             isSessionActiveRef.current = true;
-            awaitingGreetingDoneRef.current = !useAzureSpeechOn;
+            awaitingGreetingDoneRef.current = !useAzureSpeechOn && !sessionResumedRef.current;
             greetingAudioSeenRef.current = false;
 
             await resetAudioPlayer();
@@ -239,6 +259,12 @@ function CoffeeApp() {
             } else {
                 realtime.startSession();
 
+                if (!awaitingGreetingDoneRef.current) {
+                    await startAudioRecording();
+                    setIsRecording(true);
+                    return;
+                }
+
                 // Safety: if we never receive the greeting completion, start the mic after a short timeout.
                 window.setTimeout(() => {
                     if (!isSessionActiveRef.current) return;
@@ -1,6 +1,7 @@
 export class Player {
     private playbackNode: AudioWorkletNode | null = null;
     private drainWaiters: Array<() => void> = [];
+    private stopWaiters: Array<(unplayedSamples: number) => void> = [];
 
     async init(sampleRate: number) {
         const audioContext = new AudioContext({ sampleRate });
@@ -12,6 +13,10 @@ export class Player {
                 const waiters = this.drainWaiters;
                 this.drainWaiters = [];
                 waiters.forEach(resolve => resolve());
+            } else if (event?.data?.type === "stopped") {
+                const waiters = this.stopWaiters;
+                this.stopWaiters = [];
+                waiters.forEach(resolve => resolve(event.data.unplayedSamples));
             }
         };
         this.playbackNode.connect(audioContext.destination);
@@ -23,6 +28,34 @@ export class Player {
         }
     }
 
+    async playStream(stream: ReadableStream<Uint8Array>) {
+        const reader = stream.getReader();
+        // Network chunks can split a 16-bit sample, so an odd trailing byte is carried into the next chunk.
+        let carry: Uint8Array | null = null;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            if (!value || value.length === 0) continue;
+
+            let bytes = value;
+            if (carry) {
+                bytes = new Uint8Array(carry.length + value.length);
+                bytes.set(carry);
+                bytes.set(value, carry.length);
+                carry = null;
+            }
+
+            const usable = bytes.length - (bytes.length % 2);
+            if (usable < bytes.length) {
+                carry = bytes.slice(usable);
+            }
+            if (usable > 0) {
+                this.play(new Int16Array(bytes.slice(0, usable).buffer));
+            }
+        }
+    }
+
     waitForDrain(timeoutMs = 2000): Promise<boolean> {
         if (!this.playbackNode) {
             return Promise.resolve(false);
@@ -40,9 +73,20 @@ export class Player {
         });
     }
 
-    stop() {
-        if (this.playbackNode) {
-            this.playbackNode.port.postMessage(null);
+    // Resolves with the number of queued samples that were discarded without being played.
+    stop(timeoutMs = 200): Promise<number> {
+        if (!this.playbackNode) {
+            return Promise.resolve(0);
         }
+
+        const stopped = new Promise<number>(resolve => {
+            const timer = window.setTimeout(() => resolve(0), timeoutMs);
+            this.stopWaiters.push(unplayedSamples => {
+                window.clearTimeout(timer);
+                resolve(unplayedSamples);
+            });
+        });
+        this.playbackNode.port.postMessage(null);
+        return stopped;
     }
 }
@@ -4,29 +4,57 @@ import { Player } from "@/components/audio/player";
 
 const SAMPLE_RATE = 24000;
 
+export type PlaybackPosition = {
+    itemId: string;
+    playedMs: number;
+};
+
 export default function useAudioPlayer() {
     const audioPlayer = useRef<Player>();
+    // Samples queued for the reply item being played, and an item that was interrupted and should stay silent
+    const currentItem = useRef<{ itemId: string; samples: number } | null>(null);
+    const interruptedItemId = useRef<string | null>(null);
 
     const reset = async () => {
         audioPlayer.current = new Player();
         await audioPlayer.current.init(SAMPLE_RATE);
     };
 
-    const play = (base64Audio: string) => {
+    const play = (base64Audio: string, itemId?: string) => {
+        if (itemId && itemId === interruptedItemId.current) return;
+
         const binary = atob(base64Audio);
         const bytes = Uint8Array.from(binary, c => c.charCodeAt(0));
         const pcmData = new Int16Array(bytes.buffer);
 
+        if (itemId) {
+            if (currentItem.current?.itemId !== itemId) {
+                currentItem.current = { itemId, samples: 0 };
+            }
+            currentItem.current.samples += pcmData.length;
+        }
         audioPlayer.current?.play(pcmData);
     };
 
-    const stop = () => {
-        audioPlayer.current?.stop();
+    const playStream = async (stream: ReadableStream<Uint8Array>) => {
+        await audioPlayer.current?.playStream(stream);
+    };
+
+    // Resolves with how far into the current reply playback got, or null if none of it was cut off.
+    const stop = async (): Promise<PlaybackPosition | null> => {
+        const unplayedSamples = (await audioPlayer.current?.stop()) ?? 0;
+        const item = currentItem.current;
+        currentItem.current = null;
+        if (!item || unplayedSamples === 0) return null;
+
+        interruptedItemId.current = item.itemId;
+        const playedSamples = Math.max(0, item.samples - unplayedSamples);
+        return { itemId: item.itemId, playedMs: Math.floor((playedSamples * 1000) / SAMPLE_RATE) };
     };
 
     const waitForDrain = async (timeoutMs?: number) => {
         return (await audioPlayer.current?.waitForDrain(timeoutMs)) ?? false;
     };
 
-    return { reset, play, stop, waitForDrain };
+    return { reset, play, playStream, stop, waitForDrain };
 }
@@ -4,10 +4,11 @@ interface Parameters {
     onReceivedToolResponse?: (response: any) => void;
     onSpeechToTextTranscriptionCompleted?: (message: any) => void;
     onModelResponseDone?: (message: any) => void;
+    onResponseAudioStream?: (stream: ReadableStream<Uint8Array>) => void;
     onError?: (error: any) => void;
 }
 
-const useAzureSpeech = ({ onSpeechToTextTranscriptionCompleted, onModelResponseDone, onError }: Parameters) => {
+const useAzureSpeech = ({ onSpeechToTextTranscriptionCompleted, onModelResponseDone, onResponseAudioStream, onError }: Parameters) => {
     const startSession = () => {
         // Implement any session start logic if needed
     };
@@ -30,6 +31,19 @@ const useAzureSpeech = ({ onSpeechToTextTranscriptionCompleted, onModelResponseD
 
             onSpeechToTextTranscriptionCompleted?.({ transcript: recognizedText });
             onModelResponseDone?.({ response: { output: [{ content: [{ transcript: processedText }] }] } });
+
+            if (processedText && onResponseAudioStream) {
+                // fetch exposes the chunked PCM body as a stream so playback starts on the first chunk.
+                const ttsResponse = await fetch("/azurespeech/text-to-speech", {
+                    method: "POST",
+                    headers: { "Content-Type": "application/json" },
+                    body: JSON.stringify({ content: processedText })
+                });
+                if (!ttsResponse.ok || !ttsResponse.body) {
+                    throw new Error(`Text-to-speech failed with status ${ttsResponse.status}`);
+                }
+                onResponseAudioStream(ttsResponse.body);
+            }
         } catch (error) {
             onError?.(error);
         }
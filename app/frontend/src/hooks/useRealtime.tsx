@@ -1,3 +1,4 @@
+import { useCallback, useRef } from "react";
 import useWebSocket from "react-use-websocket";
 
 import {
@@ -11,9 +12,15 @@ import {
     ExtensionMiddleTierToolResponse,
     ResponseInputAudioTranscriptionCompleted,
     ExtensionSessionMetadata,
-    ExtensionRoundTripToken
+    ExtensionRoundTripToken,
+    ExtensionDrain,
+    ExtensionBusy,
+    ExtensionAudioPlayedCommand
 } from "@/types";
 
+// Kept for the tab's lifetime so a reload can pick the order back up within the server's grace window
+const SESSION_TOKEN_STORAGE_KEY = "realtimeSessionToken";
+
 type Parameters = {
     useDirectAoaiApi?: boolean; // If true, the middle tier will be skipped and the AOAI ws API will be called directly
     aoaiEndpointOverride?: string;
@@ -57,19 +64,37 @@ export default function useRealTime({
     onReceivedRoundTripToken,
     onReceivedError
 }: Parameters) {
-    const wsEndpoint = useDirectAoaiApi
-        ? `${aoaiEndpointOverride}/openai/realtime?api-key=${aoaiApiKeyOverride}&deployment=${aoaiModelOverride}&api-version=2024-10-01-preview`
-        : `/realtime`;
-
-    const { sendJsonMessage } = useWebSocket(wsEndpoint, {
-        onOpen: () => onWebSocketOpen?.(),
+    // A draining or busy server tells us when to come back; a draining one also hands the order off
+    // under the session token. Any other drop is resumed with the same token straight away.
+    const sessionTokenRef = useRef<string | null>(sessionStorage.getItem(SESSION_TOKEN_STORAGE_KEY));
+    const serverReconnectDelayRef = useRef<number | null>(null);
+    const sessionStartedRef = useRef(false);
+
+    const getSocketUrl = useCallback(() => {
+        if (useDirectAoaiApi) {
+            return `${aoaiEndpointOverride}/openai/realtime?api-key=${aoaiApiKeyOverride}&deployment=${aoaiModelOverride}&api-version=2024-10-01-preview`;
+        }
+        return sessionTokenRef.current ? `/realtime?sessionToken=${encodeURIComponent(sessionTokenRef.current)}` : `/realtime`;
+    }, [useDirectAoaiApi, aoaiEndpointOverride, aoaiApiKeyOverride, aoaiModelOverride]);
+
+    const { sendJsonMessage } = useWebSocket(getSocketUrl, {
+        onOpen: () => {
+            // A new upstream conversation starts unconfigured, so a reconnect repeats the session setup.
+            if (sessionStartedRef.current) sendSessionUpdate();
+            onWebSocketOpen?.();
+        },
         onClose: () => onWebSocketClose?.(),
         onError: event => onWebSocketError?.(event),
         onMessage: event => onMessageReceived(event),
-        shouldReconnect: () => true
+        shouldReconnect: () => true,
+        reconnectInterval: attempt => {
+            const delay = serverReconnectDelayRef.current;
+            serverReconnectDelayRef.current = null;
+            return delay ?? (attempt === 0 ? 250 : 1000 + Math.random() * 2000);
+        }
     });
 
-    const startSession = () => {
+    const sendSessionUpdate = () => {
         const command: SessionUpdateCommand = {
             type: "session.update",
             session: {
@@ -91,6 +116,11 @@ export default function useRealTime({
         sendJsonMessage(command);
     };
 
+    const startSession = () => {
+        sessionStartedRef.current = true;
+        sendSessionUpdate();
+    };
+
     const addUserAudio = (base64Audio: string) => {
         const command: InputAudioBufferAppendCommand = {
             type: "input_audio_buffer.append",
@@ -100,6 +130,16 @@ export default function useRealTime({
         sendJsonMessage(command);
     };
 
+    const reportAudioPlayed = (itemId: string, playedMs: number) => {
+        const command: ExtensionAudioPlayedCommand = {
+            type: "extension.audio_played",
+            itemId,
+            playedMs
+        };
+
+        sendJsonMessage(command);
+    };
+
     const inputAudioBufferClear = () => {
         const command: InputAudioBufferClearCommand = {
             type: "input_audio_buffer.clear"
@@ -139,16 +179,31 @@ export default function useRealTime({
                 onReceivedExtensionMiddleTierToolResponse?.(message as ExtensionMiddleTierToolResponse);
                 break;
             case "extension.session_metadata":
+                sessionTokenRef.current = (message as ExtensionSessionMetadata).sessionToken;
+                sessionStorage.setItem(SESSION_TOKEN_STORAGE_KEY, sessionTokenRef.current);
                 onReceivedSessionMetadata?.(message as ExtensionSessionMetadata);
                 break;
             case "extension.round_trip_token":
                 onReceivedRoundTripToken?.(message as ExtensionRoundTripToken);
                 break;
+            case "extension.drain": {
+                const drain = message as ExtensionDrain;
+                // No token means the order cannot move to another worker; start afresh there.
+                sessionTokenRef.current = drain.sessionToken;
+                if (drain.sessionToken === null) {
+                    sessionStorage.removeItem(SESSION_TOKEN_STORAGE_KEY);
+                }
+                serverReconnectDelayRef.current = drain.reconnectAfterMs;
+                break;
+            }
+            case "extension.busy":
+                serverReconnectDelayRef.current = (message as ExtensionBusy).retryAfterMs;
+                break;
             case "error":
                 onReceivedError?.(message);
                 break;
         }
     };
 
-    return { startSession, addUserAudio, inputAudioBufferClear };
+    return { startSession, addUserAudio, inputAudioBufferClear, reportAudioPlayed };
 }
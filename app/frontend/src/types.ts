@@ -1,3 +1,5 @@
+import type { OrderSummaryProps } from "@/components/ui/order-summary";
+
 // Represents a grounding file
 export type GroundingFile = {
     id: string;
@@ -49,6 +51,7 @@ export type Message = {
 // Represents a response containing an audio delta
 export type ResponseAudioDelta = {
     type: "response.audio.delta";
+    item_id: string;
     delta: string; // Ensure this is a valid base64-encoded string
 };
 
@@ -90,6 +93,9 @@ export type ExtensionSessionMetadata = {
     sessionToken: string;
     roundTripIndex: number;
     roundTripToken: string;
+    // Set when the connection picked up an earlier order; the order is included so a reloaded page can show it
+    resumed?: boolean;
+    order?: OrderSummaryProps;
 };
 
 export type ExtensionRoundTripToken = {
@@ -98,3 +104,25 @@ export type ExtensionRoundTripToken = {
     roundTripIndex: number;
     roundTripToken: string;
 };
+
+// Sent after a barge-in: how much of the interrupted reply was played, so the server can truncate it
+export type ExtensionAudioPlayedCommand = {
+    type: "extension.audio_played";
+    itemId: string;
+    playedMs: number;
+};
+
+// Sent by a worker that is shutting down; reconnect after the delay and resume with the session token,
+// which is null when the worker has no shared session store to hand the order off through
+export type ExtensionDrain = {
+    type: "extension.drain";
+    reconnectAfterMs: number;
+    sessionToken: string | null;
+};
+
+// Sent when the worker is at its session limit; the socket closes and should be retried after the delay
+export type ExtensionBusy = {
+    type: "extension.busy";
+    reason: string;
+    retryAfterMs: number;
+};